@@ -0,0 +1,108 @@
+"""Бенчмарк пакетной оценки позиций (bughouse.batch_eval).
+
+Запуск:
+    python -m benchmarks.batch_eval
+    python -m benchmarks.batch_eval --sizes 1,100,100000 --playouts 50
+
+Набор позиций: корпус benchmarks.positions и позиции из случайных
+партий (--playouts партий по --plies полуходов с фиксированным --seed),
+каждая с точки зрения обоих игроков доски A. Сначала пакетная оценка
+сверяется с эталонной engine.evaluate (mismatches должно быть 0), затем
+для каждого размера пакета набор повторяется до нужного числа позиций и
+меряется только evaluate_batch. Отдельно выводятся скорость кодирования
+(encode_batch) и скалярной оценки — для сравнения.
+"""
+import argparse
+import json
+import random
+import time
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+from bughouse.batch_eval import PositionBatch, check_against_scalar, encode_batch, evaluate_batch, evaluate_scalar
+from bughouse.game import Game, PromotionRequired
+from benchmarks.positions import CORPUS, PROMOTION
+
+
+def random_playout(rng: random.Random, plies: int) -> List[Game]:
+    """Позиции случайной партии на доске A: ход или дроп из Game.legal_moves"""
+    game = Game()
+    positions = []
+    player_id = 1
+    for _ in range(plies):
+        hints = game.legal_moves(player_id)
+        actions = [("move", src, dst) for src, targets in hints["moves"].items() for dst in targets]
+        actions += [("drop", piece, square) for piece, squares in hints["drops"].items() for square in squares]
+        if not actions:
+            break
+        kind, a, b = rng.choice(actions)
+        try:
+            if kind == "move":
+                game.make_move(player_id, a, b)
+            else:
+                game.make_drop(player_id, a, b)
+        except PromotionRequired as pr:
+            if not pr.options:
+                break
+            game.make_move(player_id, a, b, victim_player_id=pr.victim_player_id,
+                           victim_square=rng.choice(pr.options)["square"])
+        positions.append(game.copy())
+        player_id = 4 if player_id == 1 else 1
+    return positions
+
+
+def position_set(playouts: int, plies: int, seed: int) -> List[Tuple[Game, int]]:
+    games = []
+    for position in [p for category in CORPUS.values() for p in category] + PROMOTION:
+        game = Game()
+        game.from_fen_dict(position)
+        games.append(game)
+    rng = random.Random(seed)
+    for _ in range(playouts):
+        games.extend(random_playout(rng, plies))
+    return [(game, player_id) for game in games for player_id in (1, 4)]
+
+
+def rate(function, count: int, min_seconds: float = 0.2) -> float:
+    """Позиций в секунду: function обрабатывает count позиций за вызов"""
+    calls, started = 0, time.perf_counter()
+    while True:
+        function()
+        calls += 1
+        elapsed = time.perf_counter() - started
+        if elapsed >= min_seconds:
+            return calls * count / elapsed
+
+
+def run(sizes: List[int], playouts: int, plies: int, seed: int) -> Dict:
+    positions = position_set(playouts, plies, seed)
+    mismatches = check_against_scalar(positions)
+    encoded = encode_batch(positions)
+    results = []
+    for size in sizes:
+        rows = np.arange(size) % len(encoded)
+        batch = PositionBatch(encoded.planes[rows], encoded.reserves[rows])
+        results.append({"batchSize": size, "positionsPerSecond": round(rate(lambda: evaluate_batch(batch), size), 1)})
+    return {
+        "positions": len(positions),
+        "mismatches": len(mismatches),
+        "scalarPositionsPerSecond": round(rate(lambda: evaluate_scalar(positions), len(positions)), 1),
+        "encodePositionsPerSecond": round(rate(lambda: encode_batch(positions), len(positions)), 1),
+        "batch": results,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="1,10,100,1000,10000,100000")
+    parser.add_argument("--playouts", type=int, default=20)
+    parser.add_argument("--plies", type=int, default=30)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    sizes = [int(size) for size in args.sizes.split(",")]
+    print(json.dumps(run(sizes, args.playouts, args.plies, args.seed), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+"""Бенчмарк импорта BPGN: потоковое чтение и проигрывание партий через Game.
+
+Запуск:
+    python -m benchmarks.bpgn_import --games 50 --plies 40
+    python -m benchmarks.bpgn_import --file archive.bpgn.gz
+
+Без --file сначала генерируются --games случайных партий (--plies
+полуходов на двух досках, фиксированный --seed) и пишутся во временный
+файл через bughouse.bpgn.write_bpgn. Затем файл читается дважды:
+только разбор (read_games) и разбор с проигрыванием (replay). Для
+сгенерированных партий итоговая позиция сверяется с исходной
+(mismatches должно быть 0). Скорость — партий и ходов в секунду.
+"""
+import argparse
+import json
+import os
+import random
+import tempfile
+import time
+from typing import Dict, List
+
+from bughouse.bpgn import iter_file, replay, write_bpgn
+from bughouse.color import Color
+from bughouse.coordinate import Coordinate
+from bughouse.figures import Pawn, Knight, Bishop, Rook, Queen
+from bughouse.game import Game, PromotionRequired
+
+SEATS = {"A": (1, 4), "B": (2, 3)}
+RESERVE = {"P": Pawn, "N": Knight, "B": Bishop, "R": Rook, "Q": Queen}
+# Доля ходов, где сначала пробуются дропы
+DROP_SHARE = 0.2
+
+
+def _try_random_action(rng: random.Random, game: Game, player_id: int) -> bool:
+    """Случайный ход или дроп: кандидаты перебираются в случайном порядке, пока Game не примет один"""
+    player = game.get_player(player_id)
+    board = player.board
+    moves = [(str(piece.coordinate), str(target))
+             for column in board.squares for piece in column
+             if piece is not None and piece.color == player.color
+             for target in piece.get_possible_moves(board)]
+    rng.shuffle(moves)
+    drops = [(symbol, file + rank) for symbol, cls in RESERVE.items() if player.pieces_reserve.get_count(cls) > 0
+             for file in "abcdefgh" for rank in "234567"]
+    rng.shuffle(drops)
+    candidates = [("drop", d) for d in drops[:8]] if rng.random() < DROP_SHARE else []
+    candidates += [("move", m) for m in moves] + [("drop", d) for d in drops[8:40]]
+    for kind, (a, b) in candidates:
+        try:
+            if kind == "drop":
+                if not board.is_empty(Coordinate.from_notation(b)):
+                    continue
+                game.make_drop(player_id, a, b)
+            else:
+                try:
+                    game.make_move(player_id, a, b)
+                except PromotionRequired as pr:
+                    game.make_move(player_id, a, b, victim_player_id=pr.victim_player_id,
+                                   victim_square=rng.choice(pr.options)["square"])
+            return True
+        except ValueError:
+            continue
+    return False
+
+
+def random_game(rng: random.Random, plies: int) -> Game:
+    game = Game()
+    for _ in range(plies):
+        if game.check_game_over():
+            break
+        name = rng.choice("AB")
+        board = game.board_a if name == "A" else game.board_b
+        white, black = SEATS[name]
+        player_id = white if board.get_current_player() == Color.WHITE else black
+        if not _try_random_action(rng, game, player_id):
+            break
+    return game
+
+
+def generate(path: str, games: int, plies: int, seed: int) -> List[Dict]:
+    """Пишет партии в path, возвращает их итоговые позиции"""
+    rng = random.Random(seed)
+    finals = []
+    with open(path, "w", encoding="utf-8") as f:
+        for _ in range(games):
+            game = random_game(rng, plies)
+            f.write(write_bpgn(game))
+            finals.append(game.to_fen_dict())
+    return finals
+
+
+def run(path: str, finals: List[Dict]) -> Dict:
+    started = time.perf_counter()
+    games = moves = 0
+    for record in iter_file(path):
+        games += 1
+        moves += len(record.moves)
+    parse_seconds = time.perf_counter() - started
+
+    started = time.perf_counter()
+    mismatches = replayed = 0
+    for index, record in enumerate(iter_file(path)):
+        game = replay(record)
+        replayed += 1
+        if finals and game.to_fen_dict() != finals[index]:
+            mismatches += 1
+    replay_seconds = time.perf_counter() - started
+    return {
+        "games": games,
+        "moves": moves,
+        "fileBytes": os.path.getsize(path),
+        "parseGamesPerSecond": round(games / parse_seconds, 1),
+        "parseMovesPerSecond": round(moves / parse_seconds, 1),
+        "replayGamesPerSecond": round(replayed / replay_seconds, 2),
+        "replayMovesPerSecond": round(moves / replay_seconds, 1),
+        "mismatches": mismatches if finals else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--file", help="готовый файл BPGN (.bpgn или .bpgn.gz)")
+    parser.add_argument("--games", type=int, default=20)
+    parser.add_argument("--plies", type=int, default=40)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    if args.file:
+        print(json.dumps(run(args.file, []), indent=2))
+        return
+    with tempfile.TemporaryDirectory(prefix="bpgn-bench-") as directory:
+        path = os.path.join(directory, "games.bpgn")
+        finals = generate(path, args.games, args.plies, args.seed)
+        print(json.dumps(run(path, finals), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,343 @@
+"""Микробенчмарки горячих путей движка и построения состояния.
+
+Каждый случай прогоняется по корпусу позиций (benchmarks.positions):
+после --warmup разогревающих повторов идут --repetitions измеряемых, в
+каждом --iterations проходов по всем позициям категории. Время меряется
+только у самой операции; подготовка (свежая доска/партия для мутирующих
+операций) в замер не входит. По повторам считаются min/median/mean/stdev.
+
+Запуск:
+    python -m benchmarks.engine --save benchmarks/baselines/engine.json
+    python -m benchmarks.engine --compare benchmarks/baselines/engine.json --threshold 0.10
+    python -m benchmarks.engine --cases game.make_move --categories drops
+
+В режиме --compare медиана каждого случая сравнивается с базовой;
+замедление больше порога — регрессия и код выхода 1. Базовый прогон
+зависит от машины: перед сравнением его стоит пересохранить на той же.
+"""
+import argparse
+import fnmatch
+import json
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from bughouse.chess_board import ChessBoard
+from bughouse.color import Color
+from bughouse.coordinate import Coordinate
+from bughouse.game import Game, PromotionRequired
+from bughouse.web_server import Session, board_to_grid, build_state
+from benchmarks.positions import CORPUS, PROMOTION
+
+BOARD_PLAYERS = {"A": {Color.WHITE: 1, Color.BLACK: 4}, "B": {Color.WHITE: 2, Color.BLACK: 3}}
+RESERVE_SYMBOLS = ["Q", "R", "B", "N", "P"]
+
+
+def load_game(position: Dict) -> Game:
+    game = Game()
+    game.from_fen_dict(position)
+    return game
+
+
+def board_of(game: Game, name: str) -> ChessBoard:
+    return game.board_a if name == "A" else game.board_b
+
+
+def mover(game: Game, name: str) -> int:
+    return BOARD_PLAYERS[name][board_of(game, name).get_current_player()]
+
+
+def find_move(position: Dict, name: str, promotion: bool = False) -> Optional[Dict[str, Any]]:
+    """Первый (в детерминированном порядке) легальный ход на доске name.
+
+    promotion=True ищет превращение и возвращает его вместе с выбранной жертвой.
+    """
+    game = load_game(position)
+    board = board_of(game, name)
+    player_id = mover(game, name)
+    color = board.get_current_player()
+    candidates = []
+    for file in range(8):
+        for rank in range(8):
+            piece = board.squares[file][rank]
+            if piece is not None and piece.color == color:
+                for to in sorted(piece.get_possible_moves(board), key=str):
+                    candidates.append((str(piece.coordinate), str(to)))
+    for src, dst in candidates:
+        trial = load_game(position)
+        try:
+            trial.make_move(player_id, src, dst)
+        except PromotionRequired as pr:
+            if promotion:
+                return {"playerId": player_id, "from": src, "to": dst,
+                        "victimPlayerId": pr.victim_player_id, "victimSquare": pr.options[0]["square"]}
+            continue
+        except ValueError:
+            continue
+        if not promotion:
+            return {"playerId": player_id, "from": src, "to": dst}
+    return None
+
+
+def find_drop(position: Dict, name: str) -> Optional[Dict[str, Any]]:
+    game = load_game(position)
+    board = board_of(game, name)
+    player_id = mover(game, name)
+    for symbol in RESERVE_SYMBOLS:
+        for rank in range(2, 8):
+            for file in "abcdefgh":
+                square = f"{file}{rank}"
+                if board.get_piece(Coordinate.from_notation(square)) is not None:
+                    continue
+                trial = load_game(position)
+                try:
+                    trial.make_drop(player_id, symbol, square)
+                except ValueError:
+                    continue
+                return {"playerId": player_id, "piece": symbol, "square": square}
+    return None
+
+
+# Случай бенчмарка: по позиции строит список (подготовка, операция)
+Case = Callable[[Dict], List[Tuple[Callable[[], Any], Callable[[Any], Any]]]]
+
+
+def _per_board(make: Callable[[Dict, str], Optional[Tuple[Callable, Callable]]]) -> Case:
+    def case(position: Dict):
+        pairs = [make(position, name) for name in ("A", "B")]
+        return [p for p in pairs if p is not None]
+    return case
+
+
+def _board_move(position: Dict, name: str):
+    action = find_move(position, name)
+    if action is None:
+        return None
+    fen = position["boardA" if name == "A" else "boardB"]
+    src, dst = Coordinate.from_notation(action["from"]), Coordinate.from_notation(action["to"])
+    return (lambda: ChessBoard.from_fen(fen)), (lambda board: board.move(src, dst))
+
+
+def _board_query(query: Callable[[Game, ChessBoard, Color, int], Any]):
+    def make(position: Dict, name: str):
+        game = load_game(position)
+        board = board_of(game, name)
+        color = board.get_current_player()
+        player_id = mover(game, name)
+        return (lambda: None), (lambda _: query(game, board, color, player_id))
+    return make
+
+
+def _from_fen(position: Dict, name: str):
+    fen = position["boardA" if name == "A" else "boardB"]
+    return (lambda: None), (lambda _: ChessBoard.from_fen(fen))
+
+
+def _game_move(position: Dict, name: str):
+    action = find_move(position, name)
+    if action is None:
+        return None
+    return (lambda: load_game(position)), \
+        (lambda game: game.make_move(action["playerId"], action["from"], action["to"]))
+
+
+def _game_promotion(position: Dict, name: str):
+    action = find_move(position, name, promotion=True)
+    if action is None:
+        return None
+    return (lambda: load_game(position)), (lambda game: game.make_move(
+        action["playerId"], action["from"], action["to"],
+        victim_player_id=action["victimPlayerId"], victim_square=action["victimSquare"]))
+
+
+def _game_promotion_required(position: Dict, name: str):
+    action = find_move(position, name, promotion=True)
+    if action is None:
+        return None
+
+    def op(game: Game):
+        try:
+            game.make_move(action["playerId"], action["from"], action["to"])
+        except PromotionRequired:
+            pass
+    return (lambda: load_game(position)), op
+
+
+def _game_drop(position: Dict, name: str):
+    action = find_drop(position, name)
+    if action is None:
+        return None
+    return (lambda: load_game(position)), \
+        (lambda game: game.make_drop(action["playerId"], action["piece"], action["square"]))
+
+
+def _check_game_over(position: Dict):
+    game = load_game(position)
+
+    def invalidate():
+        # Новая ревизия — полная проверка матов, как после хода
+        game.revision += 1
+    return [(invalidate, (lambda _: game.check_game_over()))]
+
+
+def _check_game_over_cached(position: Dict):
+    game = load_game(position)
+    game.check_game_over()
+    return [((lambda: None), (lambda _: game.check_game_over()))]
+
+
+def _legal_moves(position: Dict, name: str):
+    game = load_game(position)
+    player_id = mover(game, name)
+
+    def invalidate():
+        game.revision += 1
+    return invalidate, (lambda _: game.legal_moves(player_id))
+
+
+def _build_state(position: Dict):
+    session = Session("bench", load_game(position), {pid: f"t{pid}" for pid in range(1, 5)})
+    return [((lambda: None), (lambda _, pid=pid: build_state(session, pid))) for pid in range(1, 5)]
+
+
+# Имя случая -> (функция, категории корпуса, на которых он гоняется)
+ALL_CATEGORIES = list(CORPUS)
+CASES: Dict[str, Tuple[Case, List[str]]] = {
+    "board.move": (_per_board(_board_move), ALL_CATEGORIES),
+    "board.is_king_in_check": (_per_board(_board_query(
+        lambda game, board, color, pid: board.is_king_in_check(color))), ALL_CATEGORIES),
+    "board.is_checkmate": (_per_board(_board_query(
+        lambda game, board, color, pid: board.is_checkmate(color, game.get_player(pid).pieces_reserve))),
+        ALL_CATEGORIES),
+    "board.to_fen": (_per_board(_board_query(lambda game, board, color, pid: board.to_fen())), ALL_CATEGORIES),
+    "board.from_fen": (_per_board(_from_fen), ALL_CATEGORIES),
+    "board_to_grid": (_per_board(_board_query(lambda game, board, color, pid: board_to_grid(board))),
+                      ALL_CATEGORIES),
+    "game.make_move": (_per_board(_game_move), ALL_CATEGORIES),
+    "game.make_move.promotion": (_per_board(_game_promotion), ["promotion"]),
+    "game.make_move.promotion_required": (_per_board(_game_promotion_required), ["promotion"]),
+    "game.make_drop": (_per_board(_game_drop), ALL_CATEGORIES),
+    "game.check_game_over": (_check_game_over, ALL_CATEGORIES),
+    "game.check_game_over.cached": (_check_game_over_cached, ALL_CATEGORIES),
+    "game.legal_moves": (_per_board(_legal_moves), ALL_CATEGORIES),
+    "build_state": (_build_state, ALL_CATEGORIES),
+}
+
+
+def positions_for(category: str) -> List[Dict]:
+    return PROMOTION if category == "promotion" else CORPUS[category]
+
+
+def measure(pairs: List[Tuple[Callable, Callable]], iterations: int, repetitions: int, warmup: int) -> Dict[str, Any]:
+    """Среднее время операции (мкс) в каждом повторе и сводка по повторам"""
+    per_rep: List[float] = []
+    clock = time.perf_counter
+    for rep in range(warmup + repetitions):
+        total = 0.0
+        for _ in range(iterations):
+            for setup, op in pairs:
+                arg = setup()
+                started = clock()
+                op(arg)
+                total += clock() - started
+        if rep >= warmup:
+            per_rep.append(total / (iterations * len(pairs)) * 1e6)
+    return {
+        "ops": iterations * len(pairs) * repetitions,
+        "minUs": min(per_rep),
+        "medianUs": statistics.median(per_rep),
+        "meanUs": statistics.fmean(per_rep),
+        "stdevUs": statistics.stdev(per_rep) if len(per_rep) > 1 else 0.0,
+        "maxUs": max(per_rep),
+    }
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(case_patterns: List[str], categories: Optional[List[str]], iterations: int, repetitions: int,
+        warmup: int) -> Dict[str, Any]:
+    results: Dict[str, Any] = {}
+    for name, (case, case_categories) in CASES.items():
+        if not any(fnmatch.fnmatch(name, p) for p in case_patterns):
+            continue
+        for category in case_categories:
+            if categories and category not in categories:
+                continue
+            pairs = [pair for position in positions_for(category) for pair in case(position)]
+            if pairs:
+                results[f"{name}/{category}"] = measure(pairs, iterations, repetitions, warmup)
+    return {
+        "meta": {
+            "python": platform.python_version(),
+            "implementation": platform.python_implementation(),
+            "machine": platform.machine(),
+            "commit": _git_commit(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "iterations": iterations,
+            "repetitions": repetitions,
+            "warmup": warmup,
+        },
+        "results": results,
+    }
+
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any], threshold: float) -> Dict[str, Any]:
+    """Сравнение медиан с базовым прогоном; ratio > 1 + threshold — регрессия"""
+    rows = {}
+    regressions = []
+    for key, result in current["results"].items():
+        base = baseline["results"].get(key)
+        if base is None:
+            continue
+        ratio = result["medianUs"] / base["medianUs"] if base["medianUs"] else 1.0
+        status = "regression" if ratio > 1 + threshold else "improvement" if ratio < 1 - threshold else "ok"
+        rows[key] = {"baselineUs": base["medianUs"], "currentUs": result["medianUs"],
+                     "ratio": ratio, "status": status}
+        if status == "regression":
+            regressions.append(key)
+    return {"threshold": threshold, "baselineCommit": baseline["meta"].get("commit"),
+            "cases": rows, "regressions": regressions}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--cases", nargs="*", default=["*"], help="шаблоны имён случаев (fnmatch)")
+    parser.add_argument("--categories", nargs="*", help="категории корпуса (по умолчанию все)")
+    parser.add_argument("--iterations", type=int, default=10, help="проходов по корпусу в одном повторе")
+    parser.add_argument("--repetitions", type=int, default=10)
+    parser.add_argument("--warmup", type=int, default=2)
+    parser.add_argument("--save", help="сохранить результат как базовый JSON")
+    parser.add_argument("--compare", help="базовый JSON для сравнения")
+    parser.add_argument("--threshold", type=float, default=0.10, help="допустимое замедление медианы (доля)")
+    args = parser.parse_args()
+
+    result = run(args.cases, args.categories, args.iterations, args.repetitions, args.warmup)
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2)
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+        report = compare(result, baseline, args.threshold)
+        print(json.dumps(report, indent=2))
+        for key in report["regressions"]:
+            row = report["cases"][key]
+            print(f"REGRESSION {key}: {row['baselineUs']:.1f} -> {row['currentUs']:.1f} мкс "
+                  f"(x{row['ratio']:.2f})", file=sys.stderr)
+        sys.exit(1 if report["regressions"] else 0)
+
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+"""Бенчмарк запросов к индексу позиций обозревателя (bughouse.explorer).
+
+Запуск:
+    python -m benchmarks.explorer
+    python -m benchmarks.explorer --records 100000000 --runs 4 --dir /data/explorer_bench
+
+Индекс строится синтетически: --records записей со случайными ключами
+(по --fanout записей на позицию, как у популярных дебютных позиций)
+делится на --runs прогонов и пишется в --dir через PositionIndex.write_run.
+Затем индекс открывается заново (memmap, в память ничего не читается)
+и меряется время lookup для существующих и отсутствующих ключей —
+микросекунды на запрос, среднее и p99. Размер на диске — 22 байта на
+запись: 100M записей — около 2.2 ГБ.
+"""
+import argparse
+import json
+import os
+import shutil
+import time
+from typing import Dict
+
+import numpy as np
+
+from bughouse.explorer import RECORD_DTYPE, PositionIndex
+
+
+# Записей на прогон при генерации: столько держится в памяти одновременно
+GENERATE_BLOCK = 10_000_000
+
+
+def build(directory: str, records: int, runs: int, fanout: int, seed: int) -> np.ndarray:
+    """Пишет индекс и возвращает выборку существующих ключей для запросов"""
+    rng = np.random.default_rng(seed)
+    per_run = -(-records // runs)
+    samples = []
+    for start in range(0, records, per_run):
+        size = min(per_run, records - start)
+        for block in range(0, size, GENERATE_BLOCK):
+            count = min(GENERATE_BLOCK, size - block)
+            positions = rng.integers(0, 2**64, size=-(-count // fanout), dtype=np.uint64)
+            keys = np.repeat(positions, fanout)[:count]
+            data = np.zeros(count, dtype=RECORD_DTYPE)
+            data["game"] = rng.integers(0, 2**64, size=count, dtype=np.uint64)
+            data["move"] = rng.integers(0, 2**20, size=count, dtype=np.uint32)
+            data["player"] = rng.integers(1, 5, size=count)
+            data["result"] = rng.integers(0, 3, size=count)
+            PositionIndex.write_run(directory, keys, data)
+            samples.append(rng.choice(positions, size=min(1000, len(positions))))
+    return np.concatenate(samples)
+
+
+def timings(index: PositionIndex, keys: np.ndarray) -> Dict[str, float]:
+    seconds = []
+    found = 0
+    for key in keys.tolist():
+        started = time.perf_counter()
+        found += len(index.lookup(key, refresh_interval=float("inf")))
+        seconds.append(time.perf_counter() - started)
+    micros = np.array(seconds) * 1e6
+    return {"queries": len(keys), "records": found, "meanUs": round(float(micros.mean()), 2),
+            "p50Us": round(float(np.percentile(micros, 50)), 2), "p99Us": round(float(np.percentile(micros, 99)), 2)}
+
+
+def run(directory: str, records: int, runs: int, fanout: int, queries: int, seed: int) -> Dict:
+    shutil.rmtree(directory, ignore_errors=True)
+    started = time.perf_counter()
+    existing = build(directory, records, runs, fanout, seed)
+    build_seconds = time.perf_counter() - started
+
+    index = PositionIndex(directory)
+    started = time.perf_counter()
+    index.refresh()
+    open_seconds = time.perf_counter() - started
+    rng = np.random.default_rng(seed + 1)
+    hits = rng.choice(existing, size=queries)
+    misses = rng.integers(0, 2**64, size=queries, dtype=np.uint64)
+    disk = sum(os.path.getsize(os.path.join(directory, name)) for name in os.listdir(directory))
+    return {
+        "records": len(index),
+        "runs": len(index.runs),
+        "fanout": fanout,
+        "diskBytes": disk,
+        "buildSeconds": round(build_seconds, 2),
+        "openMs": round(open_seconds * 1000, 2),
+        "hit": timings(index, hits),
+        "miss": timings(index, misses),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--dir", default="explorer_bench")
+    parser.add_argument("--records", type=int, default=10_000_000)
+    parser.add_argument("--runs", type=int, default=1)
+    parser.add_argument("--fanout", type=int, default=4)
+    parser.add_argument("--queries", type=int, default=10000)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--keep", action="store_true", help="не удалять индекс после замера")
+    args = parser.parse_args()
+    report = run(args.dir, args.records, args.runs, args.fanout, args.queries, args.seed)
+    if not args.keep:
+        shutil.rmtree(args.dir, ignore_errors=True)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
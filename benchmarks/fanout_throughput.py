@@ -0,0 +1,106 @@
+"""Бенчмарк пропускной способности fanout.
+
+Запуск:
+    python -m benchmarks.fanout_throughput --backend unix --sessions 10 --subscribers 4 --messages 2000
+
+Для backend=unix поднимается локальный FanoutBroker и несколько клиентов
+UnixSocketFanout (как воркеры кластера); публикует первый клиент. Кроме
+скорости проверяется, что каждый подписчик получил версии каждой сессии
+строго по возрастанию.
+"""
+import argparse
+import asyncio
+import json
+import os
+import tempfile
+import time
+from typing import Dict, List
+
+from bughouse.fanout import Fanout, FanoutBroker, InProcessFanout, UnixSocketFanout
+
+
+class _OrderChecker:
+    def __init__(self):
+        self.received = 0
+        self.last: Dict[str, int] = {}
+        self.out_of_order = 0
+
+    async def __call__(self, session_id: str, version: int, payload: str):
+        if version <= self.last.get(session_id, 0):
+            self.out_of_order += 1
+        self.last[session_id] = version
+        self.received += 1
+
+
+async def run(backend: str, sessions: int, subscribers: int, messages: int, payload_size: int) -> Dict:
+    payload = json.dumps({"type": "state_update", "data": "x" * payload_size})
+    session_ids = [f"session-{i}" for i in range(sessions)]
+    broker = None
+    nodes: List[Fanout]
+
+    if backend == "unix":
+        socket_path = os.path.join(tempfile.mkdtemp(prefix="fanout-bench-"), "fanout.sock")
+        broker = FanoutBroker(socket_path)
+        await broker.start()
+        nodes = [UnixSocketFanout(socket_path) for _ in range(subscribers)]
+    else:
+        nodes = [InProcessFanout()]
+
+    checkers = []
+    for node in nodes:
+        per_node = subscribers if backend == "inproc" else 1
+        for _ in range(per_node):
+            checker = _OrderChecker()
+            checkers.append(checker)
+            for session_id in session_ids:
+                node.subscribe(session_id, checker)
+        await node.start()
+    await asyncio.sleep(0.1)
+
+    expected = messages * len(checkers)
+    publisher = nodes[0]
+    started = time.perf_counter()
+    for i in range(messages):
+        session_id = session_ids[i % sessions]
+        await publisher.publish(session_id, i // sessions + 1, payload)
+    while sum(c.received for c in checkers) < expected:
+        await asyncio.sleep(0.001)
+        if time.perf_counter() - started > 60:
+            break
+    elapsed = time.perf_counter() - started
+
+    for node in nodes:
+        await node.stop()
+    if broker is not None:
+        # Даём брокеру обработать закрытие клиентских соединений
+        await asyncio.sleep(0.05)
+        await broker.stop()
+
+    delivered = sum(c.received for c in checkers)
+    return {
+        "backend": backend,
+        "sessions": sessions,
+        "subscribers": len(checkers),
+        "published": messages,
+        "delivered": delivered,
+        "outOfOrder": sum(c.out_of_order for c in checkers),
+        "seconds": elapsed,
+        "publishedPerSec": messages / elapsed,
+        "deliveredPerSec": delivered / elapsed,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--backend", choices=["inproc", "unix"], default="unix")
+    parser.add_argument("--sessions", type=int, default=10)
+    parser.add_argument("--subscribers", type=int, default=4)
+    parser.add_argument("--messages", type=int, default=5000)
+    parser.add_argument("--payload-size", type=int, default=4000)
+    args = parser.parse_args()
+    result = asyncio.run(run(args.backend, args.sessions, args.subscribers, args.messages, args.payload_size))
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+"""Бенчмарк параллельного поиска движка (ParallelSearch) против одного процесса.
+
+Запуск:
+    python -m benchmarks.parallel_search --depth 2 --workers 1,2,4,8
+    python -m benchmarks.parallel_search --categories drops --depth 3
+
+Каждая позиция корпуса (benchmarks.positions) считается на фиксированную
+глубину за ходящего на доске A: сначала обычным Searcher в этом процессе,
+затем ParallelSearch с каждым числом процессов из --workers. Таблица
+транспозиций перед каждой позицией пустая. Для каждого режима выводятся
+время, узлы, узлы в секунду и ускорение против одного процесса, а также
+совпали ли выбранные ходы с последовательным поиском (при равных
+оценках порядок ходов может отличаться — это не ошибка).
+"""
+import argparse
+import json
+import os
+import time
+from typing import Any, Dict, List
+
+from bughouse.color import Color
+from bughouse.engine import ParallelSearch, Searcher
+from bughouse.game import Game
+from benchmarks.positions import CORPUS
+
+
+def suite(categories: List[str]) -> List[Dict[str, Any]]:
+    return [position for category in categories for position in CORPUS[category]]
+
+
+def mover_a(position: Dict[str, Any]) -> int:
+    game = Game()
+    game.from_fen_dict(position)
+    return 1 if game.board_a.get_current_player() == Color.WHITE else 4
+
+
+def run_sequential(positions: List[Dict[str, Any]], depth: int) -> Dict[str, Any]:
+    nodes, elapsed, actions = 0, 0.0, []
+    for position in positions:
+        game = Game()
+        game.from_fen_dict(position)
+        searcher = Searcher(game, mover_a(position), float("inf"), {})
+        started = time.perf_counter()
+        action, _ = searcher.search(depth)
+        elapsed += time.perf_counter() - started
+        nodes += searcher.nodes
+        actions.append(action)
+    return {"workers": 1, "mode": "sequential", "seconds": elapsed, "nodes": nodes, "actions": actions}
+
+
+def run_parallel(positions: List[Dict[str, Any]], depth: int, workers: int) -> Dict[str, Any]:
+    nodes, elapsed, actions = 0, 0.0, []
+    with ParallelSearch(workers) as search:
+        search.warmup()
+        for position in positions:
+            search.table.clear()
+            started = time.perf_counter()
+            result = search.choose_action(position, mover_a(position), float("inf"), max_depth=depth)
+            elapsed += time.perf_counter() - started
+            nodes += result["nodes"]
+            actions.append(result["action"])
+    return {"workers": workers, "mode": "parallel", "seconds": elapsed, "nodes": nodes, "actions": actions}
+
+
+def report(runs: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    baseline = runs[0]
+    rows = []
+    for run in runs:
+        rows.append({
+            "mode": run["mode"],
+            "workers": run["workers"],
+            "seconds": round(run["seconds"], 3),
+            "nodes": run["nodes"],
+            "nodesPerSecond": round(run["nodes"] / run["seconds"], 1) if run["seconds"] else 0.0,
+            "speedup": round(baseline["seconds"] / run["seconds"], 2) if run["seconds"] else 0.0,
+            "sameMoves": sum(a == b for a, b in zip(run["actions"], baseline["actions"])),
+        })
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--depth", type=int, default=2)
+    parser.add_argument("--workers", default=f"1,{os.cpu_count() or 1}",
+                        help="числа процессов через запятую (по умолчанию 1 и все ядра)")
+    parser.add_argument("--categories", default=",".join(CORPUS), help="категории корпуса через запятую")
+    args = parser.parse_args()
+
+    positions = suite(args.categories.split(","))
+    runs = [run_sequential(positions, args.depth)]
+    for workers in sorted({int(w) for w in args.workers.split(",")}):
+        runs.append(run_parallel(positions, args.depth, workers))
+    print(json.dumps({
+        "positions": len(positions),
+        "depth": args.depth,
+        "cpus": os.cpu_count(),
+        "results": report(runs),
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
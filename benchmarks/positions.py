@@ -0,0 +1,64 @@
+"""Корпус позиций для бенчмарков движка.
+
+Позиции в формате Game.to_fen_dict: FEN обеих досок и запасы игроков.
+Категории: дебют, миттельшпиль, позиции с большими запасами (много
+дропов) и позиции с превращением пешки.
+"""
+from typing import Dict, List
+
+
+def _reserves(p: int = 0, n: int = 0, b: int = 0, r: int = 0, q: int = 0) -> Dict[str, Dict[str, int]]:
+    counts = {"P": p, "N": n, "B": b, "R": r, "Q": q}
+    return {pid: dict(counts) for pid in ["1", "2", "3", "4"]}
+
+
+START = "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1"
+
+CORPUS: Dict[str, List[Dict]] = {
+    "opening": [
+        {"boardA": START, "boardB": START, "reserves": _reserves()},
+        {
+            "boardA": "r1bqkbnr/pppp1ppp/2n5/4p3/4P3/5N2/PPPP1PPP/RNBQKB1R w KQkq - 2 3",
+            "boardB": "rnbqkbnr/pp1ppppp/8/2p5/4P3/8/PPPP1PPP/RNBQKBNR w KQkq - 0 2",
+            "reserves": _reserves(p=1),
+        },
+        {
+            "boardA": "rnbqkb1r/pppppppp/5n2/8/3P4/8/PPP1PPPP/RNBQKBNR w KQkq - 1 2",
+            "boardB": "rnbqkbnr/ppp1pppp/8/3p4/3P4/8/PPP1PPPP/RNBQKBNR w KQkq - 0 2",
+            "reserves": _reserves(),
+        },
+    ],
+    "middlegame": [
+        {
+            "boardA": "r1bq1rk1/pp2bppp/2n1pn2/3p4/2PP4/2N1PN2/PP3PPP/R1BQKB1R w KQ - 0 8",
+            "boardB": "r2q1rk1/pp1nbppp/2p1pn2/3p4/2PP1B2/2N1PN2/PP3PPP/R2QKB1R w KQ - 2 8",
+            "reserves": _reserves(p=1, n=1),
+        },
+        {
+            "boardA": "2rq1rk1/pb1nbppp/1p2pn2/2pp4/2PP4/1PN1PN2/PB2BPPP/2RQ1RK1 w - - 0 12",
+            "boardB": "r1b2rk1/pp1n1ppp/2pbpq2/3p4/2PP4/2NBPN2/PPQ2PPP/R3K2R w KQ - 4 10",
+            "reserves": _reserves(p=2, b=1),
+        },
+    ],
+    "drops": [
+        {
+            "boardA": "r3k2r/ppp2ppp/2n5/3q4/3P4/2N5/PPP2PPP/R3K2R w KQkq - 0 12",
+            "boardB": "r1b1k2r/pp3ppp/8/8/8/8/PP3PPP/R1B1K2R b KQkq - 0 14",
+            "reserves": _reserves(p=4, n=2, b=2, r=1, q=1),
+        },
+        {
+            "boardA": "4k3/pp3ppp/8/8/8/8/PP3PPP/4K3 w - - 0 20",
+            "boardB": "6k1/5ppp/8/8/8/8/5PPP/6K1 w - - 0 25",
+            "reserves": _reserves(p=3, n=2, b=2, r=1, q=1),
+        },
+    ],
+}
+
+# Пешки в шаге от превращения; у соперников на другой доске есть фигуры для обмена
+PROMOTION = [
+    {
+        "boardA": "r3k2r/PPP5/8/8/8/8/ppp5/R3K2R w - - 0 1",
+        "boardB": "r3k2r/PPP5/8/8/8/8/ppp5/R3K2R w - - 0 1",
+        "reserves": _reserves(p=2, n=2, b=2, r=1, q=1),
+    },
+]
@@ -0,0 +1,83 @@
+"""Бенчмарк колеса таймеров на большом числе идущих часов.
+
+Моделирует N партий с идущими часами: каждая партия периодически делает
+ход (перепланирует флаг), часть партий теряет время и падает по флагу.
+Время виртуальное, поэтому измеряется чистая стоимость операций колеса.
+
+Запуск:
+    python -m benchmarks.timer_wheel --clocks 50000 --seconds 120
+"""
+import argparse
+import json
+import random
+import time
+from typing import Dict, List
+
+from bughouse.timer_wheel import TimerHandle, TimerWheel
+
+
+def run(clocks: int, seconds: float, tick: float, move_interval: float, seed: int) -> Dict:
+    rng = random.Random(seed)
+    now = [0.0]
+    wheel = TimerWheel(tick=tick, now=lambda: now[0])
+    handles: List[TimerHandle] = [None] * clocks
+    flags = [0]
+
+    def on_flag():
+        flags[0] += 1
+
+    schedule_started = time.perf_counter()
+    for i in range(clocks):
+        handles[i] = wheel.schedule(rng.uniform(30, 600), on_flag)
+    schedule_seconds = time.perf_counter() - schedule_started
+
+    reschedules = 0
+    advance_seconds = 0.0
+    reschedule_seconds = 0.0
+    ticks = int(seconds / tick)
+    moves_per_tick = max(1, int(clocks * tick / move_interval))
+    max_tick_seconds = 0.0
+    for _ in range(ticks):
+        now[0] += tick
+        started = time.perf_counter()
+        for _ in range(moves_per_tick):
+            i = rng.randrange(clocks)
+            handles[i].cancel()
+            handles[i] = wheel.schedule(now[0] + rng.uniform(1, 300), on_flag)
+        reschedule_seconds += time.perf_counter() - started
+        reschedules += moves_per_tick
+
+        started = time.perf_counter()
+        wheel.advance()
+        elapsed = time.perf_counter() - started
+        advance_seconds += elapsed
+        max_tick_seconds = max(max_tick_seconds, elapsed)
+
+    return {
+        "clocks": clocks,
+        "virtualSeconds": seconds,
+        "tickMs": tick * 1000,
+        "scheduleUsPerTimer": schedule_seconds / clocks * 1e6,
+        "reschedules": reschedules,
+        "rescheduleUsPerMove": reschedule_seconds / reschedules * 1e6,
+        "ticks": ticks,
+        "advanceUsPerTick": advance_seconds / ticks * 1e6,
+        "advanceMaxMsPerTick": max_tick_seconds * 1000,
+        "flags": flags[0],
+        "pendingInclCancelled": wheel.pending,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--clocks", type=int, default=50000)
+    parser.add_argument("--seconds", type=float, default=120.0)
+    parser.add_argument("--tick", type=float, default=0.05)
+    parser.add_argument("--move-interval", type=float, default=10.0, help="среднее время между ходами в партии, с")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    print(json.dumps(run(args.clocks, args.seconds, args.tick, args.move_interval, args.seed), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,193 @@
+"""Архив законченных партий: сжатые сегменты и индекс смещений.
+
+Запись архива — JSON партии (запись ходов, начальная и итоговая позиция,
+результат). Сервер только кладёт её в очередь (submit), а пишет фоновый
+поток: он собирает из очереди пачку записей (до batch_size или за
+flush_interval) и дописывает её в текущий сегмент одним сжатым блоком —
+gzip member или поток xz. Склеенные блоки — снова корректный .gz/.xz,
+поэтому сегмент читается и целиком обычными gzip/xz.
+
+Рядом с сегментом лежит индекс <сегмент>.idx — строки
+"id смещение длина номер": где начинается блок, его сжатая длина и номер
+строки записи внутри блока. get(id) читает и распаковывает один блок, а
+не весь сегмент. Строки индекса пишутся после блока, так что недописанный
+при падении блок просто не попадает в индекс. После перезапуска пишется
+новый сегмент; сегмент закрывается, когда вырастает больше segment_bytes.
+
+Каталог архива может быть общим у нескольких процессов (воркеры
+кластера): сегменты называются games-<writer>-<номер>, где writer —
+номер воркера или pid, так что каждый процесс дописывает только свои
+файлы, а читает индексы всех.
+
+Индекс в памяти не держится: get ищет строку id в файлах .idx (поиском
+по байтам, от недавно изменённых сегментов к старым — недавние партии
+запрашивают чаще) и помнит только cache_size последних найденных мест.
+get читает файлы, поэтому из цикла событий его вызывают через
+asyncio.to_thread.
+"""
+import gzip
+import json
+import logging
+import lzma
+import os
+import queue
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+
+logger = logging.getLogger(__name__)
+
+COMPRESSORS = {
+    "gzip": (".jsonl.gz", gzip.compress, gzip.decompress),
+    "lzma": (".jsonl.xz", lzma.compress, lzma.decompress),
+}
+# games-<writer>-<номер>; сегменты без writer — от версий до общих каталогов
+_SEGMENT = re.compile(r"^games-(?:(\w+)-)?(\d+)\.jsonl\.(gz|xz)$")
+
+
+class GameArchive:
+    def __init__(self, directory: str, compression: str = "gzip", batch_size: int = 64,
+                 flush_interval: float = 1.0, segment_bytes: int = 64 * 1024 * 1024, queue_limit: int = 10000,
+                 writer: Optional[str] = None, cache_size: int = 1024):
+        if compression not in COMPRESSORS:
+            raise ValueError(f"Неизвестное сжатие архива: {compression}")
+        self.directory = directory
+        self.compression = compression
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.segment_bytes = segment_bytes
+        # Имя пишущего процесса в именах сегментов; по умолчанию pid (при записи)
+        self.writer = writer
+        self.cache_size = cache_size
+        self.queue: 'queue.Queue[Optional[Dict[str, Any]]]' = queue.Queue(maxsize=queue_limit)
+        self.written = 0
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        # Последние найденные: id партии -> (сегмент, смещение блока, длина блока, номер строки)
+        self._located: 'OrderedDict[str, Tuple[str, int, int, int]]' = OrderedDict()
+        self._segment: Optional[str] = None
+        self._segment_size = 0
+
+    def submit(self, record: Dict[str, Any]) -> bool:
+        """Ставит запись (с ключом "id") в очередь; False — очередь переполнена"""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="game-archive", daemon=True)
+            self._thread.start()
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            return False
+        return True
+
+    def close(self, timeout: Optional[float] = None):
+        """Дописывает всё из очереди и останавливает поток"""
+        if self._thread is None:
+            return
+        self.queue.put(None)
+        self._thread.join(timeout)
+        self._thread = None
+
+    def get(self, game_id: str) -> Optional[Dict[str, Any]]:
+        """Запись партии: читается и распаковывается только её блок"""
+        location = self._locate(game_id)
+        if location is None:
+            return None
+        segment, offset, length, line = location
+        with open(os.path.join(self.directory, segment), "rb") as f:
+            f.seek(offset)
+            block = f.read(length)
+        decompress = COMPRESSORS["gzip" if segment.endswith(".gz") else "lzma"][2]
+        return json.loads(decompress(block).decode("utf-8").splitlines()[line])
+
+    def _locate(self, game_id: str) -> Optional[Tuple[str, int, int, int]]:
+        with self._lock:
+            location = self._located.get(game_id)
+            if location is not None:
+                self._located.move_to_end(game_id)
+                return location
+        needle = f"\n{game_id} ".encode("utf-8")
+        for segment in self._segments_by_age():
+            try:
+                with open(os.path.join(self.directory, segment + ".idx"), "rb") as f:
+                    data = b"\n" + f.read()
+            except FileNotFoundError:
+                continue
+            start = data.rfind(needle)
+            end = data.find(b"\n", start + 1) if start >= 0 else -1
+            # Без перевода строки — строка ещё дописывается
+            if end < 0:
+                continue
+            _, offset, length, line = data[start + 1:end].decode("utf-8").split()
+            location = (segment, int(offset), int(length), int(line))
+            with self._lock:
+                self._located[game_id] = location
+                while len(self._located) > self.cache_size:
+                    self._located.popitem(last=False)
+            return location
+        return None
+
+    def _segments_by_age(self) -> List[str]:
+        """Сегменты от недавно дописанных к старым"""
+        ages = []
+        for segment in self._segments():
+            try:
+                ages.append((os.path.getmtime(os.path.join(self.directory, segment + ".idx")), segment))
+            except FileNotFoundError:
+                continue
+        return [segment for _, segment in sorted(ages, reverse=True)]
+
+    def _segments(self) -> List[str]:
+        if not os.path.isdir(self.directory):
+            return []
+        return sorted(name for name in os.listdir(self.directory) if _SEGMENT.match(name))
+
+    def _next_segment(self) -> str:
+        writer = self.writer or str(os.getpid())
+        numbers = [int(match.group(2)) for match in map(_SEGMENT.match, self._segments()) if match.group(1) == writer]
+        return f"games-{writer}-{max(numbers, default=0) + 1:06d}{COMPRESSORS[self.compression][0]}"
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            batch = []
+            item = self.queue.get()
+            deadline = time.monotonic() + self.flush_interval
+            while True:
+                if item is None:
+                    stopping = True
+                    break
+                batch.append(item)
+                if len(batch) >= self.batch_size:
+                    break
+                try:
+                    item = self.queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+            if batch:
+                try:
+                    self._write_batch(batch)
+                except Exception:
+                    logger.exception("Archive write failed", extra={"games": len(batch)})
+
+    def _write_batch(self, batch: List[Dict[str, Any]]):
+        os.makedirs(self.directory, exist_ok=True)
+        if self._segment is None or self._segment_size >= self.segment_bytes:
+            # После перезапуска — всегда новый сегмент: хвост старого мог остаться недописанным
+            self._segment = self._next_segment()
+            self._segment_size = 0
+        payload = "".join(json.dumps(record, ensure_ascii=False, separators=(",", ":")) + "\n" for record in batch)
+        block = COMPRESSORS[self.compression][1](payload.encode("utf-8"))
+        path = os.path.join(self.directory, self._segment)
+        with open(path, "ab") as f:
+            offset = f.tell()
+            f.write(block)
+            f.flush()
+            os.fsync(f.fileno())
+        rows = [(record["id"], offset, len(block), line) for line, record in enumerate(batch)]
+        with open(path + ".idx", "a", encoding="utf-8") as f:
+            f.writelines(f"{game_id} {offset} {length} {line}\n" for game_id, offset, length, line in rows)
+        self._segment_size = offset + len(block)
+        self.written += len(batch)
@@ -0,0 +1,104 @@
+"""Пакетная оценка позиций на NumPy.
+
+Позиция кодируется с точки зрения игрока: плоскости фигур (своя и чужая
+сторона × P, N, B, R, Q, K × 8×8, индекс [файл][горизонталь] как в
+ChessBoard.squares) и счётчики запасов двух игроков доски (P, N, B, R, Q).
+Оценка пакета — один векторный проход: плоскости умножаются на веса
+«материал + бонус клетки», запасы — на стоимость фигур.
+
+Результат совпадает с engine.evaluate, которая служит эталонной скалярной
+реализацией: check_against_scalar сверяет их на наборе позиций.
+"""
+from typing import Iterable, List, Sequence, Tuple
+
+import numpy as np
+
+from bughouse.engine import CENTER_BONUS, PIECE_VALUES, RESERVE_WEIGHT, evaluate, opponent_id
+from bughouse.figures import Pawn, Knight, Bishop, Rook, Queen, King
+from bughouse.game import Game
+
+
+PIECE_ORDER = (Pawn, Knight, Bishop, Rook, Queen, King)
+RESERVE_ORDER = (Pawn, Knight, Bishop, Rook, Queen)
+_PLANE = {cls: index for index, cls in enumerate(PIECE_ORDER)}
+
+
+def _square_weights() -> np.ndarray:
+    """Веса клеток (фигура, файл, горизонталь): стоимость фигуры плюс бонус за центр (королю — 0)"""
+    center = np.minimum.outer(np.array(CENTER_BONUS), np.array(CENTER_BONUS))
+    weights = np.zeros((len(PIECE_ORDER), 8, 8), dtype=np.float32)
+    for index, cls in enumerate(PIECE_ORDER):
+        if PIECE_VALUES[cls]:
+            weights[index] = PIECE_VALUES[cls] + center
+    return weights
+
+
+SQUARE_WEIGHTS = _square_weights()
+RESERVE_VALUES = np.array([PIECE_VALUES[cls] for cls in RESERVE_ORDER], dtype=np.float64)
+
+
+class PositionBatch:
+    """Закодированные позиции: planes (N, 2, 6, 8, 8) uint8 и reserves (N, 2, 5) uint8"""
+
+    def __init__(self, planes: np.ndarray, reserves: np.ndarray):
+        self.planes = planes
+        self.reserves = reserves
+
+    def __len__(self) -> int:
+        return len(self.planes)
+
+    @staticmethod
+    def empty(size: int) -> 'PositionBatch':
+        return PositionBatch(np.zeros((size, 2, len(PIECE_ORDER), 8, 8), dtype=np.uint8),
+                             np.zeros((size, 2, len(RESERVE_ORDER)), dtype=np.uint8))
+
+
+def encode_into(batch: PositionBatch, index: int, game: Game, player_id: int):
+    """Кодирует позицию доски игрока player_id в строку index пакета"""
+    player = game.get_player(player_id)
+    opponent = game.players[opponent_id(game, player_id)]
+    planes = batch.planes[index]
+    planes[:] = 0
+    for file, column in enumerate(player.board.squares):
+        for rank, piece in enumerate(column):
+            if piece is not None:
+                planes[0 if piece.color == player.color else 1, _PLANE[type(piece)], file, rank] = 1
+    for side, owner in enumerate((player, opponent)):
+        batch.reserves[index, side] = [owner.pieces_reserve.get_count(cls) for cls in RESERVE_ORDER]
+
+
+def encode_batch(positions: Sequence[Tuple[Game, int]]) -> PositionBatch:
+    """Пакет из пар (партия, игрок, с чьей стороны оценивать)"""
+    batch = PositionBatch.empty(len(positions))
+    for index, (game, player_id) in enumerate(positions):
+        encode_into(batch, index, game, player_id)
+    return batch
+
+
+# Плоскости переводятся во float32 блоками: копия всего пакета не помещается в кэш
+BLOCK_SIZE = 2048
+
+
+def evaluate_batch(batch: PositionBatch) -> np.ndarray:
+    """Оценки всех позиций пакета (int64) — то же, что engine.evaluate для каждой"""
+    size = len(batch)
+    planes = batch.planes.reshape(size, 2, -1)
+    weights = SQUARE_WEIGHTS.reshape(-1)
+    board = np.empty((size, 2), dtype=np.float32)
+    for start in range(0, size, BLOCK_SIZE):
+        # Суммы целые и меньше 2**24, поэтому float32 (и BLAS) считает их точно
+        board[start:start + BLOCK_SIZE] = planes[start:start + BLOCK_SIZE].astype(np.float32) @ weights
+    reserve = batch.reserves.astype(np.float64) @ RESERVE_VALUES
+    material = np.rint(board[:, 0] - board[:, 1]).astype(np.int64)
+    return material + np.trunc(RESERVE_WEIGHT * (reserve[:, 0] - reserve[:, 1])).astype(np.int64)
+
+
+def evaluate_scalar(positions: Iterable[Tuple[Game, int]]) -> List[int]:
+    """Эталон: engine.evaluate по одной позиции"""
+    return [evaluate(game, player_id) for game, player_id in positions]
+
+
+def check_against_scalar(positions: Sequence[Tuple[Game, int]]) -> List[int]:
+    """Индексы позиций, где пакетная оценка разошлась с эталонной (пустой список — всё совпало)"""
+    batch = evaluate_batch(encode_batch(positions))
+    return [i for i, (fast, slow) in enumerate(zip(batch.tolist(), evaluate_scalar(positions))) if fast != slow]
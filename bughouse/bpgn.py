@@ -0,0 +1,294 @@
+"""Запись партий в BPGN (bughouse PGN) и потоковое чтение.
+
+Партия — заголовки [Имя "значение"] и текст ходов обеих досок в том
+порядке, в каком они делались:
+
+    [WhiteA "Игрок 1"] ... [Result "1-0"]
+
+    1A. e2e4{179.5 +0.52} 1B. d2d4{178.9 +1.10} 1a. e7e5{179.1 +2.30} ...
+
+Номер хода относится к своей доске; буква — доска и цвет (A/B — белые,
+a/b — чёрные). Ходы записываются координатами, без SAN: e2e4, дроп
+N@f3, превращение с забором фигуры e7e8=Q(d8) — в скобках клетка
+забранной фигуры на другой доске (её тип и даёт новую фигуру).
+В комментарии — оставшееся время на часах ходившего, секунды (если
+часы были), и +секунды от начала записи. Результат 1-0 — победа команды
+белых доски A (игроки 1 и 3), 0-1 — команды 2 и 4.
+
+Партия из произвольной позиции несёт теги [SetUp "1"], [FEN "<доска A> |
+<доска B>"] и [Reserves "P10N10B10R10Q10/..."] — запасы игроков 1, 2, 3, 4.
+write_bpgn добавляет итоговую позицию в том же виде — [FinalFEN] и
+[FinalReserves]: по ним проверяется проигрывание архива.
+
+read_games читает поток построчно и отдаёт партии по одной, поэтому
+архив любого размера не держится в памяти целиком; replay проигрывает
+партию через Game.make_move/make_drop, как ходы игроков.
+"""
+import gzip
+import re
+import time
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, TextIO
+
+from bughouse.game import Game
+
+
+# Игрок по букве хода
+PLAYER_BY_LETTER = {"A": 1, "a": 4, "B": 2, "b": 3}
+LETTER_BY_PLAYER = {player_id: letter for letter, player_id in PLAYER_BY_LETTER.items()}
+RESERVE_ORDER = "PNBRQ"
+RESULTS = ("1-0", "0-1", "1/2-1/2", "*")
+
+_TAG = re.compile(r'^\[(\w+)\s+"((?:[^"\\]|\\.)*)"\]\s*$')
+_TOKEN = re.compile(r"\{[^}]*\}|\d+[ABab]\.|[^\s{}]+")
+_MOVE = re.compile(r"^([a-h][1-8])([a-h][1-8])(?:=([NBRQ])\(([a-h][1-8])\))?$")
+_DROP = re.compile(r"^([PNBRQ])@([a-h][1-8])$")
+
+
+class BpgnError(ValueError):
+    pass
+
+
+class BpgnGame:
+    """Прочитанная партия: заголовки, ходы (в формате Game.history) и результат"""
+
+    def __init__(self, tags: Dict[str, str]):
+        self.tags = tags
+        self.moves: List[Dict[str, Any]] = []
+        self.result = "*"
+
+    def start_position(self) -> Optional[Dict[str, Any]]:
+        """Начальная позиция в формате Game.to_fen_dict или None — стандартная"""
+        if self.tags.get("SetUp") != "1" or "FEN" not in self.tags:
+            return None
+        fen_a, fen_b = (part.strip() for part in self.tags["FEN"].split("|"))
+        position: Dict[str, Any] = {"boardA": fen_a, "boardB": fen_b}
+        if "Reserves" in self.tags:
+            position["reserves"] = parse_reserves(self.tags["Reserves"])
+        return position
+
+    def final_position(self) -> Optional[Dict[str, Any]]:
+        """Итоговая позиция из [FinalFEN]/[FinalReserves] или None, если её не записали"""
+        if "FinalFEN" not in self.tags:
+            return None
+        fen_a, fen_b = (part.strip() for part in self.tags["FinalFEN"].split("|"))
+        position: Dict[str, Any] = {"boardA": fen_a, "boardB": fen_b}
+        if "FinalReserves" in self.tags:
+            position["reserves"] = parse_reserves(self.tags["FinalReserves"])
+        return position
+
+
+def format_reserves(reserves: Dict[str, Dict[str, int]]) -> str:
+    return "/".join(
+        "".join(f"{symbol}{reserves[str(player_id)].get(symbol, 0)}" for symbol in RESERVE_ORDER)
+        for player_id in (1, 2, 3, 4)
+    )
+
+
+def parse_reserves(text: str) -> Dict[str, Dict[str, int]]:
+    groups = text.split("/")
+    if len(groups) != 4:
+        raise BpgnError(f"Reserves: ожидались запасы 4 игроков: {text}")
+    reserves = {}
+    for player_id, group in zip((1, 2, 3, 4), groups):
+        counts = dict(re.findall(r"([PNBRQ])(\d+)", group))
+        reserves[str(player_id)] = {symbol: int(counts.get(symbol, 0)) for symbol in RESERVE_ORDER}
+    return reserves
+
+
+def result_token(game_over: Optional[Dict[str, Any]]) -> str:
+    if game_over is None:
+        return "*"
+    return "1-0" if game_over["winner"] == "team1" else "0-1"
+
+
+def move_token(entry: Dict[str, Any]) -> str:
+    if entry["type"] == "drop":
+        return f"{entry['piece']}@{entry['square']}"
+    if entry.get("victimSquare"):
+        return f"{entry['from']}{entry['to']}={entry['piece']}({entry['victimSquare']})"
+    return f"{entry['from']}{entry['to']}"
+
+
+def format_game(history: List[Dict[str, Any]], start_position: Optional[Dict[str, Any]] = None,
+                result: str = "*", tags: Optional[Dict[str, str]] = None) -> str:
+    """Текст партии BPGN по записи ходов (Game.history)"""
+    started = history[0]["ts"] if history and history[0].get("ts") is not None else time.time()
+    header = {
+        "Event": "Bughouse",
+        "Site": "?",
+        "Date": time.strftime("%Y.%m.%d", time.gmtime(started)),
+        "Time": time.strftime("%H:%M:%S", time.gmtime(started)),
+        "WhiteA": "Игрок 1", "BlackA": "Игрок 4", "WhiteB": "Игрок 2", "BlackB": "Игрок 3",
+    }
+    header.update(tags or {})
+    header["Result"] = result
+    # Номер хода каждой доски: из FEN начальной позиции или с 1
+    numbers = {"A": 1, "B": 1}
+    if start_position is not None:
+        header["SetUp"] = "1"
+        header["FEN"] = f"{start_position['boardA']} | {start_position['boardB']}"
+        if "reserves" in start_position:
+            header["Reserves"] = format_reserves(start_position["reserves"])
+        for name, key in (("A", "boardA"), ("B", "boardB")):
+            fields = start_position[key].split()
+            if len(fields) >= 6 and fields[5].isdigit():
+                numbers[name] = int(fields[5])
+
+    lines = [f'[{name} "{_escape(str(value))}"]' for name, value in header.items()]
+    lines.append("")
+    tokens = []
+    for entry in history:
+        letter = LETTER_BY_PLAYER[entry["player"]]
+        board = letter.upper()
+        comment = []
+        if entry.get("clockMs") is not None:
+            comment.append(f"{entry['clockMs'] / 1000:.1f}")
+        if entry.get("ts") is not None:
+            comment.append(f"+{entry['ts'] - started:.2f}")
+        tokens.append(f"{numbers[board]}{letter}. {move_token(entry)}" + ("{" + " ".join(comment) + "}" if comment else ""))
+        if letter.islower():
+            numbers[board] += 1
+    tokens.append(result)
+    # Строки не длиннее ~80 символов, как принято в PGN
+    line = ""
+    for token in tokens:
+        if line and len(line) + 1 + len(token) > 80:
+            lines.append(line)
+            line = token
+        else:
+            line = f"{line} {token}" if line else token
+    lines.append(line)
+    return "\n".join(lines) + "\n\n"
+
+
+def write_bpgn(game: Game, tags: Optional[Dict[str, str]] = None) -> str:
+    """BPGN партии Game: её запись ходов, начальная позиция, итоговая позиция и результат"""
+    final = game.to_fen_dict()
+    header = {"FinalFEN": f"{final['boardA']} | {final['boardB']}", "FinalReserves": format_reserves(final["reserves"])}
+    header.update(tags or {})
+    return format_game(game.history, game.start_position, result_token(game.check_game_over()), header)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"')
+
+
+def _unescape(value: str) -> str:
+    return re.sub(r"\\(.)", r"\1", value)
+
+
+def _parse_comment(comment: str, entry: Dict[str, Any]):
+    for field in comment.split():
+        try:
+            if field.startswith("+"):
+                entry["elapsed"] = float(field[1:])
+            else:
+                entry["clockMs"] = int(round(float(field) * 1000))
+        except ValueError:
+            # Посторонний комментарий — не наш формат, пропускаем
+            continue
+
+
+def _parse_move(token: str, player_id: int) -> Dict[str, Any]:
+    match = _MOVE.match(token)
+    if match:
+        entry: Dict[str, Any] = {"type": "move", "from": match.group(1), "to": match.group(2), "player": player_id}
+        if match.group(3):
+            entry["piece"] = match.group(3)
+            entry["victimSquare"] = match.group(4)
+        return entry
+    match = _DROP.match(token)
+    if match:
+        return {"type": "drop", "piece": match.group(1), "square": match.group(2), "player": player_id}
+    raise BpgnError(f"Непонятный ход: {token}")
+
+
+def read_games(lines: Iterable[str]) -> Iterator[BpgnGame]:
+    """Партии из потока строк по одной; в памяти только текущая партия"""
+    game: Optional[BpgnGame] = None
+    in_movetext = False
+    player_id: Optional[int] = None
+    pending = ""
+    for raw in lines:
+        line = raw.strip()
+        if pending:
+            # Продолжение комментария, начатого на прошлой строке
+            line = pending + " " + line
+            pending = ""
+        if not line:
+            continue
+        tag = _TAG.match(line) if line.startswith("[") else None
+        if tag is not None:
+            if in_movetext and game is not None:
+                # У прошлой партии не было результата в конце — начинается новая
+                yield game
+                game, in_movetext = None, False
+            if game is None:
+                game = BpgnGame({})
+            game.tags[tag.group(1)] = _unescape(tag.group(2))
+            continue
+        if line.count("{") > line.count("}"):
+            pending = line
+            continue
+        if game is None:
+            game = BpgnGame({})
+        in_movetext = True
+        for token in _TOKEN.findall(line):
+            if token.startswith("{"):
+                if game.moves:
+                    _parse_comment(token[1:-1], game.moves[-1])
+            elif token[-1] == "." and token[-2] in PLAYER_BY_LETTER:
+                player_id = PLAYER_BY_LETTER[token[-2]]
+            elif token in RESULTS:
+                game.result = token
+                yield game
+                game, in_movetext, player_id = None, False, None
+                break
+            else:
+                if player_id is None:
+                    raise BpgnError(f"Ход без номера и доски: {token}")
+                game.moves.append(_parse_move(token, player_id))
+                player_id = None
+    if game is not None and (game.moves or game.tags):
+        yield game
+
+
+def open_bpgn(path: str) -> TextIO:
+    """Открывает файл партий на чтение; .gz распаковывается на лету"""
+    if path.endswith(".gz"):
+        return gzip.open(path, "rt", encoding="utf-8")
+    return open(path, "r", encoding="utf-8")
+
+
+def iter_file(path: str) -> Iterator[BpgnGame]:
+    with open_bpgn(path) as stream:
+        yield from read_games(stream)
+
+
+def replay(record: BpgnGame, observe: Optional[Callable[[Dict[str, Any], float], None]] = None) -> Game:
+    """Проигрывает партию через Game; непринятый ход — BpgnError с номером хода.
+
+    observe(ход, секунды) вызывается после каждого хода с временем make_move/make_drop.
+    """
+    game = Game()
+    position = record.start_position()
+    if position is not None:
+        game.from_fen_dict(position)
+    for index, entry in enumerate(record.moves, 1):
+        player_id = entry["player"]
+        started = time.perf_counter()
+        try:
+            if entry["type"] == "drop":
+                game.make_drop(player_id, entry["piece"], entry["square"])
+            else:
+                victim_id = None
+                if entry.get("victimSquare"):
+                    opponent = game.get_player(int(game.get_player(player_id).get_opponent_player_id()))
+                    victim_id = opponent.get_partner_id()
+                game.make_move(player_id, entry["from"], entry["to"],
+                               victim_player_id=victim_id, victim_square=entry.get("victimSquare"))
+        except Exception as e:
+            raise BpgnError(f"Ход {index} ({LETTER_BY_PLAYER[player_id]} {move_token(entry)}): {e}") from e
+        if observe is not None:
+            observe(entry, time.perf_counter() - started)
+    return game
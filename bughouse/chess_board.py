@@ -1,4 +1,4 @@
-from typing import List, Set, Optional, TYPE_CHECKING
+from typing import Dict, List, Set, Optional, TYPE_CHECKING
 from bughouse.coordinate import Coordinate
 from bughouse.color import Color
 from bughouse.file import File
@@ -6,18 +6,23 @@ from bughouse.figures import Piece, Pawn, Knight, Bishop, Rook, Queen, King
 
 if TYPE_CHECKING:
     from bughouse.pieces_reserve import PiecesReserve
+    from bughouse.clock import ChessClock
 
 class ChessBoard:
     def __init__(self):
         self.squares: list[list[Optional[Piece]]] = [[None] * 8 for _ in range(8)]
         self.current_player = Color.WHITE
         self.en_passant_target: Optional[Coordinate] = None
+        self.clock: Optional['ChessClock'] = None
+        # Номер позиции доски: растёт с каждым ходом/дропом (и при правках фигур извне)
+        self.revision = 0
     
     def init_standard_position(self):
         self.init_from_fen("rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1")
     
     def init_from_fen(self, fen: str):
         """Инициализирует доску из FEN строки"""
+        self.revision += 1
         self._clear()
         self.en_passant_target = None
         parts = fen.split()
@@ -73,6 +78,14 @@ class ChessBoard:
     def get_current_player(self) -> Color:
         return self.current_player
 
+    def pass_turn(self):
+        """Передаёт ход сопернику и переключает часы доски"""
+        mover = self.current_player
+        self.current_player = mover.opponent()
+        self.revision += 1
+        if self.clock is not None:
+            self.clock.press(mover)
+
     def is_square_attacked(self, square: Coordinate, attacker_color: Color) -> bool:
         """
         Проверяет, атакуется ли клетка фигурами цвета attacker_color
@@ -109,23 +122,57 @@ class ChessBoard:
         if king_square is None:
             return False
         
-        # Проверяем все фигуры противоположного цвета
-        opponent_color = king_color.opponent()
-        
-        for file in File:
-            for rank in range(1, 9):
-                coord = Coordinate(file, rank)
-                piece = self.get_piece(coord)                
-                if piece is not None and piece.color == opponent_color:
-                    # Получаем все возможные ходы этой фигуры
-                    possible_moves = piece.get_possible_moves(self)
-                    # Если король находится среди возможных ходов - это шах
-                    if king_square in possible_moves:
-                        return True
-        return False
+        # Шах — это атака на клетку короля; is_square_attacked не строит ходы
+        # пешек и королей (у короля — с проверками рокировки) целиком
+        return self.is_square_attacked(king_square, king_color.opponent())
 
     def move(self, from_coord: Coordinate, to_coord: Coordinate) -> Optional[Piece]:
-        print(f"Ход: {from_coord} → {to_coord}")
+        piece, is_castling, en_passant_capture_coord = self._trial_move(from_coord, to_coord)
+        is_en_passant = en_passant_capture_coord is not None
+        rook_from: Optional[Coordinate] = None
+        rook_to: Optional[Coordinate] = None
+        captured = self.get_piece(to_coord)
+        
+        self.squares[from_coord.get_file_index()][from_coord.get_rank_index()] = None
+        moved_piece = piece.move_to(to_coord)
+        self.squares[to_coord.get_file_index()][to_coord.get_rank_index()] = moved_piece
+
+        # Рокировка
+        if is_castling:
+            rank = from_coord.rank
+            if to_coord.file == File.G:
+                rook_from = Coordinate(File.H, rank)
+                rook_to = Coordinate(File.F, rank)
+            elif to_coord.file == File.C:
+                rook_from = Coordinate(File.A, rank)
+                rook_to = Coordinate(File.D, rank)
+            if rook_from and rook_to:
+                rook_piece = self.get_piece(rook_from)
+                if not isinstance(rook_piece, Rook):
+                    raise ValueError("Недопустимая рокировка: нет ладьи")
+                self.squares[rook_from.get_file_index()][rook_from.get_rank_index()] = None
+                self.squares[rook_to.get_file_index()][rook_to.get_rank_index()] = rook_piece.move_to(rook_to)
+
+        if is_en_passant and en_passant_capture_coord is not None:
+            captured = self.get_piece(en_passant_capture_coord)
+            self.squares[en_passant_capture_coord.get_file_index()][en_passant_capture_coord.get_rank_index()] = None
+
+        self.en_passant_target = None
+        if isinstance(piece, Pawn):
+            start_rank = 2 if piece.color == Color.WHITE else 7
+            if from_coord.rank == start_rank and abs(to_coord.rank - from_coord.rank) == 2:
+                mid_rank = (from_coord.rank + to_coord.rank) // 2
+                self.en_passant_target = Coordinate(from_coord.file, mid_rank)
+        
+        # Смена хода
+        self.pass_turn()
+        return captured
+
+    def _trial_move(self, from_coord: Coordinate, to_coord: Coordinate):
+        """Проверяет ход, не меняя доску (ValueError, если ход невозможен).
+
+        Возвращает (фигура, рокировка ли это, клетка пешки, взятой на проходе).
+        """
         piece = self.get_piece(from_coord)
         if piece is None:
             raise ValueError(f"No piece at {from_coord}")
@@ -196,43 +243,26 @@ class ChessBoard:
             self.squares[rook_to.get_file_index()][rook_to.get_rank_index()] = None
         if king_in_check_after_move:
             raise ValueError(f"Недопустимый ход: после хода король остаётся под шахом")
-        captured = self.get_piece(to_coord)
-        
-        self.squares[from_coord.get_file_index()][from_coord.get_rank_index()] = None
-        moved_piece = piece.move_to(to_coord)
-        self.squares[to_coord.get_file_index()][to_coord.get_rank_index()] = moved_piece
-
-        # Рокировка
-        if is_castling:
-            rank = from_coord.rank
-            if to_coord.file == File.G:
-                rook_from = Coordinate(File.H, rank)
-                rook_to = Coordinate(File.F, rank)
-            elif to_coord.file == File.C:
-                rook_from = Coordinate(File.A, rank)
-                rook_to = Coordinate(File.D, rank)
-            if rook_from and rook_to:
-                rook_piece = self.get_piece(rook_from)
-                if not isinstance(rook_piece, Rook):
-                    raise ValueError("Недопустимая рокировка: нет ладьи")
-                self.squares[rook_from.get_file_index()][rook_from.get_rank_index()] = None
-                self.squares[rook_to.get_file_index()][rook_to.get_rank_index()] = rook_piece.move_to(rook_to)
-
-        if is_en_passant and en_passant_capture_coord is not None:
-            captured = self.get_piece(en_passant_capture_coord)
-            self.squares[en_passant_capture_coord.get_file_index()][en_passant_capture_coord.get_rank_index()] = None
-
-        self.en_passant_target = None
-        if isinstance(piece, Pawn):
-            start_rank = 2 if piece.color == Color.WHITE else 7
-            if from_coord.rank == start_rank and abs(to_coord.rank - from_coord.rank) == 2:
-                mid_rank = (from_coord.rank + to_coord.rank) // 2
-                self.en_passant_target = Coordinate(from_coord.file, mid_rank)
-        
-        # Смена хода
-        self.current_player = self.current_player.opponent()
-        return captured
+        return piece, is_castling, en_passant_capture_coord if is_en_passant else None
 
+    def legal_moves(self) -> Dict[Coordinate, List[Coordinate]]:
+        """Все легальные ходы стороны, чей сейчас ход: клетка фигуры -> клетки назначения"""
+        moves: Dict[Coordinate, List[Coordinate]] = {}
+        for file in range(8):
+            for rank in range(8):
+                piece = self.squares[file][rank]
+                if piece is None or piece.color != self.current_player:
+                    continue
+                targets = []
+                for to_coord in piece.get_possible_moves(self):
+                    try:
+                        self._trial_move(piece.coordinate, to_coord)
+                    except ValueError:
+                        continue
+                    targets.append(to_coord)
+                if targets:
+                    moves[piece.coordinate] = targets
+        return moves
     
     def drop(self, piece_class: type[Piece], color: Color, coord: Coordinate):
         try:
@@ -243,7 +273,7 @@ class ChessBoard:
                 piece = piece_class(coord, color)
             self.place_piece(piece)
             self.en_passant_target = None
-            self.current_player = self.current_player.opponent()
+            self.pass_turn()
         except Exception as e:
             raise RuntimeError(f"Не удалось создать фигуру: {piece_class.__name__}") from e
     
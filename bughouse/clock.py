@@ -0,0 +1,112 @@
+import time
+from typing import Any, Callable, Dict, Optional
+from bughouse.color import Color
+
+
+class ChessClock:
+    """Шахматные часы одной доски (время в миллисекундах).
+
+    Часы стартуют после первого хода на доске. increment_ms добавляется после
+    каждого хода (Фишер), delay_ms — простая задержка: первые delay_ms хода
+    время не списывается.
+    """
+
+    def __init__(
+        self,
+        initial_ms: int,
+        increment_ms: int = 0,
+        delay_ms: int = 0,
+        now: Callable[[], float] = time.monotonic,
+    ):
+        self.initial_ms = initial_ms
+        self.increment_ms = increment_ms
+        self.delay_ms = delay_ms
+        self.remaining: Dict[Color, int] = {Color.WHITE: initial_ms, Color.BLACK: initial_ms}
+        self.running: Optional[Color] = None
+        self.turn_started: Optional[float] = None
+        self._now = now
+
+    def _spent_ms(self, now: float) -> int:
+        if self.running is None or self.turn_started is None:
+            return 0
+        elapsed = int((now - self.turn_started) * 1000)
+        return max(0, elapsed - self.delay_ms)
+
+    def time_left(self, color: Color, now: Optional[float] = None) -> int:
+        """Оставшееся время стороны на момент now (может быть отрицательным после флага)"""
+        if color != self.running:
+            return self.remaining[color]
+        now = self._now() if now is None else now
+        return self.remaining[color] - self._spent_ms(now)
+
+    def press(self, mover: Color, now: Optional[float] = None):
+        """Сторона mover сделала ход и нажимает часы: идёт время соперника"""
+        now = self._now() if now is None else now
+        if self.running is None:
+            # Первый ход на доске — запускаем часы соперника
+            self.running = mover.opponent()
+            self.turn_started = now
+            return
+        self.remaining[mover] = self.remaining[mover] - self._spent_ms(now) + self.increment_ms
+        self.running = mover.opponent()
+        self.turn_started = now
+
+    def stop(self, now: Optional[float] = None):
+        """Останавливает часы (конец партии)"""
+        if self.running is None:
+            return
+        now = self._now() if now is None else now
+        self.remaining[self.running] -= self._spent_ms(now)
+        self.running = None
+        self.turn_started = None
+
+    def deadline(self) -> Optional[float]:
+        """Момент (по часам now), когда у идущей стороны упадёт флаг"""
+        if self.running is None or self.turn_started is None:
+            return None
+        return self.turn_started + (self.remaining[self.running] + self.delay_ms) / 1000
+
+    def flagged(self, now: Optional[float] = None) -> Optional[Color]:
+        """Цвет стороны, у которой упал флаг, или None"""
+        if self.running is None:
+            return None
+        if self.time_left(self.running, now) <= 0:
+            return self.running
+        return None
+
+    def snapshot(self, now: Optional[float] = None) -> Dict[str, Any]:
+        """Показания часов для клиента"""
+        now = self._now() if now is None else now
+        return {
+            "white": max(0, self.time_left(Color.WHITE, now)),
+            "black": max(0, self.time_left(Color.BLACK, now)),
+            "running": self.running.value if self.running else None,
+            "incrementMs": self.increment_ms,
+            "delayMs": self.delay_ms,
+        }
+
+    def to_dict(self, now: Optional[float] = None) -> Dict[str, Any]:
+        """Сериализация для сохранения сессии"""
+        now = self._now() if now is None else now
+        return {
+            "initialMs": self.initial_ms,
+            "incrementMs": self.increment_ms,
+            "delayMs": self.delay_ms,
+            "white": self.remaining[Color.WHITE],
+            "black": self.remaining[Color.BLACK],
+            "running": self.running.value if self.running else None,
+            "turnElapsed": (now - self.turn_started) if self.turn_started is not None else 0.0,
+            # Монотонные часы между процессами не переносятся — запоминаем настенное время
+            "savedAt": time.time(),
+        }
+
+    @staticmethod
+    def from_dict(data: Dict[str, Any], now: Callable[[], float] = time.monotonic) -> 'ChessClock':
+        clock = ChessClock(data["initialMs"], data["incrementMs"], data["delayMs"], now=now)
+        clock.remaining[Color.WHITE] = data["white"]
+        clock.remaining[Color.BLACK] = data["black"]
+        if data.get("running"):
+            clock.running = Color(data["running"])
+            away = max(0.0, time.time() - data["savedAt"])
+            clock.turn_started = now() - data["turnElapsed"] - away
+        return clock
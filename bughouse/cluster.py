@@ -0,0 +1,433 @@
+import asyncio
+import itertools
+import json
+import logging
+import multiprocessing
+import os
+import re
+import tempfile
+import time
+import zlib
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, urlsplit
+
+from bughouse.fanout import FANOUT_SOCKET_ENV, FanoutBroker
+from bughouse.metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE
+
+
+logger = logging.getLogger(__name__)
+
+
+SHARD_INDEX_ENV = "BUGHOUSE_SHARD_INDEX"
+SHARD_COUNT_ENV = "BUGHOUSE_SHARD_COUNT"
+
+MAX_HEAD_SIZE = 64 * 1024
+PIPE_CHUNK_SIZE = 64 * 1024
+# Тело с Transfer-Encoding: chunked собирается целиком (нужно для маршрутизации);
+# API принимает только небольшие JSON, больше не буферизуем
+MAX_CHUNKED_BODY_SIZE = 1024 * 1024
+
+
+def shard_for(key: str, shard_count: int) -> int:
+    """Номер шарда для ключа (id сессии или токена). Одинаков во всех процессах."""
+    if shard_count <= 1:
+        return 0
+    return zlib.crc32(key.encode("utf-8")) % shard_count
+
+
+def current_shard() -> Tuple[int, int]:
+    """(номер шарда, число шардов) текущего воркера; (0, 1) без кластера"""
+    return int(os.getenv(SHARD_INDEX_ENV, "0")), int(os.getenv(SHARD_COUNT_ENV, "1"))
+
+
+def _parse_head(head: bytes) -> Tuple[str, str, List[Tuple[str, str]]]:
+    lines = head.decode("latin-1").split("\r\n")
+    method, target, _ = lines[0].split(" ", 2)
+    headers = []
+    for line in lines[1:]:
+        if not line:
+            continue
+        name, _, value = line.partition(":")
+        headers.append((name.strip(), value.strip()))
+    return method, target, headers
+
+
+def _header(headers: List[Tuple[str, str]], name: str) -> Optional[str]:
+    for key, value in headers:
+        if key.lower() == name:
+            return value
+    return None
+
+
+def _build_head(first_line: str, headers: List[Tuple[str, str]]) -> bytes:
+    lines = [first_line] + [f"{k}: {v}" for k, v in headers]
+    return ("\r\n".join(lines) + "\r\n\r\n").encode("latin-1")
+
+
+# Пути, где ключ маршрутизации — последний сегмент (id из new_shard_key владельца):
+# /ws/{token}, /ws/analyze/{jobId}, /api/archive/{sessionId}, /api/analyze/{jobId}
+KEYED_PATHS = ("/ws/", "/api/archive/", "/api/analyze/")
+# Позиция в теле POST /api/analyze: по ней выбирается воркер, чтобы одинаковые
+# позиции считались один раз на весь кластер
+ANALYZE_PATH = "/api/analyze"
+POSITION_FIELDS = ("boardA", "boardB", "reserves")
+# Пути, которые маршрутизатор сам опрашивает на всех воркерах и сводит в один ответ
+METRICS_PATH = "/metrics"
+STATS_PATH = "/api/stats"
+AGGREGATED_PATHS = (METRICS_PATH, STATS_PATH)
+
+
+def extract_token(target: str, body: bytes) -> Optional[str]:
+    """Достаёт ключ маршрутизации: последний сегмент пути (KEYED_PATHS),
+    параметр ?token=, "token" JSON-тела или позицию тела /api/analyze"""
+    parts = urlsplit(target)
+    if parts.path.startswith(KEYED_PATHS):
+        return parts.path.rsplit("/", 1)[-1] or None
+    token = parse_qs(parts.query).get("token")
+    if token:
+        return token[0]
+    if body:
+        try:
+            payload = json.loads(body)
+        except ValueError:
+            return None
+        if not isinstance(payload, dict):
+            return None
+        if isinstance(payload.get("token"), str):
+            return payload["token"]
+        if parts.path == ANALYZE_PATH:
+            # Без нормализации Game: одна позиция в разной записи может попасть на разные воркеры
+            return json.dumps({key: payload.get(key) for key in POSITION_FIELDS}, sort_keys=True)
+    return None
+
+
+class BadRequest(Exception):
+    """Запрос, который маршрутизатор не может переслать; args — (статус, причина)"""
+
+
+async def _read_chunked(reader: asyncio.StreamReader, limit: int = MAX_CHUNKED_BODY_SIZE) -> bytes:
+    """Собирает тело с Transfer-Encoding: chunked (трейлеры отбрасываются)"""
+    body = bytearray()
+    try:
+        while True:
+            size_line = await reader.readuntil(b"\r\n")
+            try:
+                size = int(size_line.split(b";", 1)[0].strip(), 16)
+            except ValueError:
+                raise BadRequest(400, "Bad Request")
+            if size < 0:
+                raise BadRequest(400, "Bad Request")
+            if size == 0:
+                break
+            if len(body) + size > limit:
+                raise BadRequest(413, "Payload Too Large")
+            body += await reader.readexactly(size)
+            if await reader.readexactly(2) != b"\r\n":
+                raise BadRequest(400, "Bad Request")
+        while await reader.readuntil(b"\r\n") != b"\r\n":
+            pass
+    except asyncio.LimitOverrunError:
+        raise BadRequest(400, "Bad Request")
+    return bytes(body)
+
+
+async def _read_body(reader: asyncio.StreamReader, headers: List[Tuple[str, str]]) -> Tuple[bytes, List[Tuple[str, str]]]:
+    """Тело запроса и заголовки для воркера: chunked-тело пересылается с Content-Length"""
+    transfer_encoding = _header(headers, "transfer-encoding")
+    if transfer_encoding is None:
+        try:
+            content_length = int(_header(headers, "content-length") or 0)
+        except ValueError:
+            raise BadRequest(400, "Bad Request")
+        return (await reader.readexactly(content_length) if content_length > 0 else b""), headers
+    if transfer_encoding.lower() != "chunked":
+        raise BadRequest(501, "Not Implemented")
+    body = await _read_chunked(reader)
+    headers = [(k, v) for k, v in headers if k.lower() not in ("transfer-encoding", "content-length")]
+    headers.append(("Content-Length", str(len(body))))
+    return body, headers
+
+
+def _response(status: int, reason: str, body: bytes = b"", content_type: str = "text/plain; charset=utf-8",
+              close: bool = False) -> bytes:
+    headers = [("Content-Type", content_type), ("Content-Length", str(len(body)))]
+    if close:
+        headers.append(("Connection", "close"))
+    return _build_head(f"HTTP/1.1 {status} {reason}", headers) + body
+
+
+# Строка значения Prometheus: имя, необязательные метки, остаток (значение и метка времени)
+_SAMPLE_RE = re.compile(r"^([A-Za-z_:][A-Za-z0-9_:]*)(?:\{(.*)\})?(\s.*)$")
+
+
+def merge_metrics(texts: Dict[int, str]) -> str:
+    """Сводит /metrics воркеров в одну выдачу: HELP/TYPE каждой метрики один
+    раз, у каждого значения — метка shard с номером воркера"""
+    families: Dict[str, Tuple[List[str], List[str]]] = {}
+    for shard, text in sorted(texts.items()):
+        samples: Optional[List[str]] = None
+        for line in text.splitlines():
+            if line.startswith(("# HELP ", "# TYPE ")):
+                header, samples = families.setdefault(line.split(" ", 3)[2], ([], []))
+                if line not in header:
+                    header.append(line)
+                continue
+            match = _SAMPLE_RE.match(line)
+            if match is None or samples is None:
+                continue
+            name, labels, rest = match.groups()
+            labels = f'shard="{shard}"' + ("," + labels if labels else "")
+            samples.append(f"{name}{{{labels}}}{rest}")
+    lines = []
+    for header, samples in families.values():
+        lines.extend(header)
+        lines.extend(samples)
+    return "\n".join(lines) + "\n"
+
+
+def merge_stats(stats: Dict[int, dict]) -> dict:
+    """Сводит /api/stats воркеров: счётчики складываются, максимумы берутся
+    наибольшие, среднее пересчитывается по числу возвратов сессий. Сами
+    ответы воркеров — в "shards" по номерам."""
+    merged: dict = {}
+    for item in stats.values():
+        for key, value in item.items():
+            if not isinstance(value, (int, float)) or isinstance(value, bool):
+                continue
+            if key.endswith("MaxMs"):
+                merged[key] = max(merged.get(key, 0), value)
+            elif not key.endswith("AvgMs"):
+                merged[key] = merged.get(key, 0) + value
+    rehydrations = merged.get("rehydrations", 0)
+    if any("rehydrationAvgMs" in item for item in stats.values()):
+        total = sum(item.get("rehydrationAvgMs", 0) * item.get("rehydrations", 0) for item in stats.values())
+        merged["rehydrationAvgMs"] = total / rehydrations if rehydrations else 0.0
+    merged["shards"] = {str(shard): item for shard, item in sorted(stats.items())}
+    return merged
+
+
+async def _pipe(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+    try:
+        while True:
+            data = await reader.read(PIPE_CHUNK_SIZE)
+            if not data:
+                break
+            writer.write(data)
+            await writer.drain()
+    except (ConnectionError, asyncio.IncompleteReadError):
+        pass
+    finally:
+        try:
+            if writer.can_write_eof():
+                writer.write_eof()
+        except (OSError, RuntimeError):
+            pass
+
+
+class ShardRouter:
+    """Фронтенд-маршрутизатор: TCP-клиенты -> воркеры на unix-сокетах.
+
+    Запросы с токеном уходят воркеру, владеющему сессией токена; запросы без
+    токена (статика, /api/start) распределяются по кругу. GET /metrics и
+    /api/stats маршрутизатор отправляет всем воркерам и сводит ответы
+    (merge_metrics, merge_stats). Тело с Transfer-Encoding: chunked
+    собирается и пересылается воркеру с Content-Length. Клиентское
+    keep-alive соединение сохраняется, а к воркеру каждый запрос идёт по
+    отдельному unix-соединению, поэтому маршрутизация идёт по запросу.
+    WebSocket после Upgrade просто проксируется в обе стороны.
+    """
+
+    def __init__(self, socket_paths: List[str]):
+        self.socket_paths = socket_paths
+        self._round_robin = itertools.cycle(range(len(socket_paths)))
+
+    def route(self, target: str, body: bytes) -> int:
+        token = extract_token(target, body)
+        if token is None:
+            return next(self._round_robin)
+        return shard_for(token, len(self.socket_paths))
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                try:
+                    head = await reader.readuntil(b"\r\n\r\n")
+                except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError):
+                    break
+                first_line = head.split(b"\r\n", 1)[0].decode("latin-1")
+                method, target, headers = _parse_head(head)
+                try:
+                    body, headers = await _read_body(reader, headers)
+                except BadRequest as e:
+                    status, reason = e.args
+                    writer.write(_response(status, reason, reason.encode(), close=True))
+                    await writer.drain()
+                    break
+                is_upgrade = (_header(headers, "upgrade") or "").lower() == "websocket"
+
+                if method == "GET" and not is_upgrade and urlsplit(target).path in AGGREGATED_PATHS:
+                    writer.write(await self._aggregate(target))
+                    await writer.drain()
+                    continue
+
+                shard = self.route(target, body)
+                up_reader, up_writer = await asyncio.open_unix_connection(self.socket_paths[shard])
+                try:
+                    if is_upgrade:
+                        up_writer.write(_build_head(first_line, headers) + body)
+                        await up_writer.drain()
+                        await asyncio.gather(_pipe(reader, up_writer), _pipe(up_reader, writer))
+                        return
+                    headers = [(k, v) for k, v in headers if k.lower() != "connection"]
+                    headers.append(("Connection", "close"))
+                    up_writer.write(_build_head(first_line, headers) + body)
+                    await up_writer.drain()
+                    keep_alive = await self._relay_response(up_reader, writer)
+                finally:
+                    up_writer.close()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def _fetch(self, shard: int, target: str) -> bytes:
+        """Тело ответа воркера на GET target"""
+        up_reader, up_writer = await asyncio.open_unix_connection(self.socket_paths[shard])
+        try:
+            up_writer.write(_build_head(f"GET {target} HTTP/1.1", [("Host", "localhost"), ("Connection", "close")]))
+            await up_writer.drain()
+            head = await up_reader.readuntil(b"\r\n\r\n")
+            status = int(head.split(b" ", 2)[1])
+            if status != 200:
+                raise ConnectionError(f"HTTP {status}")
+            # Connection: close — тело идёт до конца соединения
+            return await up_reader.read()
+        finally:
+            up_writer.close()
+
+    async def _aggregate(self, target: str) -> bytes:
+        """Сводный ответ на GET /metrics или /api/stats со всех воркеров; не
+        ответившие воркеры пропускаются"""
+        results = await asyncio.gather(*(self._fetch(shard, target) for shard in range(len(self.socket_paths))),
+                                       return_exceptions=True)
+        bodies = {}
+        for shard, result in enumerate(results):
+            if isinstance(result, Exception):
+                logger.warning("Воркер %d не ответил на %s: %s", shard, target, result)
+            else:
+                bodies[shard] = result
+        if not bodies:
+            return _response(502, "Bad Gateway", b"Bad Gateway")
+        if urlsplit(target).path == METRICS_PATH:
+            text = merge_metrics({shard: body.decode("utf-8") for shard, body in bodies.items()})
+            return _response(200, "OK", text.encode("utf-8"), f"{METRICS_CONTENT_TYPE}; charset=utf-8")
+        stats = merge_stats({shard: json.loads(body) for shard, body in bodies.items()})
+        return _response(200, "OK", json.dumps(stats).encode("utf-8"), "application/json")
+
+    async def _relay_response(self, up_reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> bool:
+        """Пересылает ответ воркера; возвращает True, если клиентское соединение можно переиспользовать"""
+        head = await up_reader.readuntil(b"\r\n\r\n")
+        lines = head.decode("latin-1").split("\r\n")
+        status_line, headers = lines[0], []
+        for line in lines[1:]:
+            if line:
+                name, _, value = line.partition(":")
+                headers.append((name.strip(), value.strip()))
+        framed = _header(headers, "content-length") is not None or \
+            (_header(headers, "transfer-encoding") or "").lower() == "chunked"
+        if framed:
+            headers = [(k, v) for k, v in headers if k.lower() != "connection"]
+        writer.write(_build_head(status_line, headers))
+        while True:
+            data = await up_reader.read(PIPE_CHUNK_SIZE)
+            if not data:
+                break
+            writer.write(data)
+            await writer.drain()
+        return framed
+
+
+def _run_worker(index: int, count: int, socket_path: str, app_path: str, fanout_socket: str):
+    os.environ[SHARD_INDEX_ENV] = str(index)
+    os.environ[SHARD_COUNT_ENV] = str(count)
+    os.environ[FANOUT_SOCKET_ENV] = fanout_socket
+    import uvicorn
+    uvicorn.run(app_path, uds=socket_path, log_level="warning")
+
+
+class Supervisor:
+    """Запускает N воркеров uvicorn (по шарду сессий на каждый), брокер рассылки и маршрутизатор перед ними"""
+
+    def __init__(self, workers: int, app_path: str = "bughouse.web_server:app", socket_dir: Optional[str] = None):
+        self.workers = workers
+        self.app_path = app_path
+        self.socket_dir = socket_dir or tempfile.mkdtemp(prefix="bughouse-")
+        self.socket_paths = [os.path.join(self.socket_dir, f"worker-{i}.sock") for i in range(workers)]
+        self.fanout_socket = os.path.join(self.socket_dir, "fanout.sock")
+        self.processes: Dict[int, multiprocessing.Process] = {}
+        self._ctx = multiprocessing.get_context("spawn")
+
+    def _spawn(self, index: int):
+        path = self.socket_paths[index]
+        if os.path.exists(path):
+            os.remove(path)
+        process = self._ctx.Process(
+            target=_run_worker,
+            args=(index, self.workers, path, self.app_path, self.fanout_socket),
+            name=f"bughouse-worker-{index}",
+            # Не daemon: воркеру нужны свои пулы процессов (боты, анализ, индекс);
+            # останавливает воркеры stop()
+            daemon=False,
+        )
+        process.start()
+        self.processes[index] = process
+
+    async def _wait_for_sockets(self, timeout: float = 30.0):
+        deadline = time.monotonic() + timeout
+        while not all(os.path.exists(p) for p in self.socket_paths):
+            if time.monotonic() > deadline:
+                raise RuntimeError("Воркеры не запустились")
+            await asyncio.sleep(0.05)
+
+    async def _monitor(self):
+        while True:
+            await asyncio.sleep(1.0)
+            for index, process in list(self.processes.items()):
+                if not process.is_alive():
+                    logger.warning("Воркер %d завершился (код %s), перезапуск", index, process.exitcode)
+                    self._spawn(index)
+
+    async def serve(self, host: str, port: int):
+        broker = FanoutBroker(self.fanout_socket)
+        await broker.start()
+        for index in range(self.workers):
+            self._spawn(index)
+        await self._wait_for_sockets()
+        router = ShardRouter(self.socket_paths)
+        server = await asyncio.start_server(router.handle, host, port, limit=MAX_HEAD_SIZE)
+        monitor = asyncio.create_task(self._monitor())
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            monitor.cancel()
+            self.stop()
+            await broker.stop()
+
+    def stop(self):
+        for process in self.processes.values():
+            if process.is_alive():
+                process.terminate()
+        for process in self.processes.values():
+            process.join(timeout=5)
+
+
+def run_cluster(host: str, port: int, workers: int):
+    """Запуск в многопроцессном режиме"""
+    supervisor = Supervisor(workers)
+    try:
+        asyncio.run(supervisor.serve(host, port))
+    except KeyboardInterrupt:
+        supervisor.stop()
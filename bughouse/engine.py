@@ -0,0 +1,605 @@
+"""Движок для свободных мест за доской.
+
+Negamax с альфа-бета отсечением, итеративным углублением и жёстким
+лимитом времени на ход. Позиции запоминаются в таблице транспозиций,
+ходы сортируются: ход из таблицы, взятия (ценная жертва, дешёвый
+нападающий), дропы у королей, остальные ходы. Перебирается только своя
+доска, вторая считается неподвижной; в оценку входят фигуры на доске и
+запасы (PiecesReserve) обоих игроков этой доски.
+
+Варианты разыгрываются на копиях Game теми же make_move/make_drop, что и
+ходы людей, поэтому движок не может сделать ход, который сервер не примет.
+Поиск рассчитан на отдельный процесс (choose_action принимает и
+возвращает простые словари), чтобы не занимать цикл событий сервера.
+
+ParallelSearch делит корень между процессами пула: первый ход каждой
+итерации считается отдельно и задаёт альфу, остальные — параллельно с
+лучшей известной на момент отправки альфой. Процессы делят таблицу
+транспозиций в общей памяти (SharedTable).
+"""
+import hashlib
+import multiprocessing
+import os
+import struct
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from multiprocessing import shared_memory
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from bughouse.color import Color
+from bughouse.coordinate import Coordinate
+from bughouse.figures import Pawn, Knight, Bishop, Rook, Queen, King
+from bughouse.game import Game, PromotionRequired
+from bughouse.pieces_reserve import PiecesReserve
+
+
+PIECE_VALUES: Dict[type, int] = {Pawn: 100, Knight: 300, Bishop: 320, Rook: 500, Queen: 900, King: 0}
+RESERVE_SYMBOLS: Dict[str, type] = {"P": Pawn, "N": Knight, "B": Bishop, "R": Rook, "Q": Queen}
+# Фигура в запасе стоит чуть меньше фигуры на доске: движок охотнее вводит её в игру
+RESERVE_WEIGHT = 0.9
+# Бонус за близость фигуры (кроме короля) к центру, по файлу/горизонтали индекса 0..7
+CENTER_BONUS = [0, 4, 8, 12, 12, 8, 4, 0]
+MATE_SCORE = 1_000_000
+MAX_DEPTH = 16
+
+# Таблица транспозиций живёт в процессе поиска между ходами; при переполнении очищается
+TABLE_LIMIT = 200_000
+_TABLE: Dict[str, Tuple[int, int, int, Optional[Dict[str, Any]]]] = {}
+EXACT, LOWER, UPPER = 0, 1, 2
+# Размер общей таблицы ParallelSearch, слотов по 16 байт
+SHARED_TABLE_SLOTS = 1 << 20
+
+
+class SearchTimeout(Exception):
+    pass
+
+
+def opponent_id(game: Game, player_id: int) -> int:
+    return int(game.get_player(player_id).get_opponent_player_id())
+
+
+def reserve_value(reserve: PiecesReserve) -> int:
+    return sum(PIECE_VALUES[cls] * reserve.get_count(cls) for cls in RESERVE_SYMBOLS.values())
+
+
+def evaluate(game: Game, player_id: int) -> int:
+    """Оценка с точки зрения player_id: материал и центр на его доске, запасы обоих игроков доски"""
+    player = game.get_player(player_id)
+    opponent = game.players[opponent_id(game, player_id)]
+    score = 0
+    for file, column in enumerate(player.board.squares):
+        for rank, piece in enumerate(column):
+            if piece is not None:
+                value = PIECE_VALUES[type(piece)]
+                if value:
+                    value += min(CENTER_BONUS[file], CENTER_BONUS[rank])
+                score += value if piece.color == player.color else -value
+    score += int(RESERVE_WEIGHT * (reserve_value(player.pieces_reserve) - reserve_value(opponent.pieces_reserve)))
+    return score
+
+
+def position_key(game: Game, player_id: int) -> str:
+    """Ключ таблицы транспозиций: доска (без счётчиков ходов) и запасы игроков доски"""
+    player = game.get_player(player_id)
+    opponent = game.players[opponent_id(game, player_id)]
+    fen = " ".join(player.board.to_fen().split()[:4])
+    reserves = "/".join(
+        "".join(str(p.pieces_reserve.get_count(cls)) + "," for cls in RESERVE_SYMBOLS.values())
+        for p in (player, opponent)
+    )
+    return f"{player_id}|{fen}|{reserves}"
+
+
+def _king_zone(board, color: Color) -> List[Coordinate]:
+    king = board.find_king(color)
+    if king is None:
+        return []
+    zone = []
+    for df in (-1, 0, 1):
+        for dr in (-1, 0, 1):
+            target = Coordinate.try_shift(king, df, dr)
+            if target is not None and board.is_empty(target):
+                zone.append(target)
+    return zone
+
+
+def _attacked_squares(board, color: Color) -> Set[Coordinate]:
+    """Клетки, которые бьют фигуры цвета color (пешки — только по диагонали)"""
+    attacked: Set[Coordinate] = set()
+    direction = 1 if color == Color.WHITE else -1
+    for column in board.squares:
+        for piece in column:
+            if piece is None or piece.color != color:
+                continue
+            if isinstance(piece, Pawn):
+                for df in (-1, 1):
+                    target = Coordinate.try_shift(piece.coordinate, df, direction)
+                    if target is not None:
+                        attacked.add(target)
+            elif isinstance(piece, King):
+                for df in (-1, 0, 1):
+                    for dr in (-1, 0, 1):
+                        target = Coordinate.try_shift(piece.coordinate, df, dr)
+                        if target is not None and (df or dr):
+                            attacked.add(target)
+            else:
+                attacked.update(piece.get_possible_moves(board))
+    return attacked
+
+
+def candidate_actions(game: Game, player_id: int) -> List[Dict[str, Any]]:
+    """Ходы для перебора, уже отсортированные: взятия, дропы, тихие ходы.
+
+    Под шахом берутся точные легальные ходы Game.legal_moves. Иначе —
+    возможные ходы фигур (легальность проверит make_move) и дропы только
+    рядом с королями: любой фигурой у чужого короля и самой дешёвой у
+    своего — дропы в остальные клетки почти никогда не решают. Дропы под
+    бой на незащищённую клетку отбрасываются: на малой глубине поиск не
+    видит, что фигуру просто съедят.
+    """
+    player = game.get_player(player_id)
+    board = player.board
+    if board.is_king_in_check(player.color):
+        hints = game.legal_moves(player_id)
+        moves = [(Coordinate.from_notation(src), Coordinate.from_notation(dst))
+                 for src, targets in hints["moves"].items() for dst in targets]
+        drops = [(symbol, Coordinate.from_notation(square))
+                 for symbol, squares in hints["drops"].items() for square in squares]
+    else:
+        moves = []
+        for column in board.squares:
+            for piece in column:
+                if piece is not None and piece.color == player.color:
+                    moves.extend((piece.coordinate, dst) for dst in piece.get_possible_moves(board))
+        available = [s for s, cls in RESERVE_SYMBOLS.items() if player.pieces_reserve.get_count(cls) > 0]
+        drops = []
+        if available:
+            attacked = _attacked_squares(board, player.color.opponent())
+            defended = _attacked_squares(board, player.color)
+            for square in _king_zone(board, player.color.opponent()):
+                if square not in attacked or square in defended:
+                    drops.extend((symbol, square) for symbol in available)
+            for square in _king_zone(board, player.color):
+                if square not in attacked or square in defended:
+                    drops.append((available[0], square))
+
+    captures: List[Tuple[int, Dict[str, Any]]] = []
+    quiet: List[Dict[str, Any]] = []
+    for src, dst in moves:
+        action = {"type": "move", "from": str(src), "to": str(dst)}
+        target = board.get_piece(dst)
+        if target is not None:
+            attacker = board.get_piece(src)
+            captures.append((PIECE_VALUES[type(target)] * 10 - PIECE_VALUES[type(attacker)], action))
+        else:
+            quiet.append(action)
+    captures.sort(key=lambda item: -item[0])
+    drop_actions = [{"type": "drop", "piece": symbol, "square": str(square)}
+                    for symbol, square in drops
+                    if not (symbol == "P" and square.rank in (1, 8))]
+    # Дорогие фигуры первыми: у чужого короля они чаще дают шах
+    drop_actions.sort(key=lambda a: -PIECE_VALUES[RESERVE_SYMBOLS[a["piece"]]])
+    return [a for _, a in captures] + drop_actions + quiet
+
+
+def apply_action(game: Game, player_id: int, action: Dict[str, Any]) -> Optional[Game]:
+    """Копия game после действия или None, если make_move/make_drop его не принял.
+
+    Для превращения без выбранной жертвы забирается самая ценная из
+    предложенных фигур; выбор дописывается в action.
+    """
+    child = game.copy()
+    try:
+        if action["type"] == "drop":
+            child.make_drop(player_id, action["piece"], action["square"])
+            return child
+        try:
+            child.make_move(player_id, action["from"], action["to"],
+                            victim_player_id=action.get("victimPlayerId"),
+                            victim_square=action.get("victimSquare"))
+        except PromotionRequired as pr:
+            # Позиция не изменилась: выбираем жертву и повторяем ход
+            best = max(pr.options, key=lambda o: PIECE_VALUES[RESERVE_SYMBOLS[o["piece"]]])
+            action["victimPlayerId"] = pr.victim_player_id
+            action["victimSquare"] = best["square"]
+            child.make_move(player_id, action["from"], action["to"],
+                            victim_player_id=pr.victim_player_id, victim_square=best["square"])
+    except (ValueError, PromotionRequired):
+        return None
+    return child
+
+
+class SharedTable:
+    """Таблица транспозиций в общей памяти для процессов ParallelSearch.
+
+    Слот — два 64-битных слова: (хеш ключа ^ данные, данные). Пишут без
+    блокировок; если два процесса записали слот одновременно и слова
+    перемешались, xor не сойдётся с хешем и запись просто не найдётся.
+    Данные: оценка, глубина, тип границы и лучший ход (без жертвы
+    превращения — её заново выберет apply_action). Слот замещается,
+    если в нём другая позиция или та же, но с меньшей глубиной.
+    """
+    SLOT = struct.Struct("<QQ")
+    ACTION_PIECES = "PNBRQ"
+
+    def __init__(self, slots: int = SHARED_TABLE_SLOTS, name: Optional[str] = None):
+        self.slots = slots
+        self.memory = shared_memory.SharedMemory(name=name, create=name is None, size=slots * self.SLOT.size)
+        self.owner = name is None
+
+    @staticmethod
+    def _hash(key: str) -> int:
+        # hash() строк в каждом процессе свой, нужен одинаковый для всех
+        return int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), "little")
+
+    @staticmethod
+    def _square(notation: str) -> int:
+        return (ord(notation[0]) - ord("a")) * 8 + int(notation[1]) - 1
+
+    @staticmethod
+    def _notation(index: int) -> str:
+        return chr(ord("a") + index // 8) + str(index % 8 + 1)
+
+    def _pack(self, depth: int, score: int, flag: int, action: Optional[Dict[str, Any]]) -> int:
+        kind = a = b = 0
+        if action is not None:
+            if action["type"] == "drop":
+                kind, a, b = 2, self.ACTION_PIECES.index(action["piece"]), self._square(action["square"])
+            else:
+                kind, a, b = 1, self._square(action["from"]), self._square(action["to"])
+        return ((score + (1 << 31)) | min(depth, 255) << 32 | flag << 40 | kind << 42 | a << 44 | b << 50)
+
+    def _unpack(self, data: int) -> Tuple[int, int, int, Optional[Dict[str, Any]]]:
+        score = (data & 0xFFFFFFFF) - (1 << 31)
+        depth, flag, kind = data >> 32 & 0xFF, data >> 40 & 0x3, data >> 42 & 0x3
+        a, b = data >> 44 & 0x3F, data >> 50 & 0x3F
+        action = None
+        if kind == 1:
+            action = {"type": "move", "from": self._notation(a), "to": self._notation(b)}
+        elif kind == 2:
+            action = {"type": "drop", "piece": self.ACTION_PIECES[a], "square": self._notation(b)}
+        return depth, score, flag, action
+
+    def get(self, key: str) -> Optional[Tuple[int, int, int, Optional[Dict[str, Any]]]]:
+        hashed = self._hash(key)
+        check, data = self.SLOT.unpack_from(self.memory.buf, hashed % self.slots * self.SLOT.size)
+        if data == 0 or check ^ data != hashed:
+            return None
+        return self._unpack(data)
+
+    def __setitem__(self, key: str, entry: Tuple[int, int, int, Optional[Dict[str, Any]]]):
+        hashed = self._hash(key)
+        offset = hashed % self.slots * self.SLOT.size
+        check, data = self.SLOT.unpack_from(self.memory.buf, offset)
+        if data and check ^ data == hashed and (data >> 32 & 0xFF) > entry[0]:
+            return
+        data = self._pack(*entry)
+        self.SLOT.pack_into(self.memory.buf, offset, hashed ^ data, data)
+
+    def clear(self):
+        self.memory.buf[:] = bytes(self.memory.size)
+
+    def close(self):
+        self.memory.close()
+        if self.owner:
+            self.memory.unlink()
+
+
+class Searcher:
+    def __init__(self, game: Game, player_id: int, deadline: float, table=None):
+        """table — dict или SharedTable; по умолчанию таблица процесса _TABLE"""
+        self.game = game
+        self.player_id = player_id
+        self.deadline = deadline
+        self.table = _TABLE if table is None else table
+        self.nodes = 0
+        self.depth = 0
+        self._partial_best: Optional[Dict[str, Any]] = None
+
+    def _check_time(self):
+        if time.perf_counter() >= self.deadline:
+            raise SearchTimeout()
+
+    def search(self, max_depth: int = MAX_DEPTH) -> Tuple[Optional[Dict[str, Any]], int]:
+        """Лучшее действие и его оценка; при нехватке времени — результат последней полной глубины"""
+        actions = candidate_actions(self.game, self.player_id)
+        best: Optional[Dict[str, Any]] = None
+        best_score = 0
+        for depth in range(1, max_depth + 1):
+            if best is not None:
+                # Лучший ход прошлой итерации смотрим первым
+                actions.remove(best)
+                actions.insert(0, best)
+            try:
+                score, action, actions = self._root(depth, actions)
+            except SearchTimeout:
+                break
+            if action is None:
+                break
+            best, best_score, self.depth = action, score, depth
+            if abs(score) >= MATE_SCORE - MAX_DEPTH:
+                break
+        if best is None:
+            best = self._partial_best or self._first_legal(actions)
+        return best, best_score
+
+    def _root(self, depth: int, actions: List[Dict[str, Any]]):
+        alpha = -MATE_SCORE - 1
+        best: Optional[Dict[str, Any]] = None
+        legal: List[Dict[str, Any]] = []
+        for action in actions:
+            score = self.score_root_action(action, depth, alpha)
+            if score is None:
+                continue
+            legal.append(action)
+            if best is None or score > alpha:
+                alpha, best = score, action
+                if depth == 1:
+                    self._partial_best = action
+        # Непринятые ходы больше не перебираем
+        return alpha, best, legal
+
+    def score_root_action(self, action: Dict[str, Any], depth: int, alpha: int) -> Optional[int]:
+        """Оценка корневого хода на глубину depth (не выше alpha — только граница); None, если ход не принят"""
+        self._check_time()
+        child = apply_action(self.game, self.player_id, action)
+        if child is None:
+            return None
+        return self._score_child(child, opponent_id(self.game, self.player_id), depth - 1,
+                                 -MATE_SCORE - 1, -alpha, 1)
+
+    def _score_child(self, child: Game, to_move: int, depth: int, alpha: int, beta: int, ply: int) -> int:
+        """Оценка позиции после хода с точки зрения того, кто его сделал (соперника to_move)"""
+        game_over = child.check_game_over()
+        if game_over is not None:
+            mover = opponent_id(child, to_move)
+            return MATE_SCORE - ply if mover in game_over["team"] else -(MATE_SCORE - ply)
+        return -self._negamax(child, to_move, depth, alpha, beta, ply)
+
+    def _negamax(self, game: Game, player_id: int, depth: int, alpha: int, beta: int, ply: int) -> int:
+        self.nodes += 1
+        if depth <= 0:
+            return evaluate(game, player_id)
+        key = position_key(game, player_id)
+        entry = self.table.get(key)
+        tt_action = None
+        if entry is not None:
+            entry_depth, entry_score, flag, tt_action = entry
+            if entry_depth >= depth:
+                if flag == EXACT:
+                    return entry_score
+                if flag == LOWER:
+                    alpha = max(alpha, entry_score)
+                elif flag == UPPER:
+                    beta = min(beta, entry_score)
+                if alpha >= beta:
+                    return entry_score
+
+        original_alpha = alpha
+        actions = candidate_actions(game, player_id)
+        if tt_action is not None and tt_action in actions:
+            actions.remove(tt_action)
+            actions.insert(0, tt_action)
+        opponent = opponent_id(game, player_id)
+        best_score: Optional[int] = None
+        best_action: Optional[Dict[str, Any]] = None
+        for action in actions:
+            self._check_time()
+            child = apply_action(game, player_id, action)
+            if child is None:
+                continue
+            score = self._score_child(child, opponent, depth - 1, -beta, -alpha, ply + 1)
+            if best_score is None or score > best_score:
+                best_score, best_action = score, action
+            alpha = max(alpha, score)
+            if alpha >= beta:
+                break
+        if best_score is None:
+            # Ходов нет: под шахом это мат, иначе считаем позицию равной
+            player = game.get_player(player_id)
+            return -(MATE_SCORE - ply) if player.board.is_king_in_check(player.color) else 0
+
+        if best_score <= original_alpha:
+            flag = UPPER
+        elif best_score >= beta:
+            flag = LOWER
+        else:
+            flag = EXACT
+        self.table[key] = (depth, best_score, flag, best_action)
+        return best_score
+
+    def _first_legal(self, actions: List[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+        """Время вышло раньше, чем нашёлся хоть один ход: берём первый принятый без оценки"""
+        for action in actions + self._all_legal():
+            if apply_action(self.game, self.player_id, action) is not None:
+                return action
+        return None
+
+    def _all_legal(self) -> List[Dict[str, Any]]:
+        hints = self.game.legal_moves(self.player_id)
+        return [{"type": "move", "from": src, "to": dst} for src, targets in hints["moves"].items() for dst in targets] + \
+            [{"type": "drop", "piece": piece, "square": square}
+             for piece, squares in hints["drops"].items() for square in squares]
+
+
+def choose_action(position: Dict[str, Any], player_id: int, move_time: float,
+                  max_depth: int = MAX_DEPTH) -> Dict[str, Any]:
+    """Точка входа для процесса поиска: позиция Game.to_fen_dict -> выбранное действие.
+
+    Возвращает {"action": действие или None, "score", "depth", "nodes", "ms"}.
+    """
+    started = time.perf_counter()
+    if len(_TABLE) > TABLE_LIMIT:
+        _TABLE.clear()
+    game = Game()
+    game.from_fen_dict(position)
+    searcher = Searcher(game, player_id, started + move_time)
+    action, score = searcher.search(max_depth)
+    return {
+        "action": action,
+        "score": score,
+        "depth": searcher.depth,
+        "nodes": searcher.nodes,
+        "ms": (time.perf_counter() - started) * 1000,
+    }
+
+
+def analyze_position(position: Dict[str, Any], move_time: float) -> Dict[str, Any]:
+    """Анализ обеих досок: лучший ход той стороны, чья очередь, по move_time на доску.
+
+    {"boards": {"A": результат choose_action + playerId, "B": ...}, "gameOver": ...};
+    если партия уже закончена, доски не считаются.
+    """
+    game = Game()
+    game.from_fen_dict(position)
+    game_over = game.check_game_over()
+    boards: Dict[str, Dict[str, Any]] = {}
+    if game_over is None:
+        for name, board, white, black in (("A", game.board_a, 1, 4), ("B", game.board_b, 2, 3)):
+            player_id = white if board.get_current_player() == Color.WHITE else black
+            result = choose_action(position, player_id, move_time)
+            result["playerId"] = player_id
+            boards[name] = result
+    return {"boards": boards, "gameOver": game_over}
+
+
+# Общая таблица в процессе пула ParallelSearch (подключается в _init_worker)
+_WORKER_TABLE: Optional[SharedTable] = None
+
+
+def _init_worker(table_name: str, slots: int):
+    global _WORKER_TABLE
+    _WORKER_TABLE = SharedTable(slots, name=table_name)
+
+
+def _ping(delay: float) -> int:
+    time.sleep(delay)
+    return os.getpid()
+
+
+def _search_root_action(position: Dict[str, Any], player_id: int, action: Dict[str, Any],
+                        depth: int, alpha: int, deadline: float) -> Tuple[Optional[int], Dict[str, Any], int, bool]:
+    """Задача пула: (оценка или None, ход с выбранной жертвой, узлы, кончилось ли время).
+
+    deadline — по time.time(): perf_counter разных процессов не сравнимы.
+    """
+    game = Game()
+    game.from_fen_dict(position)
+    searcher = Searcher(game, player_id, time.perf_counter() + deadline - time.time(), _WORKER_TABLE)
+    try:
+        score = searcher.score_root_action(action, depth, alpha)
+    except SearchTimeout:
+        return None, action, searcher.nodes, True
+    return score, action, searcher.nodes, False
+
+
+class ParallelSearch:
+    """Поиск с разделением корня между процессами и общей таблицей транспозиций"""
+
+    def __init__(self, workers: Optional[int] = None, table_slots: int = SHARED_TABLE_SLOTS):
+        self.workers = workers or os.cpu_count() or 1
+        self.table = SharedTable(table_slots)
+        self.pool = ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(self.table.memory.name, table_slots),
+        )
+
+    def warmup(self):
+        """Поднимает все процессы пула заранее, чтобы их запуск не попал в первый ход"""
+        list(self.pool.map(_ping, [0.05] * self.workers))
+
+    def close(self):
+        self.pool.shutdown(wait=True, cancel_futures=True)
+        self.table.close()
+
+    def __enter__(self) -> 'ParallelSearch':
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+    def choose_action(self, position: Dict[str, Any], player_id: int, move_time: float,
+                      max_depth: int = MAX_DEPTH) -> Dict[str, Any]:
+        """То же, что choose_action, но корень каждой итерации считают все процессы пула"""
+        started = time.perf_counter()
+        deadline = time.time() + move_time
+        game = Game()
+        game.from_fen_dict(position)
+        actions = candidate_actions(game, player_id)
+        best: Optional[Dict[str, Any]] = None
+        best_score, depth_done, nodes = 0, 0, 0
+        for depth in range(1, max_depth + 1):
+            scored, timed_out, searched = self._search_root(position, player_id, actions, depth, deadline)
+            nodes += searched
+            # Лучший ход выбирается только из точных оценок: граница лишь говорит,
+            # что ход не лучше уже найденного
+            exact = [item for item in scored if item[2]]
+            if timed_out:
+                if best is None and exact:
+                    best = max(exact, key=lambda item: item[1])[0]
+                break
+            if not exact:
+                break
+            # Следующая итерация начинает с лучших ходов этой: сначала точные
+            # оценки, за ними отсечённые по своим границам
+            scored.sort(key=lambda item: (not item[2], -item[1]))
+            actions = [action for action, _, _ in scored]
+            best, best_score, depth_done = scored[0][0], scored[0][1], depth
+            if abs(best_score) >= MATE_SCORE - MAX_DEPTH:
+                break
+        if best is None:
+            best = Searcher(game, player_id, float("inf"), {})._first_legal(actions)
+        return {
+            "action": best,
+            "score": best_score,
+            "depth": depth_done,
+            "nodes": nodes,
+            "ms": (time.perf_counter() - started) * 1000,
+            "workers": self.workers,
+        }
+
+    def _search_root(self, position: Dict[str, Any], player_id: int, actions: List[Dict[str, Any]],
+                     depth: int, deadline: float) -> Tuple[List[Tuple[Dict[str, Any], int, bool]], bool, int]:
+        """Одна итерация: [(принятый ход, оценка, точная ли она)], кончилось ли время, узлы.
+
+        Ход ищется с окном от alpha на момент отправки: оценка не выше этой
+        alpha — лишь верхняя граница (ход не лучше уже найденного).
+        """
+        alpha = -MATE_SCORE - 1
+        scored: List[Tuple[Dict[str, Any], int, bool]] = []
+        timed_out = False
+        nodes = 0
+        pending = list(actions)
+        running = set()
+        # alpha, с которой отправлена каждая задача
+        windows = {}
+
+        def submit():
+            future = self.pool.submit(_search_root_action, position, player_id, pending.pop(0), depth, alpha, deadline)
+            windows[future] = alpha
+            return future
+
+        def collect(done):
+            nonlocal alpha, timed_out, nodes
+            for future in done:
+                score, action, searched, expired = future.result()
+                nodes += searched
+                timed_out = timed_out or expired
+                if score is not None:
+                    scored.append((action, score, score > windows[future]))
+                    alpha = max(alpha, score)
+
+        # Первый (лучший по прошлой итерации) ход — в одиночку: его оценка отсекает остальные
+        while pending and not scored and not timed_out:
+            collect([submit()])
+        while (pending or running) and not timed_out:
+            while pending and len(running) < self.workers:
+                running.add(submit())
+            done, running = wait(running, return_when=FIRST_COMPLETED)
+            collect(done)
+        if running:
+            collect(wait(running).done)
+        return scored, timed_out, nodes
@@ -0,0 +1,293 @@
+"""Индекс позиций сыгранных партий для дебютного обозревателя.
+
+Запись индекса: (хеш позиции, id партии, следующий ход, кто ходил,
+результат). Хеш — от обеих досок (FEN без счётчиков ходов) и запасов
+всех игроков, поэтому одна и та же позиция, пришедшая разными ходами,
+даёт один ключ.
+
+На диске индекс — набор отсортированных прогонов (run): в файле
+<run>.keys лежат только хеши (uint64, по возрастанию), в <run>.recs —
+остальные поля записей в том же порядке. Файлы открываются через
+np.memmap, и поиск — np.searchsorted по ключам: бинарный поиск читает
+порядка log2(N) страниц, а не весь файл, так что на сотнях миллионов
+записей запрос стоит микросекунды.
+
+Новые партии копятся в памяти и сбрасываются отдельным прогоном
+(flush), запросы видят и несброшенные записи. Чем больше прогонов, тем
+больше бинарных поисков на запрос; compact сливает их в один (читает
+все прогоны в память — это офлайн-операция, см. tools.explorer_index).
+Сервер сливает свои прогоны сам: когда их больше max_runs, merge_runs
+пишет слитый прогон в фоновом потоке, а replace_runs подменяет им
+исходные. Воркеры кластера помечают прогоны своим writer и сливают
+только свои, поэтому один прогон никогда не сливают двое.
+Прогон пишется во временные файлы и переименовывается, .keys —
+последним, поэтому читатель никогда не видит недописанный прогон.
+"""
+import hashlib
+import json
+import os
+import re
+import time
+import uuid
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from bughouse.game import Game
+
+
+RECORD_DTYPE = np.dtype([("game", "<u8"), ("move", "<u4"), ("player", "u1"), ("result", "u1")])
+# Результат партии: 0 — неизвестен (не доиграна), 1 — победа команды 1 и 3, 2 — команды 2 и 4
+RESULT_UNKNOWN, RESULT_TEAM1, RESULT_TEAM2 = 0, 1, 2
+TEAM1 = (1, 3)
+PIECES = "PNBRQ"
+
+
+def position_hash(position: Dict[str, Any]) -> int:
+    """Ключ позиции (формат Game.to_fen_dict): доски без счётчиков ходов и запасы"""
+    boards = " | ".join(" ".join(position[key].split()[:4]) for key in ("boardA", "boardB"))
+    reserves = json.dumps(position.get("reserves", {}), sort_keys=True, separators=(",", ":"))
+    digest = hashlib.blake2b(f"{boards}|{reserves}".encode(), digest_size=8).digest()
+    return int.from_bytes(digest, "little")
+
+
+def game_key(game_id: str) -> int:
+    return int.from_bytes(hashlib.blake2b(game_id.encode(), digest_size=8).digest(), "little")
+
+
+def _square(notation: str) -> int:
+    return (ord(notation[0]) - ord("a")) * 8 + int(notation[1]) - 1
+
+
+def _notation(index: int) -> str:
+    return chr(ord("a") + index // 8) + str(index % 8 + 1)
+
+
+def encode_move(entry: Dict[str, Any]) -> int:
+    """Ход из Game.history в 32 бита: тип (2) | откуда или фигура (6) | куда (6) | фигура и клетка забора (3 + 6)"""
+    if entry["type"] == "drop":
+        return 2 | PIECES.index(entry["piece"]) << 2 | _square(entry["square"]) << 8
+    code = 1 | _square(entry["from"]) << 2 | _square(entry["to"]) << 8
+    if entry.get("victimSquare"):
+        code |= (PIECES.index(entry["piece"]) + 1) << 14 | _square(entry["victimSquare"]) << 17
+    return code
+
+
+def decode_move(code: int) -> str:
+    """Ход в записи BPGN (e2e4, N@f3, e7e8=Q(d8))"""
+    a, b = code >> 2 & 0x3F, code >> 8 & 0x3F
+    if code & 3 == 2:
+        return f"{PIECES[a]}@{_notation(b)}"
+    token = _notation(a) + _notation(b)
+    promoted = code >> 14 & 0x7
+    if promoted:
+        token += f"={PIECES[promoted - 1]}({_notation(code >> 17 & 0x3F)})"
+    return token
+
+
+def result_code(game_over: Optional[Dict[str, Any]]) -> int:
+    if game_over is None:
+        return RESULT_UNKNOWN
+    return RESULT_TEAM1 if game_over["winner"] == "team1" else RESULT_TEAM2
+
+
+def game_positions(game_id: str, start_position: Optional[Dict[str, Any]], history: List[Dict[str, Any]],
+                   result: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Записи индекса партии: позиция перед каждым ходом и сам ход.
+
+    Партия проигрывается заново через Game (миллисекунды на ход), поэтому
+    сервер вызывает это в процессе пула, а не в цикле событий.
+    """
+    game = Game()
+    if start_position is not None:
+        game.from_fen_dict(start_position)
+    keys = np.empty(len(history), dtype=np.uint64)
+    records = np.zeros(len(history), dtype=RECORD_DTYPE)
+    records["game"] = game_key(game_id)
+    records["result"] = result
+    for index, entry in enumerate(history):
+        keys[index] = position_hash(game.to_fen_dict())
+        records["move"][index] = encode_move(entry)
+        records["player"][index] = entry["player"]
+        if entry["type"] == "drop":
+            game.make_drop(entry["player"], entry["piece"], entry["square"])
+        else:
+            victim_id = None
+            if entry.get("victimSquare"):
+                opponent = game.get_player(int(game.get_player(entry["player"]).get_opponent_player_id()))
+                victim_id = opponent.get_partner_id()
+            game.make_move(entry["player"], entry["from"], entry["to"],
+                           victim_player_id=victim_id, victim_square=entry.get("victimSquare"))
+    return keys, records
+
+
+# run-[<writer>-]<время>-<случайный суффикс>; writer начинается с буквы
+RUN_NAME_RE = re.compile(r"^run-(?:([A-Za-z]\w*)-)?\d{14}-[0-9a-f]{8}$")
+
+
+def run_writer(name: str) -> Optional[str]:
+    """Кто записал прогон (writer из имени) или None"""
+    match = RUN_NAME_RE.match(name)
+    return match.group(1) if match else None
+
+
+class Run:
+    """Отсортированный прогон на диске, открытый через memmap"""
+
+    def __init__(self, base: str):
+        self.base = base
+        self.keys = np.memmap(base + ".keys", dtype=np.uint64, mode="r")
+        self.records = np.memmap(base + ".recs", dtype=RECORD_DTYPE, mode="r", shape=(len(self.keys),))
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def lookup(self, key: int) -> np.ndarray:
+        key = np.uint64(key)
+        start = int(np.searchsorted(self.keys, key, side="left"))
+        end = int(np.searchsorted(self.keys, key, side="right"))
+        return self.records[start:end]
+
+
+class PositionIndex:
+    def __init__(self, directory: str, flush_records: int = 10000, writer: Optional[str] = None,
+                 max_runs: int = 0):
+        self.directory = directory
+        self.flush_records = flush_records
+        self.writer = writer
+        # Сколько своих прогонов допустимо до фонового слияния; 0 — не сливать
+        self.max_runs = max_runs
+        self.runs: Dict[str, Run] = {}
+        self._pending_keys: List[np.ndarray] = []
+        self._pending_records: List[np.ndarray] = []
+        self.pending = 0
+        self._scanned = 0.0
+
+    def refresh(self):
+        """Подхватывает прогоны, записанные другими процессами, и забывает слитые"""
+        if not os.path.isdir(self.directory):
+            return
+        names = {entry.name[:-5] for entry in os.scandir(self.directory) if entry.name.endswith(".keys")}
+        for name in names - set(self.runs):
+            base = os.path.join(self.directory, name)
+            if os.path.getsize(base + ".keys"):
+                self.runs[name] = Run(base)
+        for name in set(self.runs) - names:
+            del self.runs[name]
+        self._scanned = time.monotonic()
+
+    def __len__(self) -> int:
+        return sum(len(run) for run in self.runs.values()) + self.pending
+
+    def add(self, keys: np.ndarray, records: np.ndarray):
+        """Добавляет записи; прогон на диск пишется, когда их накопится flush_records"""
+        if not len(keys):
+            return
+        self._pending_keys.append(keys)
+        self._pending_records.append(records)
+        self.pending += len(keys)
+        if self.pending >= self.flush_records:
+            self.flush()
+
+    def flush(self):
+        if not self.pending:
+            return
+        keys = np.concatenate(self._pending_keys)
+        records = np.concatenate(self._pending_records)
+        self._pending_keys, self._pending_records, self.pending = [], [], 0
+        name = self.write_run(self.directory, keys, records, self.writer)
+        self.runs[name] = Run(os.path.join(self.directory, name))
+
+    @staticmethod
+    def write_run(directory: str, keys: np.ndarray, records: np.ndarray, writer: Optional[str] = None) -> str:
+        """Сортирует записи по ключу и пишет новый прогон; возвращает его имя"""
+        os.makedirs(directory, exist_ok=True)
+        order = np.argsort(keys, kind="stable")
+        prefix = f"run-{writer}-" if writer else "run-"
+        name = f"{prefix}{time.strftime('%Y%m%d%H%M%S')}-{uuid.uuid4().hex[:8]}"
+        base = os.path.join(directory, name)
+        records[order].tofile(base + ".recs.tmp")
+        os.replace(base + ".recs.tmp", base + ".recs")
+        keys[order].astype("<u8").tofile(base + ".keys.tmp")
+        os.replace(base + ".keys.tmp", base + ".keys")
+        return name
+
+    def lookup(self, key: int, refresh_interval: float = 1.0) -> np.ndarray:
+        """Все записи позиции: из прогонов на диске и несброшенные"""
+        if time.monotonic() - self._scanned > refresh_interval:
+            self.refresh()
+        parts = [run.lookup(key) for run in self.runs.values()]
+        for keys, records in zip(self._pending_keys, self._pending_records):
+            parts.append(records[keys == np.uint64(key)])
+        parts = [part for part in parts if len(part)]
+        if not parts:
+            return np.zeros(0, dtype=RECORD_DTYPE)
+        return np.concatenate(parts)
+
+    def explore(self, position: Dict[str, Any]) -> Dict[str, Any]:
+        """Какие ходы делались из позиции и с каким результатом для команды ходившего"""
+        key = position_hash(position)
+        records = self.lookup(key)
+        moves = []
+        if len(records):
+            # Ход и ходивший в одном ключе: один и тот же ход на разных досках — разные ходы
+            combined = records["player"].astype(np.uint64) << np.uint64(32) | records["move"]
+            groups, inverse = np.unique(combined, return_inverse=True)
+            mover_team1 = np.isin(records["player"], TEAM1)
+            won = np.where(mover_team1, records["result"] == RESULT_TEAM1, records["result"] == RESULT_TEAM2)
+            lost = np.where(mover_team1, records["result"] == RESULT_TEAM2, records["result"] == RESULT_TEAM1)
+            counts = np.bincount(inverse, minlength=len(groups))
+            wins = np.bincount(inverse, weights=won, minlength=len(groups))
+            losses = np.bincount(inverse, weights=lost, minlength=len(groups))
+            for group, count, win, loss in zip(groups, counts, wins, losses):
+                decided = int(win + loss)
+                moves.append({
+                    "playerId": int(group) >> 32,
+                    "move": decode_move(int(group) & 0xFFFFFFFF),
+                    "games": int(count),
+                    "wins": int(win),
+                    "losses": int(loss),
+                    "score": win / decided if decided else None,
+                })
+            moves.sort(key=lambda item: -item["games"])
+        return {
+            "positionHash": f"{key:016x}",
+            "games": int(len(np.unique(records["game"]))) if len(records) else 0,
+            "moves": moves,
+        }
+
+    def own_runs(self, refresh_interval: float = 1.0) -> List[Run]:
+        """Прогоны этого писателя (writer), которые сервер сливает сам"""
+        if time.monotonic() - self._scanned > refresh_interval:
+            self.refresh()
+        return [run for name, run in self.runs.items() if run_writer(name) == self.writer]
+
+    def compaction_due(self) -> bool:
+        return self.max_runs > 0 and len(self.own_runs()) > self.max_runs
+
+    @staticmethod
+    def merge_runs(directory: str, runs: List[Run], writer: Optional[str] = None) -> str:
+        """Пишет прогон из записей runs (исходные не трогает); возвращает его имя.
+        Не обращается к PositionIndex, поэтому может идти в отдельном потоке."""
+        keys = np.concatenate([np.asarray(run.keys) for run in runs])
+        records = np.concatenate([np.asarray(run.records) for run in runs])
+        return PositionIndex.write_run(directory, keys, records, writer)
+
+    def replace_runs(self, old: List[Run], name: str):
+        """Подменяет слитые прогоны прогоном name и удаляет их файлы"""
+        self.runs[name] = Run(os.path.join(self.directory, name))
+        for run in old:
+            self.runs.pop(os.path.basename(run.base), None)
+            # Сначала .keys: без него прогон уже не виден читателям
+            os.remove(run.base + ".keys")
+            os.remove(run.base + ".recs")
+
+    def compact(self) -> Optional[str]:
+        """Сливает все прогоны на диске в один; возвращает имя нового прогона"""
+        self.refresh()
+        if len(self.runs) < 2:
+            return None
+        old = list(self.runs.values())
+        name = self.merge_runs(self.directory, old, self.writer)
+        self.replace_runs(old, name)
+        return name
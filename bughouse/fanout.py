@@ -0,0 +1,296 @@
+import asyncio
+import logging
+import os
+from abc import ABC, abstractmethod
+from collections import deque
+from typing import Awaitable, Callable, Deque, Dict, Optional, Set, Tuple
+
+
+logger = logging.getLogger(__name__)
+
+
+# Получатель сообщения: (session_id, version, payload)
+Subscriber = Callable[[str, int, str], Awaitable[None]]
+
+FANOUT_SOCKET_ENV = "BUGHOUSE_FANOUT_SOCKET"
+
+
+class Fanout(ABC):
+    """Издатель/подписчик для рассылки обновлений состояния по сессиям.
+
+    Гарантия порядка: в пределах одной сессии подписчик получает сообщения
+    со строго возрастающими версиями. Сообщение, версия которого не новее
+    уже доставленного, отбрасывается — старое состояние никогда не приходит
+    после нового.
+    """
+
+    def __init__(self):
+        self._subscribers: Dict[str, Set[Subscriber]] = {}
+        self._delivered: Dict[str, int] = {}
+
+    async def start(self):
+        pass
+
+    async def stop(self):
+        pass
+
+    def has_subscribers(self, session_id: str) -> bool:
+        return bool(self._subscribers.get(session_id))
+
+    def subscribe(self, session_id: str, subscriber: Subscriber):
+        subscribers = self._subscribers.setdefault(session_id, set())
+        first = not subscribers
+        subscribers.add(subscriber)
+        if first:
+            self._on_first_subscriber(session_id)
+
+    def unsubscribe(self, session_id: str, subscriber: Subscriber):
+        subscribers = self._subscribers.get(session_id)
+        if not subscribers:
+            return
+        subscribers.discard(subscriber)
+        if not subscribers:
+            del self._subscribers[session_id]
+            self._delivered.pop(session_id, None)
+            self._on_last_unsubscribe(session_id)
+
+    def _on_first_subscriber(self, session_id: str):
+        pass
+
+    def _on_last_unsubscribe(self, session_id: str):
+        pass
+
+    async def _deliver(self, session_id: str, version: int, payload: str):
+        if version <= self._delivered.get(session_id, 0):
+            return
+        subscribers = self._subscribers.get(session_id)
+        if not subscribers:
+            return
+        self._delivered[session_id] = version
+        for subscriber in list(subscribers):
+            await subscriber(session_id, version, payload)
+
+    @abstractmethod
+    async def publish(self, session_id: str, version: int, payload: str):
+        """Публикует готовое (уже сериализованное) сообщение для сессии"""
+
+
+class InProcessFanout(Fanout):
+    """Рассылка внутри одного процесса"""
+
+    async def publish(self, session_id: str, version: int, payload: str):
+        await self._deliver(session_id, version, payload)
+
+
+# Протокол брокера (строка заголовка + тело):
+#   S <session>\n                           — подписка
+#   U <session>\n                           — отписка
+#   P <session> <version> <length>\n<body>  — публикация (брокер пересылает кадр как есть)
+# От брокера, кроме публикаций, — у канала появились или пропали подписчики
+# (в любом процессе); новому соединению сразу приходят все активные каналы:
+#   A <session>\n                           — есть подписчики
+#   I <session>\n                           — подписчиков нет
+
+def _publish_frame(session_id: str, version: int, payload: str) -> bytes:
+    body = payload.encode("utf-8")
+    return f"P {session_id} {version} {len(body)}\n".encode("ascii") + body
+
+
+async def _read_frame(reader: asyncio.StreamReader):
+    line = await reader.readline()
+    if not line:
+        return None
+    parts = line.decode("ascii").split()
+    if parts[0] == "P":
+        body = await reader.readexactly(int(parts[3]))
+        return parts[0], parts[1], int(parts[2]), line + body
+    return parts[0], parts[1], None, None
+
+
+class FanoutBroker:
+    """Локальный брокер на unix-сокете: пересылает публикации подписанным процессам.
+
+    Кадры одной сессии пересылаются в порядке получения, а запись в каждое
+    соединение идёт последовательно, поэтому порядок в пределах сессии
+    сохраняется для всех подписчиков. О появлении и исчезновении
+    подписчиков канала брокер сообщает всем соединениям (A/I), чтобы
+    процессы не публиковали в каналы, которые никто не слушает.
+    """
+
+    def __init__(self, socket_path: str):
+        self.socket_path = socket_path
+        self._subscriptions: Dict[str, Set[asyncio.StreamWriter]] = {}
+        self._clients: Set[asyncio.StreamWriter] = set()
+        self._server: Optional[asyncio.AbstractServer] = None
+
+    async def start(self):
+        if os.path.exists(self.socket_path):
+            os.remove(self.socket_path)
+        self._server = await asyncio.start_unix_server(self._handle, self.socket_path)
+
+    async def stop(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        sessions: Set[str] = set()
+        self._clients.add(writer)
+        for session_id in self._subscriptions:
+            writer.write(f"A {session_id}\n".encode("ascii"))
+        try:
+            while True:
+                frame = await _read_frame(reader)
+                if frame is None:
+                    break
+                op, session_id, _, raw = frame
+                if op == "S":
+                    self._add(session_id, writer)
+                    sessions.add(session_id)
+                elif op == "U":
+                    self._remove(session_id, writer)
+                    sessions.discard(session_id)
+                elif op == "P":
+                    subscribers = list(self._subscriptions.get(session_id, ()))
+                    for subscriber in subscribers:
+                        if subscriber.is_closing():
+                            self._remove(session_id, subscriber)
+                            continue
+                        subscriber.write(raw)
+                    for subscriber in subscribers:
+                        try:
+                            await subscriber.drain()
+                        except ConnectionError:
+                            self._remove(session_id, subscriber)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            self._clients.discard(writer)
+            for session_id in sessions:
+                self._remove(session_id, writer)
+            writer.close()
+
+    def _add(self, session_id: str, writer: asyncio.StreamWriter):
+        subscribers = self._subscriptions.setdefault(session_id, set())
+        if not subscribers:
+            self._announce("A", session_id)
+        subscribers.add(writer)
+
+    def _remove(self, session_id: str, writer: asyncio.StreamWriter):
+        subscribers = self._subscriptions.get(session_id)
+        if subscribers is not None:
+            subscribers.discard(writer)
+            if not subscribers:
+                del self._subscriptions[session_id]
+                self._announce("I", session_id)
+
+    def _announce(self, op: str, session_id: str):
+        line = f"{op} {session_id}\n".encode("ascii")
+        for client in self._clients:
+            if not client.is_closing():
+                client.write(line)
+
+
+class UnixSocketFanout(Fanout):
+    """Межпроцессная рассылка через FanoutBroker.
+
+    Публикации уходят только через брокер (в том числе для локальных
+    подписчиков), поэтому все процессы видят один и тот же порядок.
+    Каналы с подписчиками в других процессах известны по сообщениям
+    брокера A/I: подписка в другом процессе видна здесь с задержкой на
+    доставку этого сообщения (подписчик и так получает текущее состояние
+    при подключении).
+
+    Полученные кадры раздаются по сессиям: у каждой сессии своя очередь и
+    своя задача доставки, которая живёт, пока очередь не опустеет. Медленный
+    подписчик одной сессии задерживает только её кадры, а порядок версий
+    внутри сессии сохраняется.
+    """
+
+    def __init__(self, socket_path: str):
+        super().__init__()
+        self.socket_path = socket_path
+        self._reader: Optional[asyncio.StreamReader] = None
+        self._writer: Optional[asyncio.StreamWriter] = None
+        self._receiver: Optional[asyncio.Task] = None
+        # Каналы, у которых есть подписчики хоть в каком-то процессе (по данным брокера)
+        self._active: Set[str] = set()
+        # Кадры, ждущие доставки, и задачи доставки по сессиям
+        self._pending: Dict[str, Deque[Tuple[int, str]]] = {}
+        self._deliveries: Dict[str, asyncio.Task] = {}
+
+    async def start(self):
+        self._active.clear()
+        self._reader, self._writer = await asyncio.open_unix_connection(self.socket_path)
+        for session_id in self._subscribers:
+            self._writer.write(f"S {session_id}\n".encode("ascii"))
+        self._receiver = asyncio.create_task(self._receive())
+
+    async def stop(self):
+        if self._receiver is not None:
+            self._receiver.cancel()
+        for task in list(self._deliveries.values()):
+            task.cancel()
+        if self._writer is not None:
+            self._writer.close()
+            try:
+                await self._writer.wait_closed()
+            except ConnectionError:
+                pass
+
+    def has_subscribers(self, session_id: str) -> bool:
+        return session_id in self._active or super().has_subscribers(session_id)
+
+    def _on_first_subscriber(self, session_id: str):
+        if self._writer is not None:
+            self._writer.write(f"S {session_id}\n".encode("ascii"))
+
+    def _on_last_unsubscribe(self, session_id: str):
+        if self._writer is not None and not self._writer.is_closing():
+            self._writer.write(f"U {session_id}\n".encode("ascii"))
+
+    async def publish(self, session_id: str, version: int, payload: str):
+        if self._writer is None:
+            raise RuntimeError("Fanout не запущен")
+        self._writer.write(_publish_frame(session_id, version, payload))
+        await self._writer.drain()
+
+    async def _receive(self):
+        while True:
+            frame = await _read_frame(self._reader)
+            if frame is None:
+                break
+            op, session_id, version, raw = frame
+            if op == "A":
+                self._active.add(session_id)
+                continue
+            if op == "I":
+                self._active.discard(session_id)
+                continue
+            payload = raw.split(b"\n", 1)[1].decode("utf-8")
+            self._pending.setdefault(session_id, deque()).append((version, payload))
+            if session_id not in self._deliveries:
+                self._deliveries[session_id] = asyncio.create_task(self._drain(session_id))
+
+    async def _drain(self, session_id: str):
+        """Доставляет кадры сессии по порядку, пока они есть"""
+        pending = self._pending[session_id]
+        try:
+            while pending:
+                version, payload = pending.popleft()
+                try:
+                    await self._deliver(session_id, version, payload)
+                except Exception:
+                    logger.exception("Fanout: delivery failed", extra={"session": session_id, "version": version})
+        finally:
+            # Между проверкой очереди и этим местом нет await: новый кадр не потеряется
+            del self._pending[session_id]
+            del self._deliveries[session_id]
+
+
+def create_fanout() -> Fanout:
+    """Межпроцессный fanout, если задан сокет брокера, иначе внутрипроцессный"""
+    socket_path = os.getenv(FANOUT_SOCKET_ENV)
+    if socket_path:
+        return UnixSocketFanout(socket_path)
+    return InProcessFanout()
@@ -1,7 +1,10 @@
-from typing import Dict, Optional, List, Any
+import time
+from typing import Dict, Optional, List, Any, Tuple
 from bughouse.chess_board import ChessBoard
+from bughouse.clock import ChessClock
 from bughouse.color import Color
 from bughouse.coordinate import Coordinate
+from bughouse.file import File
 from bughouse.player import Player
 from bughouse.pieces_reserve import PiecesReserve
 from bughouse.figures import Piece, Pawn, Knight, Bishop, Rook, Queen, King
@@ -30,6 +33,21 @@ class Game:
         # self.board_b.init_from_fen(fen5)
         self.board_a.init_standard_position()
         self.board_b.init_standard_position()
+        # Результат по времени запоминается: после остановки часов флаг уже не виден
+        self._flag_result: Optional[Dict] = None
+        # Номер позиции: растёт при каждом ходе, дропе и загрузке FEN
+        self.revision = 0
+        # Результат проверки матов для позиции: (revision, результат)
+        self._checkmate_cache: Optional[Tuple[int, Optional[Dict]]] = None
+        # Варианты фигур для превращения по жертвам:
+        # victim_player_id -> (доска, её revision, варианты, {клетка: снятие открывает шах})
+        self._stealable_cache: Dict[int, Tuple[ChessBoard, int, List[Dict[str, Any]], Dict[Coordinate, bool]]] = {}
+        # Подсказки ходов по игрокам: player_id -> (revision, подсказки)
+        self._legal_moves_cache: Dict[int, Tuple[int, Dict[str, Any]]] = {}
+        # Запись партии (для BPGN): ходы и дропы обеих досок по порядку и позиция,
+        # с которой она начата (None — стандартная начальная)
+        self.history: List[Dict[str, Any]] = []
+        self.start_position: Optional[Dict] = None
         
         # Регистрируем роли игроков
         self.players[1] = Player(1, self.board_a, Color.WHITE, "A")
@@ -56,6 +74,74 @@ class Game:
                     player.pieces_reserve.add(piece_class)
 
 
+    def set_clocks(self, initial_ms: int, increment_ms: int = 0, delay_ms: int = 0):
+        """Включает часы на обеих досках"""
+        self.board_a.clock = ChessClock(initial_ms, increment_ms, delay_ms)
+        self.board_b.clock = ChessClock(initial_ms, increment_ms, delay_ms)
+
+    def clocks(self) -> Dict[str, ChessClock]:
+        clocks = {}
+        if self.board_a.clock is not None:
+            clocks["A"] = self.board_a.clock
+        if self.board_b.clock is not None:
+            clocks["B"] = self.board_b.clock
+        return clocks
+
+    def clocks_running(self) -> bool:
+        return any(clock.running is not None for clock in self.clocks().values())
+
+    def clocks_to_dict(self) -> Dict[str, Dict]:
+        return {name: clock.to_dict() for name, clock in self.clocks().items()}
+
+    def clocks_from_dict(self, data: Dict[str, Dict]):
+        if "A" in data:
+            self.board_a.clock = ChessClock.from_dict(data["A"])
+        if "B" in data:
+            self.board_b.clock = ChessClock.from_dict(data["B"])
+
+    def _stop_clocks(self):
+        for clock in self.clocks().values():
+            clock.stop()
+
+    def _check_flags(self) -> Optional[Dict]:
+        """Проверяет, не упал ли флаг у кого-то из игроков"""
+        if self._flag_result is not None:
+            return self._flag_result
+        for board in (self.board_a, self.board_b):
+            if board.clock is None:
+                continue
+            color = board.clock.flagged()
+            if color is None:
+                continue
+            loser = next(p for p in self.players.values() if p.board is board and p.color == color)
+            if loser.player_id in (1, 3):
+                self._flag_result = {
+                    "winner": "team2",
+                    "team": [2, 4],
+                    "reason": f"Время игрока {loser.player_id} истекло"
+                }
+            else:
+                self._flag_result = {
+                    "winner": "team1",
+                    "team": [1, 3],
+                    "reason": f"Время игрока {loser.player_id} истекло"
+                }
+            return self._flag_result
+        return None
+
+    def copy(self) -> 'Game':
+        """Копия позиции (без часов) для перебора вариантов.
+
+        Проверка матов уже посчитанной позиции переносится в копию, чтобы
+        первый make_move на ней не повторял её заново.
+        """
+        game = Game()
+        game.from_fen_dict(self.to_fen_dict())
+        cache = self._checkmate_cache
+        if cache is not None and cache[0] == self.revision:
+            game._checkmate_cache = (game.revision, cache[1])
+        return game
+
     def get_player(self, player_id: int) -> Player:
         """Получает игрока по ID"""
         player = self.players.get(player_id)
@@ -85,8 +171,19 @@ class Game:
         return int(partner.get_opponent_player_id())
 
     def _list_stealable_pieces(self, victim_player_id: int) -> List[Dict[str, Any]]:
+        return self._stealable(victim_player_id)[0]
+
+    def _stealable(self, victim_player_id: int) -> Tuple[List[Dict[str, Any]], Dict[Coordinate, bool]]:
+        """Варианты фигур жертвы для превращения и для каждой фигуры — откроет ли её снятие шах.
+
+        Считается один раз на позицию доски жертвы (ChessBoard.revision):
+        повторные попытки превращения и проверка выбранной клетки берут готовое.
+        """
         victim = self.get_player(victim_player_id)
         board = victim.board
+        cached = self._stealable_cache.get(victim_player_id)
+        if cached is not None and cached[0] is board and cached[1] == board.revision:
+            return cached[2], cached[3]
 
         def removal_exposes_check(victim_coord: Coordinate) -> bool:
             """Проверяет, откроется ли шах королю жертвы, если убрать фигуру с клетки."""
@@ -100,6 +197,7 @@ class Game:
                 board.squares[victim_coord.get_file_index()][victim_coord.get_rank_index()] = original
 
         options: List[Dict[str, Any]] = []
+        exposes: Dict[Coordinate, bool] = {}
         for file in range(8):
             for rank_idx in range(8):
                 piece = board.squares[file][rank_idx]
@@ -110,9 +208,9 @@ class Game:
                 if isinstance(piece, (King, Pawn)):
                     continue
 
-
                 victim_coord = piece.coordinate
                 exposes_check = removal_exposes_check(victim_coord)
+                exposes[victim_coord] = exposes_check
                 if exposes_check and board.get_current_player() != victim.color:
                     continue
 
@@ -123,7 +221,8 @@ class Game:
                     "opensCheck": exposes_check,
                 })
         options.sort(key=lambda x: (x["piece"], x["square"]))
-        return options
+        self._stealable_cache[victim_player_id] = (board, board.revision, options, exposes)
+        return options, exposes
 
     def _create_promoted_piece(self, piece_symbol: str, coord: Coordinate, color: Color) -> Piece:
         """Создаёт фигуру для превращения (в цвет превращающегося), с корректными флагами."""
@@ -134,6 +233,15 @@ class Game:
             return Rook(coord, color, True)
         return piece_class(coord, color)
 
+    def _record(self, player: Player, entry: Dict[str, Any]):
+        """Дописывает ход в запись партии: кто, на какой доске, когда и сколько осталось на часах"""
+        entry["player"] = player.player_id
+        entry["board"] = player.board_name
+        entry["ts"] = time.time()
+        clock = player.board.clock
+        entry["clockMs"] = clock.time_left(player.color) if clock is not None else None
+        self.history.append(entry)
+
     def make_move(
         self,
         player_id: int,
@@ -166,8 +274,7 @@ class Game:
             expected_victim_id = self._get_opponent_teammate_id(player_id)
 
             if victim_player_id is None or victim_square is None:
-                test_board = ChessBoard.from_fen(board.to_fen())
-                _ = test_board.move(from_coord, to_coord)
+                board._trial_move(from_coord, to_coord)
 
                 options = self._list_stealable_pieces(expected_victim_id)
                 if not options:
@@ -190,19 +297,11 @@ class Game:
             if isinstance(victim_piece, (King, Pawn)):
                 raise ValueError("Нельзя забрать короля или пешку")
 
-            original = victim_piece
-            victim.board.squares[victim_coord.get_file_index()][victim_coord.get_rank_index()] = None
-            try:
-                exposes_check = victim.board.is_king_in_check(victim.color)
-            finally:
-                victim.board.squares[victim_coord.get_file_index()][victim_coord.get_rank_index()] = original
+            exposes_check = self._stealable(expected_victim_id)[1][victim_coord]
 
             if exposes_check and victim.board.get_current_player() != victim.color:
                 raise ValueError("Нельзя забрать эту фигуру: после снятия откроется шах, а сейчас ход не жертвы")
 
-            test_board = ChessBoard.from_fen(board.to_fen())
-            _ = test_board.move(from_coord, to_coord)
-
             captured = board.move(from_coord, to_coord)
 
             if captured is not None:
@@ -211,6 +310,7 @@ class Game:
                 partner.pieces_reserve.add(captured.__class__)
 
             victim.board.squares[victim_coord.get_file_index()][victim_coord.get_rank_index()] = None
+            victim.board.revision += 1
             victim.pieces_reserve.add(Pawn)
 
             new_piece = self._create_promoted_piece(
@@ -219,6 +319,12 @@ class Game:
                 color=player.color,
             )
             board.squares[to_coord.get_file_index()][to_coord.get_rank_index()] = new_piece
+            board.revision += 1
+            self.revision += 1
+            self._record(player, {
+                "type": "move", "from": from_square, "to": to_square,
+                "piece": victim.board._piece_symbol(victim_piece), "victimSquare": victim_square,
+            })
             return
 
         captured = board.move(from_coord, to_coord)
@@ -227,6 +333,8 @@ class Game:
             partner_id = player.get_partner_id()
             partner = self.players[partner_id]
             partner.pieces_reserve.add(captured.__class__)
+        self.revision += 1
+        self._record(player, {"type": "move", "from": from_square, "to": to_square})
     
     def make_drop(self, player_id: int, piece_symbol: str, square: str):
         """Выполняет дроп фигуры"""
@@ -258,12 +366,7 @@ class Game:
         
         king_in_check_before = board.is_king_in_check(player.color)
         
-        from bughouse.figures import Rook, King
-        if piece_class == Rook or piece_class == King:
-            temp_piece = piece_class(coord, player.color, has_moved=True)
-        else:
-            temp_piece = piece_class(coord, player.color)
-        
+        temp_piece = self._drop_piece(piece_class, coord, player.color)
         board.place_piece(temp_piece)
         
         if king_in_check_before:
@@ -283,12 +386,115 @@ class Game:
             board.squares[coord.get_file_index()][coord.get_rank_index()] = None
             raise ValueError(f"Нельзя поставить фигуру: дроп создает мат для противника")
         
-        board.current_player = board.current_player.opponent()
+        board.pass_turn()
         player.pieces_reserve.remove(piece_class)
+        self.revision += 1
+        self._record(player, {"type": "drop", "piece": piece_symbol.upper(), "square": square})
     
+    def legal_moves(self, player_id: int) -> Dict[str, Any]:
+        """Легальные ходы и дропы игрока: {"moves": {откуда: [куда]}, "drops": {фигура: [клетки]}}.
+
+        Пусто, если сейчас не его ход или игра окончена. Считается один раз
+        на позицию (revision).
+        """
+        if self.check_game_over():
+            return {"moves": {}, "drops": {}}
+        cached = self._legal_moves_cache.get(player_id)
+        if cached is not None and cached[0] == self.revision:
+            return cached[1]
+        player = self.get_player(player_id)
+        if player.board.get_current_player() != player.color:
+            hints: Dict[str, Any] = {"moves": {}, "drops": {}}
+        else:
+            hints = {"moves": self._legal_piece_moves(player), "drops": self._legal_drops(player)}
+        self._legal_moves_cache[player_id] = (self.revision, hints)
+        return hints
+
+    def _legal_piece_moves(self, player: Player) -> Dict[str, List[str]]:
+        board = player.board
+        last_rank = 8 if player.color == Color.WHITE else 1
+        can_promote: Optional[bool] = None
+        moves: Dict[str, List[str]] = {}
+        for src, targets in board.legal_moves().items():
+            is_pawn = isinstance(board.get_piece(src), Pawn)
+            allowed = []
+            for dst in targets:
+                if is_pawn and dst.rank == last_rank:
+                    # Превращение возможно, только если есть что забрать у жертвы
+                    if can_promote is None:
+                        victim_id = self._get_opponent_teammate_id(player.player_id)
+                        can_promote = bool(self._list_stealable_pieces(victim_id))
+                    if not can_promote:
+                        continue
+                allowed.append(str(dst))
+            if allowed:
+                moves[str(src)] = sorted(allowed)
+        return moves
+
+    def _legal_drops(self, player: Player) -> Dict[str, List[str]]:
+        """Клетки дропа по типам фигур; правила те же, что в make_drop"""
+        board = player.board
+        opponent = self.players[int(player.get_opponent_player_id())]
+        in_check = board.is_king_in_check(player.color)
+        opponent_in_check = board.is_king_in_check(opponent.color)
+        opponent_king = board.find_king(opponent.color)
+        empty = [Coordinate(File(f), r + 1) for f in range(8) for r in range(8) if board.squares[f][r] is None]
+        if in_check:
+            # Закрыть шах может только дроп на линию атаки; тип своей фигуры не важен
+            empty = [coord for coord in empty if self._drop_blocks_check(board, player.color, coord)]
+
+        drops: Dict[str, List[str]] = {}
+        for symbol in ("P", "N", "B", "R", "Q"):
+            piece_class = self._parse_piece_symbol(symbol)
+            if player.pieces_reserve.get_count(piece_class) <= 0:
+                continue
+            squares = []
+            for coord in empty:
+                if piece_class == Pawn and coord.rank in (1, 8):
+                    continue
+                piece = self._drop_piece(piece_class, coord, player.color)
+                board.place_piece(piece)
+                try:
+                    # Мат возможен, только если после дропа у соперника шах
+                    gives_check = opponent_in_check or (
+                        opponent_king is not None and opponent_king in piece.get_possible_moves(board))
+                    mates = gives_check and board.is_checkmate(opponent.color, opponent.pieces_reserve)
+                finally:
+                    board.squares[coord.get_file_index()][coord.get_rank_index()] = None
+                if not mates:
+                    squares.append(str(coord))
+            if squares:
+                drops[symbol] = sorted(squares)
+        return drops
+
+    @staticmethod
+    def _drop_blocks_check(board: ChessBoard, color: Color, coord: Coordinate) -> bool:
+        board.place_piece(Bishop(coord, color))
+        try:
+            return not board.is_king_in_check(color)
+        finally:
+            board.squares[coord.get_file_index()][coord.get_rank_index()] = None
+
+    @staticmethod
+    def _drop_piece(piece_class: type[Piece], coord: Coordinate, color: Color) -> Piece:
+        if piece_class == Rook or piece_class == King:
+            return piece_class(coord, color, has_moved=True)
+        return piece_class(coord, color)
+
     def check_game_over(self) -> Optional[Dict]:
         """Проверяет, завершена ли игра (мат). Возвращает информацию о победителе или None"""
-        from bughouse.pieces_reserve import PiecesReserve
+        result = self._check_checkmates()
+        if result is None:
+            result = self._check_flags()
+        if result is not None:
+            self._stop_clocks()
+        return result
+
+    def _check_checkmates(self) -> Optional[Dict]:
+        """Маты на досках; результат считается один раз на позицию (revision)"""
+        cache = self._checkmate_cache
+        if cache is not None and cache[0] == self.revision:
+            return cache[1]
         # Команда 1
         checkmate_1_white = self.board_a.is_checkmate(Color.WHITE, self.players[1].pieces_reserve)
         checkmate_1_black = self.board_b.is_checkmate(Color.BLACK, self.players[3].pieces_reserve)
@@ -299,19 +505,21 @@ class Game:
         checkmate_2_black = self.board_a.is_checkmate(Color.BLACK, self.players[4].pieces_reserve)
         team2_lost = checkmate_2_white or checkmate_2_black
         
+        result = None
         if team1_lost and not team2_lost:
-            return {
+            result = {
                 "winner": "team2",
                 "team": [2, 4],
                 "reason": "Мат команде 1"
             }
         elif team2_lost and not team1_lost:
-            return {
+            result = {
                 "winner": "team1",
                 "team": [1, 3],
                 "reason": "Мат команде 2"
             }
-        return None
+        self._checkmate_cache = (self.revision, result)
+        return result
     
     def to_fen_dict(self) -> Dict:
         """Сохраняет текущую позицию в формате, включающем FEN обеих досок и запасы"""
@@ -335,9 +543,13 @@ class Game:
     def from_fen_dict(self, fen_dict: Dict):
         """Загружает позицию из формата с FEN обеих досок и запасами"""
         if "boardA" in fen_dict:
+            clock = self.board_a.clock
             self.board_a = ChessBoard.from_fen(fen_dict["boardA"])
+            self.board_a.clock = clock
         if "boardB" in fen_dict:
+            clock = self.board_b.clock
             self.board_b = ChessBoard.from_fen(fen_dict["boardB"])
+            self.board_b.clock = clock
         
         self.players[1].board = self.board_a
         self.players[4].board = self.board_a
@@ -353,4 +565,9 @@ class Game:
                 for piece_symbol, count in counts.items():
                     piece_class = self._parse_piece_symbol(piece_symbol)
                     for _ in range(count):
-                        player.pieces_reserve.add(piece_class)
\ No newline at end of file
+                        player.pieces_reserve.add(piece_class)
+        self.revision += 1
+        # Загруженная позиция — начало новой записи партии; сохраняется целиком,
+        # даже если fen_dict задавал не всё (одну доску, без запасов)
+        self.history = []
+        self.start_position = self.to_fen_dict()
@@ -0,0 +1,136 @@
+"""Структурированное логирование сервера.
+
+Обработчики в цикле событий только кладут запись в очередь
+(QueueHandler); форматирование в JSON и запись в stderr делает отдельный
+поток QueueListener, поэтому медленный stdout/stderr не задерживает
+цикл событий. Одна запись — одна строка JSON с полями ts, level, logger,
+msg и контекстом, переданным через extra: session, player, version.
+
+Повторяющиеся предупреждения и ошибки ограничиваются: не больше
+LOG_RATE_LIMIT одинаковых сообщений за LOG_RATE_WINDOW секунд; число
+подавленных попадает в поле suppressed следующей пропущенной записи.
+
+Переменные окружения: LOG_LEVEL (INFO), LOG_RATE_LIMIT (10),
+LOG_RATE_WINDOW (60).
+"""
+import atexit
+import copy
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import time
+from typing import Dict, Optional, Tuple
+
+
+ROOT_LOGGER = "bughouse"
+# Поля контекста, которые переносятся из extra в JSON
+CONTEXT_FIELDS = ("session", "player", "version", "endpoint")
+
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": round(record.created, 3),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        for field in CONTEXT_FIELDS:
+            value = getattr(record, field, None)
+            if value is not None:
+                entry[field] = value
+        suppressed = getattr(record, "suppressed", 0)
+        if suppressed:
+            entry["suppressed"] = suppressed
+        if record.exc_text:
+            entry["exc"] = record.exc_text
+        elif record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False)
+
+
+class _QueueHandler(logging.handlers.QueueHandler):
+    """В отличие от стандартного, не склеивает traceback с текстом сообщения"""
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = copy.copy(record)
+        # Аргументы подставляем сразу: они могут измениться, пока запись в очереди
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = _TRACEBACKS.formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+_TRACEBACKS = logging.Formatter()
+
+
+class RateLimitFilter(logging.Filter):
+    """Пропускает не больше limit одинаковых записей уровня WARNING+ за window секунд.
+
+    Одинаковыми считаются записи с тем же логгером, уровнем и шаблоном
+    сообщения (до подстановки аргументов).
+    """
+
+    def __init__(self, limit: int = 10, window: float = 60.0):
+        super().__init__()
+        self.limit = limit
+        self.window = window
+        # ключ -> [начало окна, пропущено в окне, подавлено]
+        self._buckets: Dict[Tuple[str, int, str], list] = {}
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno < logging.WARNING or self.limit <= 0:
+            return True
+        key = (record.name, record.levelno, str(record.msg))
+        now = time.monotonic()
+        bucket = self._buckets.get(key)
+        if bucket is None or now - bucket[0] >= self.window:
+            suppressed = bucket[2] if bucket is not None else 0
+            self._buckets[key] = [now, 1, 0]
+            record.suppressed = suppressed
+            return True
+        if bucket[1] < self.limit:
+            bucket[1] += 1
+            record.suppressed, bucket[2] = bucket[2], 0
+            return True
+        bucket[2] += 1
+        return False
+
+
+def configure(level: Optional[str] = None, stream=None) -> logging.Logger:
+    """Настраивает логгер bughouse (повторный вызов ничего не делает)"""
+    global _listener
+    logger = logging.getLogger(ROOT_LOGGER)
+    if _listener is not None:
+        return logger
+    logger.setLevel((level or os.getenv("LOG_LEVEL", "INFO")).upper())
+    logger.propagate = False
+
+    records: queue.SimpleQueue = queue.SimpleQueue()
+    queue_handler = _QueueHandler(records)
+    queue_handler.addFilter(RateLimitFilter(
+        int(os.getenv("LOG_RATE_LIMIT", "10")), float(os.getenv("LOG_RATE_WINDOW", "60"))
+    ))
+    logger.addHandler(queue_handler)
+
+    output = logging.StreamHandler(stream or sys.stderr)
+    output.setFormatter(JsonFormatter())
+    _listener = logging.handlers.QueueListener(records, output, respect_handler_level=True)
+    _listener.start()
+    atexit.register(shutdown)
+    return logger
+
+
+def shutdown():
+    """Дописывает очередь и останавливает поток записи"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
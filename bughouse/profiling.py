@@ -0,0 +1,150 @@
+"""Профилирование отдельных запросов (cProfile) по выборке или заголовку.
+
+Профиль снимается, если запрос пришёл с заголовком X-Bughouse-Profile,
+значение которого совпадает с PROFILE_SECRET (без секрета заголовок
+игнорируется), или попал в случайную выборку PROFILE_SAMPLE_RATE.
+Результат пишется в PROFILE_DIR: <имя>.prof (pstats, открывается
+python -m pstats / snakeviz) и <имя>.json с id сессии, игроком, версией,
+FEN позиции до хода и сводкой по Game.make_move, is_checkmate,
+check_game_over и build_state.
+
+Когда профилирование выключено, обработчик получает заглушку: проверка
+стоит одно сравнение, cProfile не создаётся.
+"""
+import cProfile
+import io
+import json
+import logging
+import os
+import pstats
+import random
+import time
+import uuid
+from typing import Any, Callable, Dict, Mapping, Optional
+
+
+logger = logging.getLogger(__name__)
+
+
+PROFILE_HEADER = "x-bughouse-profile"
+
+# Функции, время которых выносится в сводку (имя функции, фрагмент пути файла)
+SUMMARY_FUNCTIONS = [
+    ("make_move", "game.py"),
+    ("make_drop", "game.py"),
+    ("check_game_over", "game.py"),
+    ("is_checkmate", "chess_board.py"),
+    ("build_state", "web_server.py"),
+]
+
+
+class _NullProbe:
+    """Заглушка при выключенном профилировании"""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+NULL_PROBE = _NullProbe()
+
+
+class ProfileProbe:
+    """Профиль одного запроса. Блок профиля не содержит await: пока он
+    открыт, чужие корутины не выполняются и в профиль не попадают."""
+
+    def __init__(self, profiler: 'RequestProfiler', endpoint: str, trigger: str, context: Callable[[], Dict]):
+        self.profiler = profiler
+        self.endpoint = endpoint
+        self.trigger = trigger
+        self.context = context
+        self.profile = cProfile.Profile()
+        self.started = 0.0
+
+    def __enter__(self):
+        self.profiler.active = True
+        self.started = time.perf_counter()
+        self.profile.enable()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.profile.disable()
+        wall = time.perf_counter() - self.started
+        self.profiler.active = False
+        try:
+            self.profiler.write(self, wall, exc)
+        except Exception:
+            logger.exception("Profiling: failed to write profile")
+        return False
+
+
+class RequestProfiler:
+    def __init__(self, directory: str, sample_rate: float = 0.0, secret: Optional[str] = None):
+        self.directory = directory
+        self.sample_rate = sample_rate
+        self.secret = secret or None
+        # cProfile в потоке может быть только один, а корутины обработчиков чередуются
+        self.active = False
+        self.written = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.sample_rate > 0 or self.secret is not None
+
+    def probe(self, endpoint: str, headers: Mapping[str, str], context: Callable[[], Dict]):
+        """Профиль для запроса или NULL_PROBE. context вызывается только при профилировании."""
+        if not self.enabled or self.active:
+            return NULL_PROBE
+        if self.secret is not None and headers.get(PROFILE_HEADER) == self.secret:
+            trigger = "header"
+        elif self.sample_rate > 0 and random.random() < self.sample_rate:
+            trigger = "sample"
+        else:
+            return NULL_PROBE
+        return ProfileProbe(self, endpoint, trigger, context)
+
+    def write(self, probe: ProfileProbe, wall: float, exc: Optional[BaseException]):
+        os.makedirs(self.directory, exist_ok=True)
+        context = probe.context()
+        name = "{}-{}-{}-{}".format(
+            time.strftime("%Y%m%d-%H%M%S"),
+            probe.endpoint.strip("/").replace("/", "_"),
+            context.get("sessionId", "nosession"),
+            uuid.uuid4().hex[:8],
+        )
+        base = os.path.join(self.directory, name)
+        probe.profile.dump_stats(base + ".prof")
+        stats = pstats.Stats(probe.profile, stream=io.StringIO())
+        meta = {
+            "endpoint": probe.endpoint,
+            "trigger": probe.trigger,
+            "wallMs": wall * 1000,
+            "error": f"{type(exc).__name__}: {exc}" if exc is not None else None,
+            "summary": summarize(stats),
+        }
+        meta.update(context)
+        with open(base + ".json", "w", encoding="utf-8") as f:
+            json.dump(meta, f, ensure_ascii=False, indent=2)
+        self.written += 1
+
+
+def summarize(stats: pstats.Stats) -> Dict[str, Dict[str, Any]]:
+    """Число вызовов и суммарное (cumulative) время ключевых функций"""
+    summary: Dict[str, Dict[str, Any]] = {}
+    for (filename, _, function), (_, calls, _, cumulative, _) in stats.stats.items():
+        for wanted, path_part in SUMMARY_FUNCTIONS:
+            if function == wanted and filename.endswith(path_part):
+                entry = summary.setdefault(wanted, {"calls": 0, "cumulativeMs": 0.0})
+                entry["calls"] += calls
+                entry["cumulativeMs"] += cumulative * 1000
+    return summary
+
+
+def create_profiler() -> RequestProfiler:
+    return RequestProfiler(
+        os.getenv("PROFILE_DIR", "profiles"),
+        sample_rate=float(os.getenv("PROFILE_SAMPLE_RATE", "0")),
+        secret=os.getenv("PROFILE_SECRET"),
+    )
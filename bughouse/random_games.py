@@ -0,0 +1,148 @@
+"""Случайные партии через настоящий API Game — для фаззинга и бенчмарков.
+
+Каждое действие проходит через Game.make_move/make_drop, поэтому партии
+легальны по определению: запасы, дропы, превращения с забором фигуры у
+партнёра соперника — всё проверяет сама Game. Ход выбирается лениво:
+фигуры и их цели перебираются в случайном порядке, пока Game не примет
+первый; полный список ходов не строится.
+
+Доски чередуются не строго по очереди: у каждой доски свои виртуальные
+часы, время на ход — экспоненциальное со средним think_time, и ходит
+доска, чьи часы меньше. Так бывают серии ходов на одной доске, как в
+живой партии. Виртуальное время попадает в ts записи ходов, поэтому
+BPGN сгенерированной партии тоже детерминирован.
+
+Партия определяется зерном: game_rng(seed, index) даёт один и тот же
+генератор в любом процессе (порядок перебора не зависит от хешей
+множеств), так что архивы можно генерировать параллельно по частям.
+"""
+import math
+import random
+from typing import Any, Dict, Iterator, List, Optional
+
+from bughouse.color import Color
+from bughouse.figures import Pawn, Knight, Bishop, Rook, Queen
+from bughouse.game import Game, PromotionRequired
+
+
+SEATS = {"A": (1, 4), "B": (2, 3)}
+RESERVE = {"P": Pawn, "N": Knight, "B": Bishop, "R": Rook, "Q": Queen}
+# Доля действий, где сначала пробуется дроп (если в запасе что-то есть)
+DROP_SHARE = 0.2
+# Сколько случайных дропов пробовать, прежде чем перейти к ходам
+DROP_TRIES = 8
+# Среднее виртуальное время на ход, секунды
+THINK_TIME = 2.0
+# Начало виртуального времени партий (2024-01-01 UTC) — для тегов Date/Time
+EPOCH = 1704067200.0
+
+
+def game_rng(seed: int, index: int) -> random.Random:
+    """Генератор партии index прогона seed"""
+    return random.Random(f"{seed}/{index}")
+
+
+def _drops(rng: random.Random, game: Game, player_id: int) -> List[Dict[str, Any]]:
+    """Все возможные по запасу и пустым клеткам дропы игрока, в случайном порядке"""
+    player = game.get_player(player_id)
+    symbols = [symbol for symbol, cls in RESERVE.items() if player.pieces_reserve.get_count(cls) > 0]
+    if not symbols:
+        return []
+    squares = [(file, rank) for file, column in enumerate(player.board.squares)
+               for rank, piece in enumerate(column) if piece is None]
+    drops = [{"type": "drop", "piece": symbol, "square": "abcdefgh"[file] + str(rank + 1)}
+             for symbol in symbols for file, rank in squares
+             if symbol != "P" or 0 < rank < 7]
+    rng.shuffle(drops)
+    return drops
+
+
+def _try_drops(game: Game, player_id: int, drops: List[Dict[str, Any]]) -> bool:
+    for drop in drops:
+        try:
+            game.make_drop(player_id, drop["piece"], drop["square"])
+            return True
+        except ValueError:
+            continue
+    return False
+
+
+def _try_move(rng: random.Random, game: Game, player_id: int, source: str, target: str) -> bool:
+    try:
+        game.make_move(player_id, source, target)
+        return True
+    except PromotionRequired as pr:
+        options = list(pr.options)
+        rng.shuffle(options)
+        for option in options:
+            try:
+                game.make_move(player_id, source, target,
+                               victim_player_id=pr.victim_player_id, victim_square=option["square"])
+                return True
+            except ValueError:
+                continue
+        return False
+    except ValueError:
+        return False
+
+
+def random_action(rng: random.Random, game: Game, player_id: int, drop_share: float = DROP_SHARE) -> bool:
+    """Делает случайное действие игрока в game; False — ни ход, ни дроп невозможен"""
+    player = game.get_player(player_id)
+    board = player.board
+    # Список дропов строится, только если он нужен: это 64 клетки на каждую фигуру запаса
+    drops = _drops(rng, game, player_id) if rng.random() < drop_share else None
+    if drops:
+        if _try_drops(game, player_id, drops[:DROP_TRIES]):
+            return True
+        drops = drops[DROP_TRIES:]
+    pieces = [piece for column in board.squares for piece in column
+              if piece is not None and piece.color == player.color]
+    rng.shuffle(pieces)
+    for piece in pieces:
+        source = str(piece.coordinate)
+        # Цели — множество: сортировка делает порядок независимым от хешей
+        targets = sorted(str(target) for target in piece.get_possible_moves(board))
+        rng.shuffle(targets)
+        for target in targets:
+            if _try_move(rng, game, player_id, source, target):
+                return True
+    # Ходов нет (например, шах): закрыться можно только дропом
+    if drops is None:
+        drops = _drops(rng, game, player_id)
+    return _try_drops(game, player_id, drops)
+
+
+def play_random_game(rng: random.Random, plies: int, drop_share: float = DROP_SHARE,
+                     think_time: float = THINK_TIME, start_position: Optional[Dict[str, Any]] = None) -> Game:
+    """Случайная партия не длиннее plies полуходов на двух досках (или до мата)"""
+    game = Game()
+    if start_position is not None:
+        game.from_fen_dict(start_position)
+    clocks = {"A": rng.expovariate(1 / think_time), "B": rng.expovariate(1 / think_time)}
+    for _ in range(plies):
+        if game.check_game_over() is not None:
+            break
+        name = min(clocks, key=clocks.get)
+        if math.isinf(clocks[name]):
+            # Обе доски без хода: дальше партия не сдвинется
+            break
+        board = game.board_a if name == "A" else game.board_b
+        white, black = SEATS[name]
+        player_id = white if board.get_current_player() == Color.WHITE else black
+        if not random_action(rng, game, player_id, drop_share):
+            # Доске нечем ходить, пока не изменятся запасы — ждёт хода на другой
+            clocks[name] = math.inf
+            continue
+        game.history[-1]["ts"] = EPOCH + clocks[name]
+        clocks[name] += rng.expovariate(1 / think_time)
+        other = "B" if name == "A" else "A"
+        if math.isinf(clocks[other]):
+            clocks[other] = clocks[name]
+    return game
+
+
+def random_games(seed: int, count: int, plies: int, start: int = 0, **options) -> Iterator[Game]:
+    """Партии start..start+count-1 прогона seed; options — как у play_random_game"""
+    for index in range(start, start + count):
+        yield play_random_game(game_rng(seed, index), plies, **options)
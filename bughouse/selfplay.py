@@ -0,0 +1,204 @@
+"""Партии самоигры и их позиции в виде тензоров для обучения моделей.
+
+Позиция кодируется целиком, обе доски, в фиксированную форму:
+- planes (26, 8, 8) uint8: доска (A, B) × цвет (белые, чёрные) × фигура
+  (P, N, B, R, Q, K) — 24 плоскости, индекс [файл][горизонталь] как в
+  ChessBoard.squares, и две плоскости очереди хода (единицы, если на
+  доске A / B ходят белые);
+- reserves (4, 5) uint8: запасы игроков 1–4 (P, N, B, R, Q);
+- meta (META_DTYPE): партия, номер полухода, кто ходил, сделанный ход
+  (explorer.encode_move) и результат для команды 1 и 3 (+1, -1, 0).
+
+Позиции пишутся в шарды — .npy фиксированного размера, открытые через
+np.lib.format.open_memmap, так что в памяти держится не больше одного
+шарда. Рядом — manifest.json со списком готовых шардов и числом позиций
+в каждом; он перезаписывается после каждого шарда, поэтому архив
+самоигры можно читать (load_shards), пока генерация продолжается.
+"""
+import json
+import os
+import random
+import time
+from typing import Any, Dict, Iterator, Optional, Tuple
+
+import numpy as np
+
+from bughouse.batch_eval import PIECE_ORDER, RESERVE_ORDER
+from bughouse.color import Color
+from bughouse.engine import apply_action, candidate_actions, choose_action
+from bughouse.explorer import encode_move
+from bughouse.game import Game
+
+
+PLANES = 2 * 2 * len(PIECE_ORDER) + 2
+PLANES_SHAPE = (PLANES, 8, 8)
+RESERVES_SHAPE = (4, len(RESERVE_ORDER))
+META_DTYPE = np.dtype([("game", "<u8"), ("ply", "<u2"), ("player", "u1"), ("move", "<u4"), ("result", "i1")])
+MODES = ("random", "engine")
+SEATS = {"A": (1, 4), "B": (2, 3)}
+_PLANE = {cls: index for index, cls in enumerate(PIECE_ORDER)}
+
+
+def encode_position(game: Game, planes: np.ndarray, reserves: np.ndarray):
+    """Кодирует позицию в planes (26, 8, 8) и reserves (4, 5)"""
+    planes[:] = 0
+    for board_index, board in enumerate((game.board_a, game.board_b)):
+        for file, column in enumerate(board.squares):
+            for rank, piece in enumerate(column):
+                if piece is not None:
+                    color_index = 0 if piece.color == Color.WHITE else 1
+                    planes[(board_index * 2 + color_index) * len(PIECE_ORDER) + _PLANE[type(piece)], file, rank] = 1
+        if board.get_current_player() == Color.WHITE:
+            planes[PLANES - 2 + board_index] = 1
+    for index, player_id in enumerate((1, 2, 3, 4)):
+        reserve = game.players[player_id].pieces_reserve
+        reserves[index] = [reserve.get_count(cls) for cls in RESERVE_ORDER]
+
+
+def _next_action(rng: random.Random, game: Game, player_id: int, mode: str,
+                 move_time: float) -> Optional[Game]:
+    """Позиция после хода игрока или None, если ходить нечем"""
+    if mode == "engine":
+        action = choose_action(game.to_fen_dict(), player_id, move_time)["action"]
+        return apply_action(game, player_id, action) if action is not None else None
+    actions = candidate_actions(game, player_id)
+    rng.shuffle(actions)
+    for action in actions:
+        # Кандидаты псевдолегальны: первый принятый Game и есть ход
+        child = apply_action(game, player_id, action)
+        if child is not None:
+            return child
+    return None
+
+
+def play_game(game_id: int, seed: int, mode: str = "random", plies: int = 200,
+              move_time: float = 0.1) -> Dict[str, Any]:
+    """Партия самоигры: на каждом полуходе случайно выбирается доска, ходит та сторона, чья очередь.
+
+    Возвращает {"planes", "reserves", "meta", "seconds", "pid"}: позиции
+    перед каждым ходом и время партии в процессе, где она игралась.
+    """
+    if mode not in MODES:
+        raise ValueError(f"Неизвестный режим самоигры: {mode}")
+    started = time.perf_counter()
+    rng = random.Random(seed)
+    game = Game()
+    planes = np.zeros((plies,) + PLANES_SHAPE, dtype=np.uint8)
+    reserves = np.zeros((plies,) + RESERVES_SHAPE, dtype=np.uint8)
+    meta = np.zeros(plies, dtype=META_DTYPE)
+    count = 0
+    while count < plies and game.check_game_over() is None:
+        name = rng.choice("AB")
+        board = game.board_a if name == "A" else game.board_b
+        white, black = SEATS[name]
+        player_id = white if board.get_current_player() == Color.WHITE else black
+        child = _next_action(rng, game, player_id, mode, move_time)
+        if child is None:
+            break
+        encode_position(game, planes[count], reserves[count])
+        meta[count] = (game_id, count, player_id, encode_move(child.history[-1]), 0)
+        game = child
+        count += 1
+    game_over = game.check_game_over()
+    if game_over is not None:
+        meta["result"][:count] = 1 if game_over["winner"] == "team1" else -1
+    return {
+        "planes": planes[:count],
+        "reserves": reserves[:count],
+        "meta": meta[:count],
+        "seconds": time.perf_counter() - started,
+        "pid": os.getpid(),
+    }
+
+
+class ShardWriter:
+    """Пишет позиции в шарды по shard_positions позиций и ведёт manifest.json"""
+
+    def __init__(self, directory: str, shard_positions: int = 100_000):
+        self.directory = directory
+        self.shard_positions = shard_positions
+        self.manifest_path = os.path.join(directory, "manifest.json")
+        self.manifest: Dict[str, Any] = {
+            "planesShape": list(PLANES_SHAPE),
+            "reservesShape": list(RESERVES_SHAPE),
+            "metaDtype": [list(field) for field in META_DTYPE.descr],
+            "shards": [],
+        }
+        if os.path.exists(self.manifest_path):
+            # Продолжение: новые шарды дописываются к уже готовым
+            with open(self.manifest_path, "r", encoding="utf-8") as f:
+                self.manifest["shards"] = json.load(f)["shards"]
+        self._arrays: Optional[Tuple[np.memmap, np.memmap, np.memmap]] = None
+        self._name = ""
+        self._filled = 0
+
+    @property
+    def positions(self) -> int:
+        return sum(shard["positions"] for shard in self.manifest["shards"]) + self._filled
+
+    def _open(self):
+        os.makedirs(self.directory, exist_ok=True)
+        self._name = f"shard-{len(self.manifest['shards']) + 1:06d}"
+        base = os.path.join(self.directory, self._name)
+        size = self.shard_positions
+        self._arrays = (
+            np.lib.format.open_memmap(base + ".planes.npy", mode="w+", dtype=np.uint8, shape=(size,) + PLANES_SHAPE),
+            np.lib.format.open_memmap(base + ".reserves.npy", mode="w+", dtype=np.uint8, shape=(size,) + RESERVES_SHAPE),
+            np.lib.format.open_memmap(base + ".meta.npy", mode="w+", dtype=META_DTYPE, shape=(size,)),
+        )
+        self._filled = 0
+
+    def write(self, planes: np.ndarray, reserves: np.ndarray, meta: np.ndarray):
+        start = 0
+        while start < len(meta):
+            if self._arrays is None:
+                self._open()
+            take = min(len(meta) - start, self.shard_positions - self._filled)
+            for target, source in zip(self._arrays, (planes, reserves, meta)):
+                target[self._filled:self._filled + take] = source[start:start + take]
+            self._filled += take
+            start += take
+            if self._filled == self.shard_positions:
+                self._finish()
+
+    def _finish(self):
+        """Закрывает текущий шард; неполный (в конце работы) обрезается до числа позиций"""
+        if self._arrays is None:
+            return
+        filled = self._filled
+        for array in self._arrays:
+            array.flush()
+        if filled < self.shard_positions:
+            base = os.path.join(self.directory, self._name)
+            for suffix, array in zip((".planes.npy", ".reserves.npy", ".meta.npy"), self._arrays):
+                np.save(base + suffix + ".tmp.npy", array[:filled])
+            for suffix in (".planes.npy", ".reserves.npy", ".meta.npy"):
+                os.replace(base + suffix + ".tmp.npy", base + suffix)
+        self._arrays = None
+        self._filled = 0
+        if filled:
+            self.manifest["shards"].append({"name": self._name, "positions": filled})
+        else:
+            for suffix in (".planes.npy", ".reserves.npy", ".meta.npy"):
+                os.remove(os.path.join(self.directory, self._name + suffix))
+        self._write_manifest()
+
+    def _write_manifest(self):
+        self.manifest["positions"] = sum(shard["positions"] for shard in self.manifest["shards"])
+        tmp_path = f"{self.manifest_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.manifest, f, indent=2)
+        os.replace(tmp_path, self.manifest_path)
+
+    def close(self):
+        self._finish()
+
+
+def load_shards(directory: str) -> Iterator[Tuple[np.ndarray, np.ndarray, np.ndarray]]:
+    """Готовые шарды из manifest.json: (planes, reserves, meta), открытые только на чтение"""
+    with open(os.path.join(directory, "manifest.json"), "r", encoding="utf-8") as f:
+        manifest = json.load(f)
+    for shard in manifest["shards"]:
+        base = os.path.join(directory, shard["name"])
+        yield tuple(np.load(base + suffix, mmap_mode="r")[:shard["positions"]]
+                    for suffix in (".planes.npy", ".reserves.npy", ".meta.npy"))
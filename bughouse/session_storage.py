@@ -0,0 +1,79 @@
+import json
+import os
+import re
+from typing import Any, Dict, List, Optional
+
+
+_SAFE_KEY = re.compile(r"^[0-9A-Za-z-]+$")
+
+
+class SessionStorage:
+    """Локальное хранилище "холодных" сессий: одна сессия — один JSON-файл.
+
+    Рядом с сессиями хранится индекс токенов (token -> session_id), чтобы
+    после выселения сессии из памяти её можно было найти по токену игрока.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.sessions_dir = os.path.join(directory, "sessions")
+        self.tokens_dir = os.path.join(directory, "tokens")
+
+    def _ensure_dirs(self):
+        os.makedirs(self.sessions_dir, exist_ok=True)
+        os.makedirs(self.tokens_dir, exist_ok=True)
+
+    def _session_path(self, session_id: str) -> str:
+        if not _SAFE_KEY.match(session_id):
+            raise ValueError(f"Недопустимый id сессии: {session_id}")
+        return os.path.join(self.sessions_dir, f"{session_id}.json")
+
+    def _token_path(self, token: str) -> Optional[str]:
+        if not _SAFE_KEY.match(token):
+            return None
+        return os.path.join(self.tokens_dir, token)
+
+    @staticmethod
+    def _write_atomic(path: str, data: str):
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+    def save(self, session_id: str, data: Dict[str, Any], tokens: List[str]):
+        """Сохраняет сессию и регистрирует её токены"""
+        self._ensure_dirs()
+        self._write_atomic(self._session_path(session_id), json.dumps(data))
+        for token in tokens:
+            token_path = self._token_path(token)
+            if token_path is not None and not os.path.exists(token_path):
+                self._write_atomic(token_path, session_id)
+
+    def load(self, session_id: str) -> Optional[Dict[str, Any]]:
+        """Загружает сохранённую сессию или возвращает None"""
+        try:
+            with open(self._session_path(session_id), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def find_session_id(self, token: str) -> Optional[str]:
+        """Ищет id выселенной сессии по токену игрока"""
+        token_path = self._token_path(token)
+        if token_path is None:
+            return None
+        try:
+            with open(token_path, "r", encoding="utf-8") as f:
+                return f.read().strip() or None
+        except FileNotFoundError:
+            return None
+
+    def delete(self, session_id: str, tokens: List[str]):
+        """Удаляет сохранённую сессию и её токены"""
+        for path in [self._session_path(session_id)] + [self._token_path(t) for t in tokens]:
+            if path is None:
+                continue
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
@@ -0,0 +1,100 @@
+import time
+from typing import Callable, List, Optional
+
+
+class TimerHandle:
+    __slots__ = ("deadline_tick", "callback", "cancelled")
+
+    def __init__(self, deadline_tick: int, callback: Callable[[], None]):
+        self.deadline_tick = deadline_tick
+        self.callback = callback
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+
+
+class TimerWheel:
+    """Иерархическое колесо таймеров: один планировщик на все партии сервера.
+
+    Уровень 0 — слоты по tick секунд, каждый следующий уровень в slots раз
+    грубее. Таймер кладётся в уровень, покрывающий его срок, и по мере
+    приближения срока опускается на уровень ниже. Вставка и отмена — O(1)
+    (отмена ленивая), продвижение на тик — O(сработавших + опустившихся).
+    """
+
+    def __init__(self, tick: float = 0.01, slots: int = 256, levels: int = 4, now: Callable[[], float] = time.monotonic):
+        if slots & (slots - 1):
+            raise ValueError("slots должно быть степенью двойки")
+        self.tick = tick
+        self.slots = slots
+        self.levels = levels
+        self._bits = slots.bit_length() - 1
+        self._mask = slots - 1
+        self._wheels: List[List[List[TimerHandle]]] = [[[] for _ in range(slots)] for _ in range(levels)]
+        self._now = now
+        self._origin = now()
+        self.current_tick = 0
+        # Включая отменённые, но ещё не выметенные таймеры
+        self.pending = 0
+
+    def _to_tick(self, when: float) -> int:
+        # Округляем вверх: таймер не срабатывает раньше срока
+        ticks = (when - self._origin) / self.tick
+        whole = int(ticks)
+        return whole if whole == ticks else whole + 1
+
+    def schedule(self, when: float, callback: Callable[[], None]) -> TimerHandle:
+        """Планирует callback на момент when (по тем же часам, что и now)"""
+        handle = TimerHandle(max(self._to_tick(when), self.current_tick + 1), callback)
+        self._insert(handle)
+        self.pending += 1
+        return handle
+
+    def _insert(self, handle: TimerHandle):
+        delta = handle.deadline_tick - self.current_tick
+        for level in range(self.levels):
+            if delta < (1 << (self._bits * (level + 1))) or level == self.levels - 1:
+                slot = (handle.deadline_tick >> (self._bits * level)) & self._mask
+                self._wheels[level][slot].append(handle)
+                return
+
+    def _cascade(self, level: int):
+        """Опускает таймеры текущего слота уровня level на уровни ниже"""
+        slot = (self.current_tick >> (self._bits * level)) & self._mask
+        bucket = self._wheels[level][slot]
+        if not bucket:
+            return
+        self._wheels[level][slot] = []
+        for handle in bucket:
+            if handle.cancelled:
+                self.pending -= 1
+            else:
+                self._insert(handle)
+
+    def advance(self, now: Optional[float] = None) -> int:
+        """Продвигает колесо до момента now и вызывает наступившие таймеры"""
+        target = int(((self._now() if now is None else now) - self._origin) / self.tick)
+        fired = 0
+        while self.current_tick < target:
+            self.current_tick += 1
+            for level in range(1, self.levels):
+                if self.current_tick & ((1 << (self._bits * level)) - 1):
+                    break
+                self._cascade(level)
+            slot = self.current_tick & self._mask
+            bucket = self._wheels[0][slot]
+            if not bucket:
+                continue
+            self._wheels[0][slot] = []
+            for handle in bucket:
+                if handle.deadline_tick > self.current_tick:
+                    # Последний уровень может хранить таймеры дальше одного оборота
+                    self._insert(handle)
+                    continue
+                self.pending -= 1
+                if handle.cancelled:
+                    continue
+                fired += 1
+                handle.callback()
+        return fired
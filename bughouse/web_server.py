@@ -1,12 +1,20 @@
 import os
+import logging
 import socket
 import uuid
 import json
+import hashlib
+import itertools
 import asyncio
-from typing import Dict, List, Optional, Set
+import time
+import multiprocessing
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Dict, List, Optional, Set, Tuple
 from fastapi import FastAPI, HTTPException, Query, WebSocket, WebSocketDisconnect
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import RedirectResponse, JSONResponse
+from fastapi.responses import RedirectResponse, JSONResponse, Response
 from pydantic import BaseModel, Field
 from fastapi import FastAPI, HTTPException, Query, WebSocket, WebSocketDisconnect, Request
 from bughouse.game import PromotionRequired
@@ -15,14 +23,147 @@ from bughouse.player import Player
 from bughouse.chess_board import ChessBoard
 from bughouse.color import Color
 from bughouse.figures import Pawn, Knight, Bishop, Rook, Queen
+from bughouse.engine import analyze_position, choose_action
+from bughouse.archive import GameArchive
+from bughouse.bpgn import write_bpgn
+from bughouse.explorer import PositionIndex, game_positions, result_code
+from bughouse.session_storage import SessionStorage
+from bughouse.cluster import current_shard, shard_for
+from bughouse.fanout import create_fanout
+from bughouse.timer_wheel import TimerWheel
+from bughouse.metrics import BYTES_BUCKETS, CONTENT_TYPE, REGISTRY, MetricsMiddleware
+from bughouse.profiling import create_profiler
+from bughouse import log
+
+log.configure()
+logger = logging.getLogger(__name__)
 
 app = FastAPI()
 
-# Хранилище сессий и токенов
-SESSIONS: Dict[str, 'Session'] = {}
+# Хранилище сессий и токенов (SESSIONS упорядочен по последнему обращению — LRU)
+SESSIONS: 'OrderedDict[str, Session]' = OrderedDict()
 TOKENS: Dict[str, 'TokenRef'] = {}
+# Токены зрителей: token -> session_id
+SPECTATOR_TOKENS: Dict[str, str] = {}
 # Хранилище активных WebSocket соединений
 WEBSOCKET_CONNECTIONS: Dict[str, Set[WebSocket]] = {}
+SPECTATOR_CONNECTIONS: Dict[str, Set[WebSocket]] = {}
+# Рассылка обновлений (внутри процесса или через локальный брокер)
+FANOUT = create_fanout()
+
+# Выселение простаивающих сессий на диск
+SESSION_IDLE_TTL = float(os.getenv("SESSION_IDLE_TTL", "1800"))
+MAX_RESIDENT_SESSIONS = int(os.getenv("MAX_RESIDENT_SESSIONS", "1000"))
+EVICTION_INTERVAL = float(os.getenv("EVICTION_INTERVAL", "30"))
+SESSION_STORAGE = SessionStorage(os.getenv("SESSION_STORAGE_DIR", "session_storage"))
+# Законченные партии уходят в архив (фоновый поток), после чего сессия
+# выселяется уже после FINISHED_SESSION_TTL простоя, а не SESSION_IDLE_TTL
+FINISHED_SESSION_TTL = float(os.getenv("FINISHED_SESSION_TTL", "60"))
+GAME_ARCHIVE = GameArchive(
+    os.getenv("GAME_ARCHIVE_DIR", "game_archive"),
+    compression=os.getenv("GAME_ARCHIVE_COMPRESSION", "gzip"),
+    batch_size=int(os.getenv("GAME_ARCHIVE_BATCH", "64")),
+    flush_interval=float(os.getenv("GAME_ARCHIVE_FLUSH_INTERVAL", "1.0")),
+    # Воркеры кластера пишут в общий каталог, каждый — в свои сегменты
+    writer=f"w{current_shard()[0]}" if current_shard()[1] > 1 else None,
+)
+# Общее колесо таймеров для отслеживания падения флага во всех партиях
+CLOCK_WHEEL = TimerWheel(tick=float(os.getenv("CLOCK_TICK", "0.05")))
+# Задержка трансляции для зрителей, секунды
+SPECTATOR_DELAY = float(os.getenv("SPECTATOR_DELAY", "0"))
+# Сколько ждать отправки кадра одному WebSocket, секунды: зависший клиент
+# выбывает из рассылки, не задерживая остальных
+WS_SEND_TIMEOUT = float(os.getenv("WS_SEND_TIMEOUT", "5"))
+# Окно склейки рассылок сессии: не чаще одной рассылки за окно, секунды
+BROADCAST_WINDOW = float(os.getenv("BROADCAST_WINDOW_MS", "10")) / 1000
+# Движок на местах ботов: время на ход, секунды, и число процессов поиска
+BOT_MOVE_TIME = float(os.getenv("BOT_MOVE_TIME", "1.0"))
+BOT_WORKERS = int(os.getenv("BOT_WORKERS", "1"))
+# Сколько раз бот ищет ход заново, если позиция изменилась за время поиска
+BOT_MAX_ATTEMPTS = 3
+_BOT_EXECUTOR: Optional[ProcessPoolExecutor] = None
+# Анализ позиций (/api/analyze): процессы поиска, лимит задач в очереди и в работе,
+# время на доску, секунды, и сколько готовых результатов хранить (LRU)
+ANALYSIS_WORKERS = int(os.getenv("ANALYSIS_WORKERS", "1"))
+ANALYSIS_QUEUE_LIMIT = int(os.getenv("ANALYSIS_QUEUE_LIMIT", "32"))
+ANALYSIS_MOVE_TIME = float(os.getenv("ANALYSIS_MOVE_TIME", "2.0"))
+ANALYSIS_CACHE_SIZE = int(os.getenv("ANALYSIS_CACHE_SIZE", "1024"))
+_ANALYSIS_EXECUTOR: Optional[ProcessPoolExecutor] = None
+# Готовые результаты по хешу позиции (он же id задачи), упорядочены по обращению
+ANALYSIS_RESULTS: 'OrderedDict[str, Dict[str, Any]]' = OrderedDict()
+# Задачи в очереди или в работе: одинаковые позиции ждут одну задачу
+ANALYSIS_JOBS: Dict[str, 'AnalysisJob'] = {}
+# Индекс позиций законченных партий (/api/explorer): каталог прогонов, сколько
+# записей копить в памяти до сброса очередного прогона на диск и сколько своих
+# прогонов допускать до фонового слияния (0 — сливать только tools.explorer_index)
+EXPLORER = PositionIndex(os.getenv("EXPLORER_DIR", "explorer_index"),
+                         flush_records=int(os.getenv("EXPLORER_FLUSH_RECORDS", "10000")),
+                         writer=f"w{current_shard()[0]}" if current_shard()[1] > 1 else None,
+                         max_runs=int(os.getenv("EXPLORER_MAX_RUNS", "8")))
+# Идущее фоновое слияние прогонов индекса
+_EXPLORER_COMPACTION: Optional[asyncio.Task] = None
+SESSION_STATS: Dict[str, float] = {
+    "evictions": 0,
+    "rehydrations": 0,
+    "rehydration_seconds_total": 0.0,
+    "rehydration_seconds_max": 0.0,
+}
+
+# Метрики для /metrics; доли 400/409 — из bughouse_http_responses_total по статусу
+HTTP_LATENCY = REGISTRY.histogram(
+    "bughouse_http_request_duration_seconds", "Длительность HTTP-запросов", ["method", "endpoint"])
+HTTP_RESPONSES = REGISTRY.counter(
+    "bughouse_http_responses_total", "HTTP-ответы по статусам", ["method", "endpoint", "status"])
+MOVE_VALIDATION = REGISTRY.histogram(
+    "bughouse_move_validation_seconds", "Проверка и применение хода или дропа", ["kind"])
+GAME_OVER_CHECK = REGISTRY.histogram(
+    "bughouse_game_over_check_seconds", "Проверка матов и флагов после хода")
+BROADCAST_DURATION = REGISTRY.histogram(
+    "bughouse_broadcast_duration_seconds", "Построение и публикация обновления сессии")
+BROADCAST_PAYLOAD = REGISTRY.histogram(
+    "bughouse_broadcast_payload_bytes", "Размер сообщения рассылки", ["channel"], buckets=BYTES_BUCKETS)
+BROADCAST_BYTES = REGISTRY.counter(
+    "bughouse_broadcast_bytes_total", "Байт отправлено в WebSocket-соединения", ["channel"])
+BROADCAST_SENDS = REGISTRY.counter(
+    "bughouse_broadcast_sends_total", "Сообщений отправлено в WebSocket-соединения", ["channel"])
+BROADCAST_COALESCED = REGISTRY.counter(
+    "bughouse_broadcast_coalesced_total", "Обновлений, вошедших в рассылку более новой версии")
+ANALYSIS_REQUESTS = REGISTRY.counter(
+    "bughouse_analysis_requests_total", "Запросы анализа: из кэша, к идущей задаче, новые, отклонённые", ["outcome"])
+REGISTRY.gauge("bughouse_analysis_jobs", "Задач анализа в очереди и в работе", function=lambda: len(ANALYSIS_JOBS))
+ARCHIVE_SUBMISSIONS = REGISTRY.counter(
+    "bughouse_archive_submissions_total", "Законченные партии, отданные в архив и отклонённые очередью", ["outcome"])
+REGISTRY.gauge("bughouse_archive_queue", "Партий в очереди записи архива", function=lambda: GAME_ARCHIVE.queue.qsize())
+REGISTRY.gauge("bughouse_resident_sessions", "Сессий в памяти", function=lambda: len(SESSIONS))
+REGISTRY.gauge("bughouse_resident_tokens", "Токенов игроков в памяти", function=lambda: len(TOKENS))
+REGISTRY.gauge("bughouse_websocket_connections", "WebSocket-соединений игроков",
+               function=lambda: sum(len(c) for c in WEBSOCKET_CONNECTIONS.values()))
+REGISTRY.gauge("bughouse_spectator_connections", "WebSocket-соединений зрителей",
+               function=lambda: sum(len(c) for c in SPECTATOR_CONNECTIONS.values()))
+REGISTRY.counter("bughouse_evictions_total", "Сессий выселено на диск",
+                 function=lambda: SESSION_STATS["evictions"])
+REGISTRY.counter("bughouse_rehydrations_total", "Сессий поднято с диска",
+                 function=lambda: SESSION_STATS["rehydrations"])
+
+# Профилирование запросов по выборке или заголовку (PROFILE_SAMPLE_RATE / PROFILE_SECRET)
+PROFILER = create_profiler()
+
+# Эндпоинт -> шаблон пути, заполняется при первом запросе (когда все маршруты уже объявлены)
+_ROUTE_PATHS: Dict[Any, str] = {}
+
+
+def metrics_endpoint_label(scope: Dict[str, Any]) -> str:
+    if not _ROUTE_PATHS:
+        for route in app.routes:
+            if hasattr(route, "endpoint"):
+                _ROUTE_PATHS[route.endpoint] = route.path
+            elif hasattr(route, "app"):
+                _ROUTE_PATHS[route.app] = "static"
+    return _ROUTE_PATHS.get(scope.get("endpoint"), "unmatched")
+
+
+app.add_middleware(
+    MetricsMiddleware, latency=HTTP_LATENCY, responses=HTTP_RESPONSES, endpoint_label=metrics_endpoint_label)
 
 class TokenRef:
     def __init__(self, session_id: str, player_id: int):
@@ -36,16 +177,564 @@ class Session:
         self.player_tokens = player_tokens
         self.version = 1
         self.fen_position: Optional[str] = None
+        self.last_access = time.monotonic()
+        self.spectator_token: Optional[str] = None
+        # Кадры для зрителей: (время создания, версия, сериализованный кадр)
+        self.spectator_frames: deque = deque()
+        # Отложенные на SPECTATOR_DELAY публикации кадров (отменяются при выселении и остановке)
+        self.spectator_publishes: Set[asyncio.Task] = set()
+        self.flag_timers: List[Any] = []
+        # Фоновая публикация состояния после хода (см. schedule_state_update)
+        self.pending_updates = 0
+        self.publisher: Optional[asyncio.Task] = None
+        self.last_publish = 0.0
+        # Места, за которые играет движок, и их текущие поиски
+        self.bots: Set[int] = set()
+        self.bot_tasks: Dict[int, asyncio.Task] = {}
+        # Партия уже попала в индекс позиций (или поставлена туда)
+        self.indexed = False
+        # Партия отдана в архив
+        self.archived = False
 
-async def broadcast_state_update(session_id: str, game_over: Optional[Dict] = None):
-    """Отправляет обновление состояния всем подключенным клиентам сессии"""
-    if session_id not in WEBSOCKET_CONNECTIONS:
+    def all_tokens(self) -> List[str]:
+        tokens = list(self.player_tokens.values())
+        if self.spectator_token:
+            tokens.append(self.spectator_token)
+        return tokens
+
+    def touch(self):
+        self.last_access = time.monotonic()
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Сериализует сессию для выселения на диск"""
+        return {
+            "sessionId": self.session_id,
+            "version": self.version,
+            "playerTokens": {str(pid): token for pid, token in self.player_tokens.items()},
+            "spectatorToken": self.spectator_token,
+            "position": self.game.to_fen_dict(),
+            "clocks": self.game.clocks_to_dict(),
+            # Часы после флага остановлены, и по ним падение уже не видно
+            "flagResult": self.game._flag_result,
+            "bots": sorted(self.bots),
+            "history": self.game.history,
+            "startPosition": self.game.start_position,
+            "indexed": self.indexed,
+            "archived": self.archived,
+        }
+
+    @staticmethod
+    def from_dict(data: Dict[str, Any]) -> 'Session':
+        """Восстанавливает сессию, сохранённую через to_dict"""
+        game = Game()
+        game.from_fen_dict(data["position"])
+        game.clocks_from_dict(data.get("clocks", {}))
+        game._flag_result = data.get("flagResult")
+        if "history" in data:
+            game.history = data["history"]
+            game.start_position = data.get("startPosition")
+        player_tokens = {int(pid): token for pid, token in data["playerTokens"].items()}
+        session = Session(data["sessionId"], game, player_tokens)
+        session.version = data["version"]
+        session.spectator_token = data.get("spectatorToken")
+        session.fen_position = json.dumps(data["position"])
+        session.bots = set(data.get("bots", []))
+        session.indexed = data.get("indexed", False)
+        session.archived = data.get("archived", False)
+        return session
+
+
+def register_session(session: Session):
+    """Делает сессию резидентной: добавляет её и её токены в память"""
+    SESSIONS[session.session_id] = session
+    SESSIONS.move_to_end(session.session_id)
+    for player_id, token in session.player_tokens.items():
+        TOKENS[token] = TokenRef(session.session_id, player_id)
+    if session.spectator_token:
+        SPECTATOR_TOKENS[session.spectator_token] = session.session_id
+    session.touch()
+
+
+def rehydrate_session(session_id: str) -> Optional[Session]:
+    """Поднимает выселенную сессию с диска обратно в память"""
+    started = time.perf_counter()
+    data = SESSION_STORAGE.load(session_id)
+    if data is None:
+        return None
+    session = Session.from_dict(data)
+    register_session(session)
+    # Копия на диске устарела с первым же ходом; при выселении запишется заново
+    SESSION_STORAGE.delete(session_id, session.all_tokens())
+    schedule_flag_checks(session)
+    schedule_bot_moves(session)
+    elapsed = time.perf_counter() - started
+    SESSION_STATS["rehydrations"] += 1
+    SESSION_STATS["rehydration_seconds_total"] += elapsed
+    SESSION_STATS["rehydration_seconds_max"] = max(SESSION_STATS["rehydration_seconds_max"], elapsed)
+    return session
+
+
+def resolve_token(token: str) -> Tuple['TokenRef', Session]:
+    """Находит токен и его сессию (при необходимости поднимая её с диска)"""
+    ref = TOKENS.get(token)
+    if ref is None:
+        session_id = SESSION_STORAGE.find_session_id(token)
+        if session_id is None or rehydrate_session(session_id) is None:
+            raise HTTPException(status_code=401, detail="Invalid token")
+        ref = TOKENS.get(token)
+        if ref is None:
+            raise HTTPException(status_code=401, detail="Invalid token")
+
+    session = SESSIONS.get(ref.session_id)
+    if session is None:
+        session = rehydrate_session(ref.session_id)
+        if session is None:
+            raise HTTPException(status_code=404, detail="Session not found")
+    SESSIONS.move_to_end(ref.session_id)
+    session.touch()
+    return ref, session
+
+
+def resolve_spectator_token(token: str) -> Session:
+    """Находит сессию по токену зрителя (при необходимости поднимая её с диска)"""
+    session_id = SPECTATOR_TOKENS.get(token) or SESSION_STORAGE.find_session_id(token)
+    if session_id is None:
+        raise HTTPException(status_code=401, detail="Invalid token")
+    session = SESSIONS.get(session_id) or rehydrate_session(session_id)
+    if session is None or session.spectator_token != token:
+        raise HTTPException(status_code=401, detail="Invalid token")
+    SESSIONS.move_to_end(session_id)
+    session.touch()
+    return session
+
+
+def _idle_ttl(session: Session) -> float:
+    """Законченная партия, отданная в архив (session.archived), держится в памяти меньше.
+
+    Только если конец партии переживает выселение (мат виден по позиции,
+    флаг — по сохранённому flagResult): иначе поднятую с диска партию
+    можно было бы доигрывать.
+    """
+    if session.archived and session.game.check_game_over() is not None:
+        return min(FINISHED_SESSION_TTL, SESSION_IDLE_TTL)
+    return SESSION_IDLE_TTL
+
+
+def _eviction_candidates(now: float) -> List[str]:
+    """Сессии без WebSocket-подключений: простаивающие дольше TTL и лишние сверх лимита (LRU)"""
+    # Партии с идущими часами не выселяем: флаг должен упасть вовремя. Не выселяем
+    # и сессии, где ещё думает бот или идёт публикация: они сменят версию
+    idle = [
+        sid for sid in SESSIONS
+        if sid not in WEBSOCKET_CONNECTIONS and sid not in SPECTATOR_CONNECTIONS
+        and not SESSIONS[sid].game.clocks_running()
+        and not SESSIONS[sid].bot_tasks and SESSIONS[sid].publisher is None
+    ]
+    candidates = [sid for sid in idle if now - SESSIONS[sid].last_access >= _idle_ttl(SESSIONS[sid])]
+    overflow = len(SESSIONS) - len(candidates) - MAX_RESIDENT_SESSIONS
+    if overflow > 0:
+        # idle уже упорядочен от самых давних обращений к самым свежим
+        chosen = set(candidates)
+        for sid in idle:
+            if overflow <= 0:
+                break
+            if sid not in chosen:
+                candidates.append(sid)
+                overflow -= 1
+    return candidates
+
+
+async def evict_idle_sessions() -> int:
+    """Сохраняет холодные сессии на диск и удаляет их из памяти"""
+    evicted = 0
+    for session_id in _eviction_candidates(time.monotonic()):
+        session = SESSIONS.get(session_id)
+        if session is None:
+            continue
+        accessed = session.last_access
+        version = session.version
+        data = session.to_dict()
+        tokens = session.all_tokens()
+        await asyncio.to_thread(SESSION_STORAGE.save, session_id, data, tokens)
+        # Пока шла запись, к сессии могли обратиться или в ней мог пойти бот — тогда
+        # сохранённая копия устарела, и сессия остаётся в памяти
+        if (session.last_access != accessed or session.version != version or session.bot_tasks
+                or session_id in WEBSOCKET_CONNECTIONS or session_id in SPECTATOR_CONNECTIONS):
+            continue
+        SESSIONS.pop(session_id, None)
+        cancel_delayed_publishes(session)
+        for token in tokens:
+            TOKENS.pop(token, None)
+            SPECTATOR_TOKENS.pop(token, None)
+        SESSION_STATS["evictions"] += 1
+        evicted += 1
+    return evicted
+
+
+async def _eviction_loop():
+    while True:
+        await asyncio.sleep(EVICTION_INTERVAL)
+        try:
+            await evict_idle_sessions()
+        except Exception:
+            logger.exception("Eviction failed")
+
+
+@app.on_event("startup")
+async def start_eviction_loop():
+    asyncio.create_task(_eviction_loop())
+
+
+def schedule_flag_checks(session: Session):
+    """Перепланирует проверку флага на момент, когда истечёт время идущей стороны"""
+    for handle in session.flag_timers:
+        handle.cancel()
+    session.flag_timers = []
+    for clock in session.game.clocks().values():
+        deadline = clock.deadline()
+        if deadline is not None:
+            session_id = session.session_id
+            session.flag_timers.append(CLOCK_WHEEL.schedule(
+                deadline, lambda: asyncio.ensure_future(on_flag_deadline(session_id))
+            ))
+
+
+async def on_flag_deadline(session_id: str):
+    session = SESSIONS.get(session_id)
+    if session is None:
         return
-    
+    game_over = session.game.check_game_over()
+    if game_over is None:
+        # Часы успели переключиться — ждём нового срока
+        schedule_flag_checks(session)
+        return
+    session.version += 1
+    schedule_state_update(session)
+
+
+async def _clock_loop():
+    while True:
+        await asyncio.sleep(CLOCK_WHEEL.tick)
+        try:
+            CLOCK_WHEEL.advance()
+        except Exception:
+            logger.exception("Clock wheel failed")
+
+
+@app.on_event("startup")
+async def start_clock_loop():
+    asyncio.create_task(_clock_loop())
+
+
+@app.on_event("startup")
+async def start_fanout():
+    await FANOUT.start()
+
+
+@app.on_event("shutdown")
+async def cancel_spectator_publishes():
+    # До остановки fanout: отложенным кадрам уже некуда уходить
+    for session in SESSIONS.values():
+        cancel_delayed_publishes(session)
+
+
+@app.on_event("shutdown")
+async def stop_fanout():
+    await FANOUT.stop()
+
+
+def new_shard_key(factory) -> str:
+    """Генерирует id/токен, который попадает в шард этого воркера (в кластерном режиме)"""
+    shard_index, shard_count = current_shard()
+    while True:
+        key = factory()
+        if shard_for(key, shard_count) == shard_index:
+            return key
+
+def schedule_state_update(session: Session):
+    """Ставит проверку конца игры и рассылку в фон, не задерживая ответ ходящему.
+
+    На сессию работает одна фоновая задача, и рассылки идут не чаще раза
+    в BROADCAST_WINDOW: первое обновление после паузы уходит сразу, а
+    все, что пришло за окно (ходы на обеих досках), — одной рассылкой
+    последней версии. Версии уходят подписчикам по порядку.
+    """
+    session.pending_updates += 1
+    if session.publisher is None:
+        session.publisher = asyncio.create_task(_run_state_publisher(session))
+    # Позиция изменилась — возможно, теперь ход бота
+    schedule_bot_moves(session)
+
+
+async def _run_state_publisher(session: Session):
+    try:
+        while session.pending_updates:
+            wait = session.last_publish + BROADCAST_WINDOW - time.monotonic()
+            if wait > 0:
+                await asyncio.sleep(wait)
+            BROADCAST_COALESCED.inc(session.pending_updates - 1)
+            session.pending_updates = 0
+            session.last_publish = time.monotonic()
+            with GAME_OVER_CHECK.time():
+                game_over = session.game.check_game_over()
+            await broadcast_state_update(session.session_id, game_over)
+            if game_over is not None and not session.archived:
+                archive_finished_game(session, game_over)
+            if game_over is not None and not session.indexed:
+                session.indexed = True
+                asyncio.create_task(index_finished_game(session, game_over))
+    except Exception:
+        logger.exception("State publish failed", extra={"session": session.session_id, "version": session.version})
+    finally:
+        session.publisher = None
+
+
+def bot_executor() -> ProcessPoolExecutor:
+    """Пул процессов для поиска ходов (создаётся при первом ходе бота)"""
+    global _BOT_EXECUTOR
+    if _BOT_EXECUTOR is None:
+        _BOT_EXECUTOR = ProcessPoolExecutor(
+            max_workers=BOT_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+    return _BOT_EXECUTOR
+
+
+@app.on_event("shutdown")
+async def stop_bot_executor():
+    if _BOT_EXECUTOR is not None:
+        _BOT_EXECUTOR.shutdown(wait=False, cancel_futures=True)
+
+
+def schedule_bot_moves(session: Session):
+    """Запускает поиск хода за каждое место бота, где сейчас его очередь"""
+    for player_id in session.bots:
+        if player_id in session.bot_tasks:
+            continue
+        player = session.game.get_player(player_id)
+        if player.board.get_current_player() != player.color:
+            continue
+        session.bot_tasks[player_id] = asyncio.create_task(_play_bot_move(session, player_id))
+
+
+async def _play_bot_move(session: Session, player_id: int):
+    """Ход движка: поиск в отдельном процессе, применение — как ход игрока.
+
+    Пока идёт поиск, вторая доска живёт своей жизнью: запасы и жертвы
+    превращения могут измениться, и make_move/make_drop отклонит ход —
+    тогда позиция ищется заново.
+    """
+    context = {"session": session.session_id, "player": player_id}
+    loop = asyncio.get_running_loop()
+    try:
+        for _ in range(BOT_MAX_ATTEMPTS):
+            if session.game.check_game_over() is not None:
+                return
+            result = await loop.run_in_executor(
+                bot_executor(), choose_action, session.game.to_fen_dict(), player_id, BOT_MOVE_TIME)
+            if SESSIONS.get(session.session_id) is not session or session.game.check_game_over() is not None:
+                # Сессию выселили или партия закончилась, пока шёл поиск
+                return
+            action = result["action"]
+            if action is None:
+                return
+            try:
+                if action["type"] == "drop":
+                    session.game.make_drop(player_id, action["piece"], action["square"])
+                else:
+                    session.game.make_move(
+                        player_id, action["from"], action["to"],
+                        victim_player_id=action.get("victimPlayerId"),
+                        victim_square=action.get("victimSquare"),
+                    )
+            except (ValueError, PromotionRequired) as e:
+                logger.info("Bot move rejected: %s", e, extra={**context, "version": session.version})
+                continue
+            session.version += 1
+            session.fen_position = json.dumps(session.game.to_fen_dict())
+            schedule_flag_checks(session)
+            logger.debug("Bot %s (depth %d, score %d, %d nodes, %.0f ms)", action, result["depth"],
+                         result["score"], result["nodes"], result["ms"], extra={**context, "version": session.version})
+            # Место освобождаем до публикации: schedule_state_update может сразу поставить следующий ход
+            session.bot_tasks.pop(player_id, None)
+            schedule_state_update(session)
+            return
+    except BrokenProcessPool:
+        global _BOT_EXECUTOR
+        logger.exception("Bot move failed", extra=context)
+        _BOT_EXECUTOR = None
+    except Exception:
+        logger.exception("Bot move failed", extra=context)
+    finally:
+        if session.bot_tasks.get(player_id) is asyncio.current_task():
+            session.bot_tasks.pop(player_id, None)
+
+
+def archive_finished_game(session: Session, game_over: Dict[str, Any]):
+    """Отдаёт партию фоновой записи архива: здесь только копия записи ходов и постановка в очередь"""
+    record = {
+        "id": session.session_id,
+        "finishedAt": time.time(),
+        "gameOver": game_over,
+        "bots": sorted(session.bots),
+        "startPosition": session.game.start_position,
+        "final": session.game.to_fen_dict(),
+        "history": list(session.game.history),
+    }
+    if GAME_ARCHIVE.submit(record):
+        session.archived = True
+        ARCHIVE_SUBMISSIONS.labels("queued").inc()
+    else:
+        # Очередь переполнена: партия останется в памяти до обычного TTL и будет выселена целиком
+        ARCHIVE_SUBMISSIONS.labels("rejected").inc()
+        logger.warning("Archive queue is full", extra={"session": session.session_id})
+
+
+@app.on_event("shutdown")
+async def stop_game_archive():
+    await asyncio.to_thread(GAME_ARCHIVE.close)
+
+
+async def index_finished_game(session: Session, game_over: Dict[str, Any]):
+    """Кладёт позиции законченной партии в индекс обозревателя.
+
+    Проигрывание партии (make_move на каждый ход) идёт в пуле анализа,
+    в цикле событий — только добавление готовых массивов.
+    """
+    history = list(session.game.history)
+    if not history:
+        return
+    loop = asyncio.get_running_loop()
+    try:
+        keys, records = await loop.run_in_executor(
+            analysis_executor(), game_positions, session.session_id, session.game.start_position,
+            history, result_code(game_over))
+        EXPLORER.add(keys, records)
+        schedule_explorer_compaction()
+    except BrokenProcessPool:
+        global _ANALYSIS_EXECUTOR
+        logger.exception("Explorer indexing failed", extra={"session": session.session_id})
+        _ANALYSIS_EXECUTOR = None
+    except Exception:
+        logger.exception("Explorer indexing failed", extra={"session": session.session_id})
+
+
+def schedule_explorer_compaction():
+    """Запускает слияние своих прогонов, если их стало больше EXPLORER.max_runs"""
+    global _EXPLORER_COMPACTION
+    if _EXPLORER_COMPACTION is None and EXPLORER.compaction_due():
+        _EXPLORER_COMPACTION = asyncio.create_task(compact_explorer())
+
+
+async def compact_explorer():
+    """Сливает свои прогоны индекса: запись слитого прогона — в потоке,
+    подмена прогонов — в цикле событий, между запросами"""
+    global _EXPLORER_COMPACTION
+    runs = EXPLORER.own_runs()
+    try:
+        name = await asyncio.to_thread(PositionIndex.merge_runs, EXPLORER.directory, runs, EXPLORER.writer)
+        EXPLORER.replace_runs(runs, name)
+        logger.info("Explorer runs compacted: %d -> %s", len(runs), name)
+    except Exception:
+        logger.exception("Explorer compaction failed")
+    finally:
+        _EXPLORER_COMPACTION = None
+
+
+@app.on_event("shutdown")
+async def flush_explorer():
+    # Дожидаемся слияния: иначе слитый прогон останется на диске рядом с исходными
+    if _EXPLORER_COMPACTION is not None:
+        await _EXPLORER_COMPACTION
+    EXPLORER.flush()
+
+
+class AnalysisJob:
+    def __init__(self, job_id: str, position: Dict[str, Any]):
+        self.job_id = job_id
+        self.position = position
+        self.status = "queued"
+        # Итоговый ответ (как в ANALYSIS_RESULTS) для тех, кто ждёт по WebSocket
+        self.done: asyncio.Future = asyncio.get_running_loop().create_future()
+
+
+def analysis_executor() -> ProcessPoolExecutor:
+    """Пул процессов анализа, отдельный от ботов: долгий анализ не задерживает их ходы"""
+    global _ANALYSIS_EXECUTOR
+    if _ANALYSIS_EXECUTOR is None:
+        _ANALYSIS_EXECUTOR = ProcessPoolExecutor(
+            max_workers=ANALYSIS_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+    return _ANALYSIS_EXECUTOR
+
+
+@app.on_event("shutdown")
+async def stop_analysis_executor():
+    if _ANALYSIS_EXECUTOR is not None:
+        _ANALYSIS_EXECUTOR.shutdown(wait=False, cancel_futures=True)
+
+
+def analysis_key(position: Dict[str, Any]) -> str:
+    """Id задачи: хеш позиции (уже нормализованной через Game.to_fen_dict).
+
+    В кластере к хешу добавляется наименьший суффикс -N, при котором id
+    попадает в шард этого воркера: опрос /api/analyze/{jobId} и
+    /ws/analyze/{jobId} маршрутизатор отправит сюда же, а одинаковые
+    позиции на этом воркере получат тот же id.
+    """
+    digest = hashlib.sha256(json.dumps(position, sort_keys=True).encode()).hexdigest()[:32]
+    candidates = itertools.chain([digest], (f"{digest}-{n}" for n in itertools.count(1)))
+    return new_shard_key(lambda: next(candidates))
+
+
+def analysis_response(job_id: str) -> Optional[Dict[str, Any]]:
+    """Ответ для опроса: готовый результат, статус идущей задачи или None"""
+    cached = ANALYSIS_RESULTS.get(job_id)
+    if cached is not None:
+        ANALYSIS_RESULTS.move_to_end(job_id)
+        return cached
+    job = ANALYSIS_JOBS.get(job_id)
+    if job is not None:
+        return {"jobId": job_id, "status": job.status}
+    return None
+
+
+async def _run_analysis(job: AnalysisJob):
+    """Задача анализа: ждёт свободный процесс пула, кладёт ответ в кэш и будит ждущих"""
+    loop = asyncio.get_running_loop()
+    try:
+        future = loop.run_in_executor(analysis_executor(), analyze_position, job.position, ANALYSIS_MOVE_TIME)
+        # run_in_executor ставит задачу в очередь пула сразу; статус running — условный
+        job.status = "running"
+        response = {"jobId": job.job_id, "status": "done", "result": await future}
+    except Exception as e:
+        logger.exception("Analysis failed", extra={"endpoint": "/api/analyze"})
+        if isinstance(e, BrokenProcessPool):
+            # Процесс пула упал — пул больше не принимает задачи, следующая создаст новый
+            global _ANALYSIS_EXECUTOR
+            _ANALYSIS_EXECUTOR = None
+        # Ошибка видна при опросе, но повторный POST запустит анализ заново
+        response = {"jobId": job.job_id, "status": "failed", "error": str(e)}
+    ANALYSIS_RESULTS[job.job_id] = response
+    while len(ANALYSIS_RESULTS) > ANALYSIS_CACHE_SIZE:
+        ANALYSIS_RESULTS.popitem(last=False)
+    ANALYSIS_JOBS.pop(job.job_id, None)
+    job.done.set_result(response)
+
+
+async def broadcast_state_update(session_id: str, game_over: Optional[Dict] = None):
+    """Публикует обновление состояния для всех подписчиков сессии"""
+    with BROADCAST_DURATION.time():
+        await _publish_state_update(session_id, game_over)
+
+
+async def _publish_state_update(session_id: str, game_over: Optional[Dict]):
     session = SESSIONS.get(session_id)
     if session is None:
         return
     
+    await publish_spectator_frame(session, game_over)
+    
+    if not FANOUT.has_subscribers(session_id):
+        return
+    
     states = {}
     for player_id in [1, 2, 3, 4]:
         try:
@@ -57,20 +746,156 @@ async def broadcast_state_update(session_id: str, game_over: Optional[Dict] = No
         except Exception:
             pass
     
-    disconnected = set()
-    for ws in WEBSOCKET_CONNECTIONS[session_id]:
-        try:
-            await ws.send_json({
-                "type": "state_update",
-                "states": states,
-                "gameOver": game_over
-            })
-        except Exception:
-            disconnected.add(ws)
+    # Сериализуем один раз на все соединения
+    payload = json.dumps({
+        "type": "state_update",
+        "states": states,
+        "gameOver": game_over
+    })
+    BROADCAST_PAYLOAD.labels("players").observe(len(payload))
+    await FANOUT.publish(session_id, session.version, payload)
+
+
+async def send_to_all(connections: Set[WebSocket], payload: str) -> Tuple[int, Set[WebSocket]]:
+    """Отправляет кадр всем соединениям одновременно, каждому — не дольше WS_SEND_TIMEOUT.
+
+    Возвращает число отправок и соединения, которым отправить не удалось.
+    """
+    sockets = list(connections)
+    results = await asyncio.gather(
+        *(asyncio.wait_for(ws.send_text(payload), WS_SEND_TIMEOUT) for ws in sockets),
+        return_exceptions=True,
+    )
+    failed = {ws for ws, result in zip(sockets, results) if isinstance(result, Exception)}
+    return len(sockets) - len(failed), failed
+
+
+async def deliver_to_local_sockets(session_id: str, version: int, payload: str):
+    """Подписчик fanout: отправляет сообщение WebSocket-соединениям этого процесса"""
+    connections = WEBSOCKET_CONNECTIONS.get(session_id)
+    if not connections:
+        return
+    
+    sent, disconnected = await send_to_all(connections, payload)
     
-    WEBSOCKET_CONNECTIONS[session_id] -= disconnected
-    if not WEBSOCKET_CONNECTIONS[session_id]:
+    # json.dumps по умолчанию даёт ASCII, так что длина строки — это байты
+    BROADCAST_SENDS.labels("players").inc(sent)
+    BROADCAST_BYTES.labels("players").inc(sent * len(payload))
+    for ws in disconnected:
+        remove_websocket(session_id, ws)
+
+
+def spectator_channel(session_id: str) -> str:
+    return f"{session_id}.spectate"
+
+
+def spectator_frame(session: Session, game_over: Optional[Dict] = None) -> Tuple[int, str]:
+    """Один сериализованный кадр на версию — общий для всех зрителей"""
+    frames = session.spectator_frames
+    if frames and frames[-1][1] == session.version:
+        return frames[-1][1], frames[-1][2]
+    payload = json.dumps({
+        "type": "spectator_update",
+        "state": build_spectator_state(session).model_dump(),
+        "gameOver": game_over if game_over is not None else session.game.check_game_over(),
+    })
+    now = time.monotonic()
+    frames.append((now, session.version, payload))
+    # Храним только кадры, которые ещё могут понадобиться для задержанной трансляции
+    while len(frames) > 1 and frames[1][0] <= now - SPECTATOR_DELAY:
+        frames.popleft()
+    return session.version, payload
+
+
+def delayed_spectator_frame(session: Session) -> Tuple[int, str]:
+    """Кадр, который зритель должен видеть сейчас с учётом задержки трансляции"""
+    if SPECTATOR_DELAY <= 0 or not session.spectator_frames:
+        return spectator_frame(session)
+    cutoff = time.monotonic() - SPECTATOR_DELAY
+    chosen = session.spectator_frames[0]
+    for frame in session.spectator_frames:
+        if frame[0] > cutoff:
+            break
+        chosen = frame
+    return chosen[1], chosen[2]
+
+
+async def publish_spectator_frame(session: Session, game_over: Optional[Dict] = None):
+    channel = spectator_channel(session.session_id)
+    # При задержке кадры копятся всегда, чтобы новому зрителю было что показать
+    if SPECTATOR_DELAY <= 0 and not FANOUT.has_subscribers(channel):
+        return
+    version, payload = spectator_frame(session, game_over)
+    if SPECTATOR_DELAY > 0:
+        task = asyncio.create_task(_publish_delayed(channel, version, payload))
+        session.spectator_publishes.add(task)
+        task.add_done_callback(session.spectator_publishes.discard)
+    else:
+        await FANOUT.publish(channel, version, payload)
+
+
+async def _publish_delayed(channel: str, version: int, payload: str):
+    await asyncio.sleep(SPECTATOR_DELAY)
+    try:
+        await FANOUT.publish(channel, version, payload)
+    except Exception:
+        logger.exception("Spectator publish failed", extra={"channel": channel, "version": version})
+
+
+def cancel_delayed_publishes(session: Session):
+    for task in list(session.spectator_publishes):
+        task.cancel()
+    session.spectator_publishes.clear()
+
+
+async def deliver_to_spectators(channel: str, version: int, payload: str):
+    """Подписчик fanout: рассылает один и тот же кадр всем зрителям этого процесса"""
+    session_id = channel.rsplit(".", 1)[0]
+    connections = SPECTATOR_CONNECTIONS.get(session_id)
+    if not connections:
+        return
+    
+    sent, disconnected = await send_to_all(connections, payload)
+    
+    # json.dumps по умолчанию даёт ASCII, так что длина строки — это байты
+    BROADCAST_SENDS.labels("spectators").inc(sent)
+    BROADCAST_BYTES.labels("spectators").inc(sent * len(payload))
+    for ws in disconnected:
+        remove_spectator(session_id, ws)
+
+
+def add_spectator(session_id: str, websocket: WebSocket):
+    if session_id not in SPECTATOR_CONNECTIONS:
+        SPECTATOR_CONNECTIONS[session_id] = set()
+        FANOUT.subscribe(spectator_channel(session_id), deliver_to_spectators)
+    SPECTATOR_CONNECTIONS[session_id].add(websocket)
+
+
+def remove_spectator(session_id: str, websocket: WebSocket):
+    connections = SPECTATOR_CONNECTIONS.get(session_id)
+    if connections is None:
+        return
+    connections.discard(websocket)
+    if not connections:
+        del SPECTATOR_CONNECTIONS[session_id]
+        FANOUT.unsubscribe(spectator_channel(session_id), deliver_to_spectators)
+
+
+def add_websocket(session_id: str, websocket: WebSocket):
+    if session_id not in WEBSOCKET_CONNECTIONS:
+        WEBSOCKET_CONNECTIONS[session_id] = set()
+        FANOUT.subscribe(session_id, deliver_to_local_sockets)
+    WEBSOCKET_CONNECTIONS[session_id].add(websocket)
+
+
+def remove_websocket(session_id: str, websocket: WebSocket):
+    connections = WEBSOCKET_CONNECTIONS.get(session_id)
+    if connections is None:
+        return
+    connections.discard(websocket)
+    if not connections:
         del WEBSOCKET_CONNECTIONS[session_id]
+        FANOUT.unsubscribe(session_id, deliver_to_local_sockets)
 
 class MoveRequest(BaseModel):
     token: str
@@ -88,22 +913,37 @@ class DropRequest(BaseModel):
     piece: str
     square: str
 
+class MoveAck(BaseModel):
+    """Ответ на ход/дроп: позиция принята; состояние и конец игры приходят по WebSocket"""
+    sessionId: str
+    version: int
+
 class ApiPlayerLink(BaseModel):
     playerId: int
     board: str
     color: str
     token: str
     url: str
+    bot: bool = False
 
 class ApiStartResponse(BaseModel):
     sessionId: str
     players: List[ApiPlayerLink]
+    spectatorToken: str
+
+class ClockState(BaseModel):
+    white: int
+    black: int
+    running: Optional[str] = None
+    incrementMs: int
+    delayMs: int
 
 class BoardState(BaseModel):
     currentPlayer: str
     grid: List[List[str]]
     inCheck: bool
     kingInCheck: Optional[str] = None
+    clock: Optional[ClockState] = None
 
 class MeState(BaseModel):
     playerId: int
@@ -120,6 +960,28 @@ class StateResponse(BaseModel):
     reserveCounts: Dict[str, Dict[str, int]]
     fen: Optional[str] = None
 
+class LegalMovesResponse(BaseModel):
+    sessionId: str
+    version: int
+    playerId: int
+    moves: Dict[str, List[str]]
+    drops: Dict[str, List[str]]
+
+class AnalysisJobResponse(BaseModel):
+    """Задача анализа: status queued | running | done | failed; result — см. engine.analyze_position"""
+    jobId: str
+    status: str
+    result: Optional[Dict[str, Any]] = None
+    error: Optional[str] = None
+
+class SpectatorState(BaseModel):
+    sessionId: str
+    version: int
+    boards: Dict[str, BoardState]
+    reserves: Dict[str, str]
+    reserveCounts: Dict[str, Dict[str, int]]
+    fen: Optional[str] = None
+
 @app.get("/")
 async def root():
     """Главная страница"""
@@ -138,19 +1000,38 @@ def get_server_ip():
 
 @app.post("/api/start", response_model=ApiStartResponse)
 async def start_game(request: Request):
-    """Создать сессию и 4 ссылки"""
-    session_id = str(uuid.uuid4())
+    """Создать сессию и 4 ссылки. Часы: ?time=<сек>&increment=<сек>&delay=<сек>.
+    Места для движка: ?bots=<id игроков через запятую>, например bots=3,4"""
+    session_id = new_shard_key(lambda: str(uuid.uuid4()))
     game = Game()
     
+    clock_time = request.query_params.get("time")
+    if clock_time:
+        try:
+            game.set_clocks(
+                int(float(clock_time) * 1000),
+                int(float(request.query_params.get("increment", "0")) * 1000),
+                int(float(request.query_params.get("delay", "0")) * 1000),
+            )
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid clock settings")
+
+    bots: Set[int] = set()
+    for seat in filter(None, request.query_params.get("bots", "").split(",")):
+        if not seat.strip().isdigit() or int(seat) not in (1, 2, 3, 4):
+            raise HTTPException(status_code=400, detail="Invalid bots: expected player ids 1-4")
+        bots.add(int(seat))
+    
     player_tokens: Dict[int, str] = {}
     for player_id in [1, 2, 3, 4]:
-        token = uuid.uuid4().hex
-        player_tokens[player_id] = token
-        TOKENS[token] = TokenRef(session_id, player_id)
+        player_tokens[player_id] = new_shard_key(lambda: uuid.uuid4().hex)
     
     session = Session(session_id, game, player_tokens)
+    session.spectator_token = new_shard_key(lambda: uuid.uuid4().hex)
     session.fen_position = json.dumps(game.to_fen_dict())
-    SESSIONS[session_id] = session
+    session.bots = bots
+    register_session(session)
+    schedule_bot_moves(session)
 
     port = request.url.port or 8000
     
@@ -167,33 +1048,43 @@ async def start_game(request: Request):
             board=player.board_name,
             color=player.color.value,
             token=token,
-            url=url
+            url=url,
+            bot=player_id in bots,
         ))
     
-    return ApiStartResponse(sessionId=session_id, players=links)
+    return ApiStartResponse(sessionId=session_id, players=links, spectatorToken=session.spectator_token)
 
 @app.get("/api/state", response_model=StateResponse)
-async def get_state(token: str = Query(...)):
+async def get_state(http_request: Request, token: str = Query(...)):
     """Состояние по токену (видно две доски, но "me" определяет права)"""
-    ref = TOKENS.get(token)
-    if ref is None:
-        raise HTTPException(status_code=401, detail="Invalid token")
+    ref, session = resolve_token(token)
     
-    session = SESSIONS.get(ref.session_id)
-    if session is None:
-        raise HTTPException(status_code=404, detail="Session not found")
-    
-    return build_state(session, ref.player_id)
+    with PROFILER.probe("/api/state", http_request.headers, profile_context(session, ref)):
+        return build_state(session, ref.player_id)
+
+
+def profile_context(session: Session, ref: TokenRef):
+    """Данные для файла профиля; позиция запоминается до хода"""
+    fen_before = session.fen_position
+    return lambda: {
+        "sessionId": session.session_id,
+        "playerId": ref.player_id,
+        "version": session.version,
+        "fenBefore": fen_before,
+    }
 
 @app.websocket("/ws/{token}")
 async def websocket_endpoint(websocket: WebSocket, token: str):
     """WebSocket соединение для получения обновлений состояния в реальном времени"""
     await websocket.accept() 
-    ref = TOKENS.get(token)
-    session = SESSIONS.get(ref.session_id)
-    if ref.session_id not in WEBSOCKET_CONNECTIONS:
-        WEBSOCKET_CONNECTIONS[ref.session_id] = set()
-    WEBSOCKET_CONNECTIONS[ref.session_id].add(websocket) 
+    try:
+        ref, session = resolve_token(token)
+    except HTTPException as e:
+        await websocket.close(code=1008, reason=str(e.detail))
+        return
+    add_websocket(ref.session_id, websocket)
+    context = {"session": ref.session_id, "player": ref.player_id}
+    logger.debug("WebSocket connected", extra=context)
     try:
         try:
             initial_state = build_state(session, ref.player_id)
@@ -204,10 +1095,12 @@ async def websocket_endpoint(websocket: WebSocket, token: str):
                 }
             })
         except Exception as e:
-            print(f"WebSocket: Error sending initial state: {e}")
-            import traceback
-            traceback.print_exc()
-            await websocket.close(code=1011, reason=f"Error: {str(e)}")
+            logger.warning("WebSocket: error sending initial state: %s", e, extra=context)
+            try:
+                await websocket.close(code=1011, reason=f"Error: {str(e)}")
+            except Exception:
+                # Клиент уже отключился
+                pass
             return
         
         while True:
@@ -215,137 +1108,265 @@ async def websocket_endpoint(websocket: WebSocket, token: str):
                 data = await websocket.receive_text()
                 if data == "ping":
                     await websocket.send_text("pong")
+                elif data == "legal_moves":
+                    # Сессию берём заново: её могли выселить и поднять с диска
+                    _, current = resolve_token(token)
+                    hints = build_legal_moves(current, ref.player_id).model_dump()
+                    hints["type"] = "legal_moves"
+                    await websocket.send_json(hints)
             except WebSocketDisconnect:
-                print(f"WebSocket: Client disconnected normally")
+                logger.debug("WebSocket disconnected", extra=context)
                 break
             except Exception as e:
-                print(f"WebSocket: Error receiving message: {e}")
+                logger.warning("WebSocket: error receiving message: %s", e, extra=context)
                 break
     except WebSocketDisconnect:
-        print(f"WebSocket: Client disconnected")
-    except Exception as e:
-        print(f"WebSocket: Unexpected error: {e}")
-        import traceback
-        traceback.print_exc()
+        logger.debug("WebSocket disconnected", extra=context)
+    except Exception:
+        logger.exception("WebSocket: unexpected error", extra=context)
     finally:
         # Удаляем соединение при отключении
-        if ref.session_id in WEBSOCKET_CONNECTIONS:
-            WEBSOCKET_CONNECTIONS[ref.session_id].discard(websocket)
-            if not WEBSOCKET_CONNECTIONS[ref.session_id]:
-                del WEBSOCKET_CONNECTIONS[ref.session_id]
+        remove_websocket(ref.session_id, websocket)
 
-@app.post("/api/move")
-async def make_move(request: MoveRequest):
-    """Ход: только своей доской и своим цветом"""
+@app.websocket("/ws/spectate/{token}")
+async def spectator_websocket_endpoint(websocket: WebSocket, token: str):
+    """Канал только для чтения: общий кадр состояния на версию для всех зрителей"""
+    await websocket.accept()
     try:
+        session = resolve_spectator_token(token)
+    except HTTPException as e:
+        await websocket.close(code=1008, reason=str(e.detail))
+        return
+    session_id = session.session_id
+    add_spectator(session_id, websocket)
+    try:
+        _, payload = delayed_spectator_frame(session)
+        await websocket.send_text(payload)
+        while True:
+            data = await websocket.receive_text()
+            if data == "ping":
+                await websocket.send_text("pong")
+    except WebSocketDisconnect:
         pass
     except Exception as e:
-        print(f"Error logging request: {e}")
-    
+        logger.warning("Spectator WebSocket: error: %s", e, extra={"session": session_id})
+    finally:
+        remove_spectator(session_id, websocket)
+
+@app.post("/api/move", response_model=MoveAck)
+async def make_move(request: MoveRequest, http_request: Request):
+    """Ход: только своей доской и своим цветом"""
     if not request.token:
         raise HTTPException(status_code=400, detail="Missing token")
     
-    ref = TOKENS.get(request.token)
-    if ref is None:
-        raise HTTPException(status_code=401, detail="Invalid token")
-    
-    session = SESSIONS.get(ref.session_id)
-    if session is None:
-        raise HTTPException(status_code=404, detail="Session not found")
+    ref, session = resolve_token(request.token)
     
-    try:
-        from_square = request.from_
-        if not from_square:
-            raise HTTPException(status_code=400, detail="Missing 'from' field")
-        
-        session.game.make_move(
-            ref.player_id,
-            from_square,
-            request.to,
-            victim_player_id=request.victim_player_id,
-            victim_square=request.victim_square,
-        )
-        session.version += 1
-        session.fen_position = json.dumps(session.game.to_fen_dict())
-        game_over = session.game.check_game_over()
-        
-        await broadcast_state_update(ref.session_id, game_over)
-        
-        state = build_state(session, ref.player_id)
-        if game_over:
-            state_dict = state.model_dump()
-            state_dict["gameOver"] = game_over
-            return state_dict
+    probe = PROFILER.probe("/api/move", http_request.headers, profile_context(session, ref))
+    with probe:
+        try:
+            from_square = request.from_
+            if not from_square:
+                raise HTTPException(status_code=400, detail="Missing 'from' field")
         
-        return state
-    except PromotionRequired as pr:
-        # Требуется выбор фигуры для превращения пешки. Позицию НЕ меняем.
-        return JSONResponse(
-            status_code=409,
-            content={
-                "error": "promotion_required",
-                "promotion": {
-                    "victimPlayerId": pr.victim_player_id,
-                    "options": pr.options,
+            with MOVE_VALIDATION.labels("move").time():
+                session.game.make_move(
+                    ref.player_id,
+                    from_square,
+                    request.to,
+                    victim_player_id=request.victim_player_id,
+                    victim_square=request.victim_square,
+                )
+            session.version += 1
+            session.fen_position = json.dumps(session.game.to_fen_dict())
+            schedule_flag_checks(session)
+            logger.debug("Move %s-%s", from_square, request.to,
+                         extra={"session": ref.session_id, "player": ref.player_id, "version": session.version})
+            schedule_state_update(session)
+            return MoveAck(sessionId=ref.session_id, version=session.version)
+        except PromotionRequired as pr:
+            # Требуется выбор фигуры для превращения пешки. Позицию НЕ меняем.
+            return JSONResponse(
+                status_code=409,
+                content={
+                    "error": "promotion_required",
+                    "promotion": {
+                        "victimPlayerId": pr.victim_player_id,
+                        "options": pr.options,
+                    },
                 },
-            },
-        )
-    except Exception as e:
-        error_msg = str(e)
-        print(error_msg)
-        raise HTTPException(status_code=400, detail=error_msg)
+            )
+        except Exception as e:
+            error_msg = str(e)
+            logger.info("Move rejected: %s", error_msg,
+                        extra={"session": ref.session_id, "player": ref.player_id, "version": session.version})
+            raise HTTPException(status_code=400, detail=error_msg)
 
 
-@app.post("/api/drop", response_model=StateResponse)
-async def make_drop(request: DropRequest):
+@app.post("/api/drop", response_model=MoveAck)
+async def make_drop(request: DropRequest, http_request: Request):
     """Дроп фигуры"""
     if not request.token:
         raise HTTPException(status_code=400, detail="Missing token")
     
-    ref = TOKENS.get(request.token)
-    if ref is None:
-        raise HTTPException(status_code=401, detail="Invalid token")
-    
-    session = SESSIONS.get(ref.session_id)
-    if session is None:
-        raise HTTPException(status_code=404, detail="Session not found")
+    ref, session = resolve_token(request.token)
     
+    probe = PROFILER.probe("/api/drop", http_request.headers, profile_context(session, ref))
+    with probe:
+        try:
+            with MOVE_VALIDATION.labels("drop").time():
+                session.game.make_drop(ref.player_id, request.piece, request.square)
+            session.version += 1
+            # Сохраняем позицию
+            session.fen_position = json.dumps(session.game.to_fen_dict())
+            schedule_flag_checks(session)
+            logger.debug("Drop %s@%s", request.piece, request.square,
+                         extra={"session": ref.session_id, "player": ref.player_id, "version": session.version})
+            schedule_state_update(session)
+            return MoveAck(sessionId=ref.session_id, version=session.version)
+        except Exception as e:
+            logger.info("Drop rejected: %s", e,
+                        extra={"session": ref.session_id, "player": ref.player_id, "version": session.version})
+            raise HTTPException(status_code=400, detail=str(e))
+
+
+@app.get("/api/legal-moves", response_model=LegalMovesResponse)
+async def get_legal_moves(token: str = Query(...)):
+    """Легальные ходы и клетки дропа для владельца токена (пусто, если сейчас не его ход)"""
+    ref, session = resolve_token(token)
+    return build_legal_moves(session, ref.player_id)
+
+
+@app.post("/api/analyze", response_model=AnalysisJobResponse)
+async def analyze(position: dict):
+    """Поставить позицию (формат Game.to_fen_dict) на анализ. Результат — по
+    GET /api/analyze/{jobId} или по WebSocket /ws/analyze/{jobId}.
+    Одинаковые позиции считаются один раз: id задачи — хеш позиции."""
+    if not isinstance(position.get("boardA"), str) or not isinstance(position.get("boardB"), str):
+        raise HTTPException(status_code=400, detail="Invalid position: boardA and boardB are required")
     try:
-        session.game.make_drop(ref.player_id, request.piece, request.square)
-        session.version += 1
-        # Сохраняем позицию
-        session.fen_position = json.dumps(session.game.to_fen_dict())
-        
-        # Проверка на завершение игры
-        game_over = session.game.check_game_over()
-        await broadcast_state_update(ref.session_id, game_over)
-        
-        state = build_state(session, ref.player_id)
-        if game_over:
-            state_dict = state.model_dump()
-            state_dict["gameOver"] = game_over
-            return state_dict
-        
-        return state
+        game = Game()
+        game.from_fen_dict(position)
     except Exception as e:
-        raise HTTPException(status_code=400, detail=str(e))
+        raise HTTPException(status_code=400, detail=f"Invalid position: {e}")
+    normalized = game.to_fen_dict()
+    job_id = analysis_key(normalized)
+
+    existing = analysis_response(job_id)
+    if existing is not None and existing["status"] != "failed":
+        ANALYSIS_REQUESTS.labels("cached" if existing["status"] == "done" else "deduplicated").inc()
+        return existing
+    if len(ANALYSIS_JOBS) >= ANALYSIS_QUEUE_LIMIT:
+        ANALYSIS_REQUESTS.labels("rejected").inc()
+        raise HTTPException(status_code=503, detail="Analysis queue is full")
+    ANALYSIS_RESULTS.pop(job_id, None)
+    job = ANALYSIS_JOBS[job_id] = AnalysisJob(job_id, normalized)
+    asyncio.create_task(_run_analysis(job))
+    ANALYSIS_REQUESTS.labels("queued").inc()
+    return {"jobId": job_id, "status": job.status}
+
+
+@app.get("/api/analyze/{job_id}", response_model=AnalysisJobResponse)
+async def get_analysis(job_id: str):
+    """Статус или результат задачи анализа"""
+    response = analysis_response(job_id)
+    if response is None:
+        raise HTTPException(status_code=404, detail="Analysis job not found")
+    return response
+
+
+@app.websocket("/ws/analyze/{job_id}")
+async def analysis_websocket_endpoint(websocket: WebSocket, job_id: str):
+    """Присылает результат задачи анализа, когда он готов, и закрывает соединение"""
+    await websocket.accept()
+    response = analysis_response(job_id)
+    if response is None:
+        await websocket.close(code=1008, reason="Analysis job not found")
+        return
+    try:
+        job = ANALYSIS_JOBS.get(job_id)
+        if job is not None:
+            await websocket.send_text(json.dumps(response))
+            # shield: отключение клиента не должно отменять общую задачу
+            response = await asyncio.shield(job.done)
+        await websocket.send_text(json.dumps(response))
+        await websocket.close()
+    except WebSocketDisconnect:
+        pass
+    except Exception as e:
+        logger.warning("Analysis WebSocket: error: %s", e, extra={"endpoint": "/ws/analyze"})
+
+
+@app.get("/api/stats")
+async def get_stats():
+    """Статистика резидентных и выселенных сессий"""
+    rehydrations = SESSION_STATS["rehydrations"]
+    return {
+        "residentSessions": len(SESSIONS),
+        "residentTokens": len(TOKENS),
+        "websocketSessions": len(WEBSOCKET_CONNECTIONS),
+        "spectatorSessions": len(SPECTATOR_CONNECTIONS),
+        "spectators": sum(len(c) for c in SPECTATOR_CONNECTIONS.values()),
+        "evictions": SESSION_STATS["evictions"],
+        "rehydrations": rehydrations,
+        "rehydrationAvgMs": (SESSION_STATS["rehydration_seconds_total"] / rehydrations * 1000) if rehydrations else 0.0,
+        "rehydrationMaxMs": SESSION_STATS["rehydration_seconds_max"] * 1000,
+    }
+
+
+@app.get("/metrics")
+async def get_metrics():
+    """Метрики в текстовом формате Prometheus"""
+    return Response(REGISTRY.render(), media_type=CONTENT_TYPE)
 
 
 @app.get("/api/fen")
 async def get_fen(token: str = Query(...)):
     """Получить текущую позицию в формате FEN"""
-    ref = TOKENS.get(token)
-    if ref is None:
-        raise HTTPException(status_code=401, detail="Invalid token")
-    
-    session = SESSIONS.get(ref.session_id)
-    if session is None:
-        raise HTTPException(status_code=404, detail="Session not found")
+    ref, session = resolve_token(token)
     
     fen_dict = session.game.to_fen_dict()
     return {"fen": json.dumps(fen_dict)}
 
 
+@app.get("/api/bpgn")
+async def get_bpgn(token: str = Query(...)):
+    """Запись партии в формате BPGN (с момента старта или последней загрузки FEN)"""
+    ref, session = resolve_token(token)
+    tags = {"Site": session.session_id}
+    for player_id in session.bots:
+        player = session.game.get_player(player_id)
+        tags[("White" if player.color == Color.WHITE else "Black") + player.board_name] = f"Движок (игрок {player_id})"
+    return Response(write_bpgn(session.game, tags), media_type="text/plain")
+
+
+@app.get("/api/archive/{session_id}")
+async def get_archived_game(session_id: str):
+    """Запись законченной партии из архива"""
+    record = await asyncio.to_thread(GAME_ARCHIVE.get, session_id)
+    if record is None:
+        raise HTTPException(status_code=404, detail="Game not found")
+    return record
+
+
+@app.get("/api/explorer")
+async def explorer(fen: str = Query(...)):
+    """Ходы, сделанные из позиции в законченных партиях, и их результат.
+
+    fen — позиция в формате /api/fen (JSON Game.to_fen_dict).
+    """
+    try:
+        position = json.loads(fen)
+        if not isinstance(position.get("boardA"), str) or not isinstance(position.get("boardB"), str):
+            raise ValueError("ожидались строки boardA и boardB")
+        # Через Game: одна позиция — один ключ, как бы её ни записали
+        game = Game()
+        game.from_fen_dict(position)
+        position = game.to_fen_dict()
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Invalid FEN: {str(e)}")
+    return EXPLORER.explore(position)
+
+
 @app.post("/api/load-fen")
 async def load_fen(request: dict):
     """Загрузить позицию из формата FEN"""
@@ -357,13 +1378,7 @@ async def load_fen(request: dict):
     if not fen_json:
         raise HTTPException(status_code=400, detail="Missing fen")
     
-    ref = TOKENS.get(token)
-    if ref is None:
-        raise HTTPException(status_code=401, detail="Invalid token")
-    
-    session = SESSIONS.get(ref.session_id)
-    if session is None:
-        raise HTTPException(status_code=404, detail="Session not found")
+    ref, session = resolve_token(token)
     
     try:
         fen_dict = json.loads(fen_json)
@@ -371,7 +1386,7 @@ async def load_fen(request: dict):
         session.version += 1
         session.fen_position = fen_json
         # Отправляем обновление всем подключенным клиентам
-        await broadcast_state_update(ref.session_id)
+        schedule_state_update(session)
         return build_state(session, ref.player_id)
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"Invalid FEN: {str(e)}")
@@ -384,6 +1399,41 @@ def build_state(session: Session, me_player_id: int) -> StateResponse:
     # Проверяем, не завершена ли игра
     game_over = game.check_game_over()
     
+    boards = build_boards(game)
+    reserves = build_reserves(game)
+    reserve_counts = build_reserve_counts(game)
+    
+    if session.fen_position is None:
+        session.fen_position = json.dumps(game.to_fen_dict())
+    
+    return StateResponse(
+        sessionId=session.session_id,
+        version=session.version,
+        me=MeState(
+            playerId=me.player_id,
+            board=me.board_name,
+            color=me.color.value
+        ),
+        boards=boards,
+        reserves=reserves,
+        myReserve=reserve_counts_for_player(me),
+        reserveCounts=reserve_counts,
+        fen=session.fen_position
+    )
+
+def build_legal_moves(session: Session, player_id: int) -> LegalMovesResponse:
+    """Подсказки ходов; движок считает их один раз на позицию"""
+    hints = session.game.legal_moves(player_id)
+    return LegalMovesResponse(
+        sessionId=session.session_id,
+        version=session.version,
+        playerId=player_id,
+        moves=hints["moves"],
+        drops=hints["drops"],
+    )
+
+def build_boards(game: Game) -> Dict[str, BoardState]:
+    """Состояние обеих досок: сетка, чей ход и шах"""
     boards: Dict[str, BoardState] = {}
     board_a = game.board_a
     board_b = game.board_b
@@ -425,38 +1475,44 @@ def build_state(session: Session, me_player_id: int) -> StateResponse:
         currentPlayer=current_player_a.value,
         grid=board_to_grid(board_a),
         inCheck=check_a,
-        kingInCheck=str(king_a) if king_a else None
+        kingInCheck=str(king_a) if king_a else None,
+        clock=ClockState(**board_a.clock.snapshot()) if board_a.clock else None
     )
     boards["B"] = BoardState(
         currentPlayer=current_player_b.value,
         grid=board_to_grid(board_b),
         inCheck=check_b,
-        kingInCheck=str(king_b) if king_b else None
+        kingInCheck=str(king_b) if king_b else None,
+        clock=ClockState(**board_b.clock.snapshot()) if board_b.clock else None
     )
+    return boards
+
 
+def build_reserves(game: Game) -> Dict[str, str]:
     reserves: Dict[str, str] = {}
     for player_id in [1, 2, 3, 4]:
         reserves[str(player_id)] = game.get_player(player_id).pieces_reserve.to_readable_string()
-    
+    return reserves
+
+
+def build_reserve_counts(game: Game) -> Dict[str, Dict[str, int]]:
     reserve_counts: Dict[str, Dict[str, int]] = {}
     for player_id in [1, 2, 3, 4]:
         reserve_counts[str(player_id)] = reserve_counts_for_player(game.get_player(player_id))
-    
+    return reserve_counts
+
+
+def build_spectator_state(session: Session) -> SpectatorState:
+    """Публичное состояние для зрителей (без привязки к игроку)"""
+    game = session.game
     if session.fen_position is None:
         session.fen_position = json.dumps(game.to_fen_dict())
-    
-    return StateResponse(
+    return SpectatorState(
         sessionId=session.session_id,
         version=session.version,
-        me=MeState(
-            playerId=me.player_id,
-            board=me.board_name,
-            color=me.color.value
-        ),
-        boards=boards,
-        reserves=reserves,
-        myReserve=reserve_counts_for_player(me),
-        reserveCounts=reserve_counts,
+        boards=build_boards(game),
+        reserves=build_reserves(game),
+        reserveCounts=build_reserve_counts(game),
         fen=session.fen_position
     )
 
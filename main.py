@@ -21,14 +21,21 @@ def get_local_ip():
 
 if __name__ == "__main__":
     port = int(os.getenv("PORT", "8000"))
+    workers = int(os.getenv("WORKERS", "1"))
     local_ip = get_local_ip()
     
     print("=" * 50)
     print(f"Сервер запускается на порту: {port}")
     print(f"Локальный доступ:           http://localhost:{port}")
     print(f"Доступ в сети:              http://{local_ip}:{port}")
+    if workers > 1:
+        print(f"Воркеров:                   {workers}")
     print("=" * 50)
     print("Сервер запущен! Нажмите Ctrl+C для остановки")
     print("=" * 50)
     
-    uvicorn.run(app, host="0.0.0.0", port=port)
\ No newline at end of file
+    if workers > 1:
+        from bughouse.cluster import run_cluster
+        run_cluster("0.0.0.0", port, workers)
+    else:
+        uvicorn.run(app, host="0.0.0.0", port=port)
\ No newline at end of file
@@ -17,8 +17,12 @@ const dropBTopEl = document.getElementById('dropB-top');
 const dropBBottomEl = document.getElementById('dropB-bottom');
 
 let lastState = null;
+let clockBase = 0; // performance.now() на момент получения показаний часов
+let clockState = null; // состояние, к которому относится clockBase
 let selected = null;
 let dropSelected = null; // "P"|"N"|"B"|"R"|"Q"
+let legalHints = null; // {version, moves: {from: [to]}, drops: {piece: [square]}}
+let legalRequestedVersion = null;
 
 const PLAYER_META = {
   '1': { board: 'A', color: 'WHITE', top: false },
@@ -63,6 +67,30 @@ function colorName(c) {
   return c === 'WHITE' ? 'белые' : 'чёрные';
 }
 
+function formatClock(ms) {
+  const total = Math.max(0, Math.ceil(ms / 1000));
+  const m = Math.floor(total / 60);
+  const s = String(total % 60).padStart(2, '0');
+  return `${m}:${s}`;
+}
+
+function clockText(boardName) {
+  const clock = lastState?.boards?.[boardName]?.clock;
+  if (!clock) return '';
+  const elapsed = performance.now() - clockBase;
+  const white = clock.white - (clock.running === 'WHITE' ? elapsed : 0);
+  const black = clock.black - (clock.running === 'BLACK' ? elapsed : 0);
+  return ` · ⏱ ${formatClock(white)} / ${formatClock(black)}`;
+}
+
+function renderTurns() {
+  if (!lastState) return;
+  const turnA = boardAEl.closest('.boardWrap').querySelector('.boardTurn');
+  const turnB = boardBEl.closest('.boardWrap').querySelector('.boardTurn');
+  turnA.textContent = `Ход: ${colorName(lastState.boards.A.currentPlayer)}${clockText('A')}`;
+  turnB.textContent = `Ход: ${colorName(lastState.boards.B.currentPlayer)}${clockText('B')}`;
+}
+
 function coordFromRC(row, col) {
   const file = String.fromCharCode('a'.charCodeAt(0) + col);
   const rank = (8 - row).toString();
@@ -163,6 +191,9 @@ function renderBoard(boardName, mountEl) {
       if (selected && selected.board === boardName && selected.coord === coord) {
         d.classList.add('selected');
       }
+      if (interactive && hintTargets().includes(coord)) {
+        d.classList.add('hint');
+      }
       
       // Подсветка короля при шахе
       if (inCheck && kingInCheck && coord === kingInCheck) {
@@ -193,18 +224,57 @@ function renderBoard(boardName, mountEl) {
   }
 }
 
+// Подсказки актуальны, только если посчитаны для текущей версии состояния
+function currentHints() {
+  return legalHints && legalHints.version === lastState?.version ? legalHints : null;
+}
+
+// Клетки, куда можно пойти выбранной фигурой или поставить выбранный дроп
+function hintTargets() {
+  const hints = currentHints();
+  if (!hints) return [];
+  if (dropSelected) return hints.drops[dropSelected] || [];
+  if (selected) return hints.moves[selected.coord] || [];
+  return [];
+}
+
+function requestLegalMoves() {
+  if (!lastState || !isMyTurnOn(lastState.me.board)) return;
+  if (currentHints() || legalRequestedVersion === lastState.version) return;
+  legalRequestedVersion = lastState.version;
+  if (ws && ws.readyState === WebSocket.OPEN) {
+    ws.send('legal_moves');
+    return;
+  }
+  fetch('/api/legal-moves?token=' + encodeURIComponent(token))
+    .then((resp) => (resp.ok ? resp.json() : null))
+    .then(applyLegalHints)
+    .catch(() => {});
+}
+
+function applyLegalHints(hints) {
+  if (!hints || hints.version !== lastState?.version) return;
+  legalHints = hints;
+  render();
+}
+
 async function onSquareClick(boardName, coord, sym) {
   if (!isMyBoard(boardName)) return;
   if (!isMyTurnOn(boardName)) {
     statusEl.textContent = 'Сейчас не ваш ход.';
     return;
   }
+  const hints = currentHints();
 
   if (dropSelected) {
     if (sym && sym !== '.') {
       statusEl.textContent = 'Нельзя поставить фигуру: клетка занята.';
       return;
     }
+    if (hints && !(hints.drops[dropSelected] || []).includes(coord)) {
+      statusEl.textContent = `Нельзя поставить ${dropSelected} на ${coord}.`;
+      return;
+    }
     const piece = dropSelected;
     statusEl.textContent = `Дроп: ${piece} на ${coord}...`;
     try {
@@ -214,12 +284,12 @@ async function onSquareClick(boardName, coord, sym) {
         body: JSON.stringify({ token, piece, square: coord }),
       });
     const data = await resp.json();
-    if (!resp.ok) throw new Error(data?.error || 'Ошибка дропа');
-    lastState = data;
+    if (!resp.ok) throw new Error(data?.detail || data?.error || 'Ошибка дропа');
     dropSelected = null;
     selected = null;
     statusEl.textContent = `OK: дроп ${piece} на ${coord}`;
     render();
+    awaitStateAfterAck();
     } catch (e) {
       statusEl.textContent = 'Ошибка: ' + (e?.message || e);
       render();
@@ -233,6 +303,10 @@ async function onSquareClick(boardName, coord, sym) {
       statusEl.textContent = 'Выберите свою фигуру.';
       return;
     }
+    if (hints && !hints.moves[coord]) {
+      statusEl.textContent = `У фигуры на ${coord} нет ходов.`;
+      return;
+    }
     selected = { board: boardName, coord };
     statusEl.textContent = `Выбрано: ${coord}. Теперь кликните клетку назначения.`;
     render();
@@ -242,6 +316,17 @@ async function onSquareClick(boardName, coord, sym) {
   // второй клик — попытаться сделать ход
   const from = selected.coord;
   const to = coord;
+  if (hints && !(hints.moves[from] || []).includes(to)) {
+    // Клик по другой своей фигуре — перевыбор, иначе ход заведомо нелегален
+    selected = null;
+    if (isMyPiece(sym) && from !== to) {
+      onSquareClick(boardName, coord, sym);
+    } else {
+      statusEl.textContent = from === to ? 'Выбор отменён.' : `Нельзя: ${from} → ${to}.`;
+      render();
+    }
+    return;
+  }
   selected = null;
   render();
 
@@ -295,14 +380,21 @@ async function onSquareClick(boardName, coord, sym) {
     }
 
     if (!resp.ok) throw new Error(data?.detail || data?.error || 'Ошибка хода');
-    lastState = data;
     statusEl.textContent = `OK: ${from} → ${to}`;
-    render();
+    awaitStateAfterAck();
   } catch (e) {
     statusEl.textContent = 'Ошибка: ' + (e?.message || e);
   }
 }
 
+// Ответ на ход/дроп — только подтверждение с версией; новое состояние
+// (и конец игры) приходит по WebSocket. Без соединения забираем его запросом.
+function awaitStateAfterAck() {
+  if (!ws || ws.readyState !== WebSocket.OPEN) {
+    initialFetch();
+  }
+}
+
 function renderReserves() {
   if (!lastState) return;
   const r = lastState?.reserves || {};
@@ -448,11 +540,12 @@ function render() {
   const boardBWrap = boardBEl.closest('.boardWrap');
   const titleA = boardAWrap.querySelector('.boardTitle');
   const titleB = boardBWrap.querySelector('.boardTitle');
-  const turnA = boardAWrap.querySelector('.boardTurn');
-  const turnB = boardBWrap.querySelector('.boardTurn');
   
-  turnA.textContent = `Ход: ${colorName(lastState.boards.A.currentPlayer)}`;
-  turnB.textContent = `Ход: ${colorName(lastState.boards.B.currentPlayer)}`;
+  if (clockState !== lastState) {
+    clockState = lastState;
+    clockBase = performance.now();
+  }
+  renderTurns();
   
   const boardsContainer = document.querySelector('.boards');
   
@@ -489,6 +582,7 @@ function render() {
   const myTurn = isMyTurnOn(myBoard);
   if (myTurn) {
     statusEl.textContent ||= 'Ваш ход. Можно сделать ход или выбрать дроп.';
+    requestLegalMoves();
   }
 }
 let ws = null;
@@ -519,6 +613,8 @@ function connectWebSocket() {
   ws.onopen = () => {
     isConnecting = false;
     reconnectAttempts = 0;
+    // Запрос подсказок мог потеряться вместе со старым соединением
+    legalRequestedVersion = null;
     console.log('WebSocket подключен');
     statusEl.textContent = 'Подключено к серверу';
   };  
@@ -529,10 +625,15 @@ function connectWebSocket() {
       }
       const message = JSON.parse(event.data);
       console.log('WebSocket сообщение:', message.type);
+      if (message.type === 'legal_moves') {
+        applyLegalHints(message);
+        return;
+      }
       if (message.type === 'state_update') {
         const myPlayerId = String(lastState?.me?.playerId || '1');
         const myState = message.states[myPlayerId];
-        if (myState) {
+        // Состояние, полученное запросом, могло оказаться новее
+        if (myState && !(lastState && myState.version < lastState.version)) {
           lastState = myState;
           render();
 
@@ -607,6 +708,9 @@ setInterval(() => {
   }
 }, 30000);
 
+// Локальный отсчёт часов между обновлениями с сервера
+setInterval(renderTurns, 250);
+
 window.addEventListener('beforeunload', () => {
   if (ws) {
     ws.close();
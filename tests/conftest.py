@@ -0,0 +1,13 @@
+"""Каталоги сервера — во временной папке: web_server читает их из окружения при импорте"""
+import os
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+_DATA = tempfile.mkdtemp(prefix="bughouse-tests-")
+for name, folder in (("SESSION_STORAGE_DIR", "sessions"), ("GAME_ARCHIVE_DIR", "archive"),
+                     ("EXPLORER_DIR", "explorer")):
+    os.environ.setdefault(name, os.path.join(_DATA, folder))
@@ -0,0 +1,46 @@
+import os
+
+from bughouse.archive import GameArchive
+from bughouse.cluster import extract_token
+
+
+def test_writers_share_directory(tmp_path):
+    first = GameArchive(str(tmp_path), writer="w0")
+    second = GameArchive(str(tmp_path), writer="w1", compression="lzma")
+    for index in range(3):
+        first.submit({"id": f"a{index}", "n": index})
+        second.submit({"id": f"b{index}", "n": index})
+    first.close()
+    second.close()
+    assert sorted(os.listdir(tmp_path)) == [
+        "games-w0-000001.jsonl.gz", "games-w0-000001.jsonl.gz.idx",
+        "games-w1-000001.jsonl.xz", "games-w1-000001.jsonl.xz.idx",
+    ]
+    reader = GameArchive(str(tmp_path))
+    assert reader.get("a2") == {"id": "a2", "n": 2}
+    assert reader.get("b1") == {"id": "b1", "n": 1}
+    assert reader.get("missing") is None
+
+
+def test_reader_sees_later_writes(tmp_path):
+    reader = GameArchive(str(tmp_path))
+    assert reader.get("late") is None
+    writer = GameArchive(str(tmp_path), writer="w1")
+    writer.submit({"id": "late"})
+    writer.submit({"id": "late-2"})
+    writer.close()
+    assert reader.get("late") == {"id": "late"}
+    assert reader.get("late-2") == {"id": "late-2"}
+
+
+def test_located_cache_is_bounded(tmp_path):
+    archive = GameArchive(str(tmp_path), cache_size=2)
+    for index in range(5):
+        archive.submit({"id": f"g{index}"})
+    archive.close()
+    assert [archive.get(f"g{index}")["id"] for index in range(5)] == [f"g{index}" for index in range(5)]
+    assert list(archive._located) == ["g3", "g4"]
+
+
+def test_archive_lookup_routes_to_owner():
+    assert extract_token("/api/archive/abc-123", b"") == "abc-123"
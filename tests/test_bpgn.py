@@ -0,0 +1,55 @@
+import io
+
+from bughouse.bpgn import read_games, replay, write_bpgn
+from bughouse.game import Game
+
+FIELDS = ("type", "player", "from", "to", "piece", "square", "victimSquare")
+PROMOTION_START = {
+    "boardA": "4k3/P7/8/8/8/8/8/4K3 w - - 0 1",
+    "boardB": "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1",
+}
+
+
+def _captures_and_drops() -> Game:
+    """Взятие на доске A и дроп взятой пешки партнёром на доске B"""
+    game = Game()
+    game.make_move(1, "e2", "e4")
+    game.make_move(4, "d7", "d5")
+    game.make_move(1, "e4", "d5")
+    game.make_move(2, "d2", "d4")
+    game.make_drop(3, "P", "e5")
+    return game
+
+
+def _promotion() -> Game:
+    """Превращение с забором ферзя у партнёра соперника (игрок 2)"""
+    game = Game()
+    game.from_fen_dict(PROMOTION_START)
+    game.make_move(1, "a7", "a8", victim_player_id=2, victim_square="d1")
+    return game
+
+
+def test_write_parse_round_trip():
+    games = [_captures_and_drops(), _promotion()]
+    text = "".join(write_bpgn(game, {"Event": f"Round trip {index}"}) for index, game in enumerate(games))
+    records = list(read_games(io.StringIO(text)))
+    assert len(records) == len(games)
+    for index, (game, record) in enumerate(zip(games, records)):
+        assert record.tags["Event"] == f"Round trip {index}"
+        assert [{key: move.get(key) for key in FIELDS} for move in record.moves] == \
+            [{key: move.get(key) for key in FIELDS} for move in game.history]
+        assert replay(record).to_fen_dict() == game.to_fen_dict()
+    assert records[1].moves[0]["victimSquare"] == "d1"
+    assert records[0].moves[-1]["type"] == "drop"
+
+
+def test_partial_start_position_round_trip():
+    game = Game()
+    game.make_move(2, "d2", "d4")
+    game.from_fen_dict({"boardA": PROMOTION_START["boardA"]})
+    assert set(game.start_position) == {"boardA", "boardB", "reserves"}
+    game.make_move(1, "e1", "d2")
+    records = list(read_games(io.StringIO(write_bpgn(game))))
+    assert len(records) == 1
+    assert records[0].start_position() == game.start_position
+    assert replay(records[0]).to_fen_dict() == game.to_fen_dict()
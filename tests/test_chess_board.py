@@ -0,0 +1,51 @@
+import pytest
+
+from bughouse.chess_board import ChessBoard
+from bughouse.color import Color
+from bughouse.random_games import game_rng, play_random_game
+
+
+def _board(fen: str) -> ChessBoard:
+    board = ChessBoard()
+    board.init_from_fen(fen)
+    return board
+
+
+def _attacked_by_moves(board: ChessBoard, color: Color) -> bool:
+    """Прежнее определение шаха: клетка короля среди ходов фигур соперника"""
+    king = board.find_king(color)
+    return any(king in piece.get_possible_moves(board)
+               for column in board.squares for piece in column
+               if piece is not None and piece.color != color)
+
+
+@pytest.mark.parametrize("fen, white, black", [
+    ("4k3/8/8/8/8/8/8/4K3 w - - 0 1", False, False),
+    # Пешки бьют по диагонали вперёд, но не прямо и не назад
+    ("4k3/8/8/8/8/8/3p4/4K3 w - - 0 1", True, False),
+    ("4k3/8/8/8/8/8/4p3/4K3 w - - 0 1", False, False),
+    ("4k3/3P4/8/8/8/8/8/4K3 b - - 0 1", False, True),
+    ("4k3/8/8/8/8/8/8/3PK3 b - - 0 1", False, False),
+    # Конь, дальнобойные фигуры и закрытая линия
+    ("4k3/8/8/8/8/5n2/8/4K3 w - - 0 1", True, False),
+    ("4k3/8/8/8/8/8/8/r3K3 w - - 0 1", True, False),
+    ("4k3/8/8/8/8/8/8/r1N1K3 w - - 0 1", False, False),
+    ("4k3/8/8/b7/8/8/8/4K3 w - - 0 1", True, False),
+    ("4k3/8/8/8/8/8/8/4K2q w - - 0 1", True, False),
+    ("4k3/8/8/8/8/8/8/R3K2R b KQ - 0 1", False, False),
+    ("4k3/8/8/8/8/8/8/4K1R1 b - - 0 1", False, False),
+    ("4k3/4R3/8/8/8/8/8/4K3 b - - 0 1", False, True),
+])
+def test_check_detection(fen, white, black):
+    board = _board(fen)
+    assert board.is_king_in_check(Color.WHITE) is white
+    assert board.is_king_in_check(Color.BLACK) is black
+
+
+def test_check_detection_matches_move_generation():
+    # Итоговые позиции случайных партий разной длины
+    for index in range(40):
+        game = play_random_game(game_rng(11, index), plies=2 * index + 1)
+        for board in (game.board_a, game.board_b):
+            for color in (Color.WHITE, Color.BLACK):
+                assert board.is_king_in_check(color) == _attacked_by_moves(board, color)
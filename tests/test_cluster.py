@@ -0,0 +1,94 @@
+import asyncio
+import json
+
+import pytest
+
+from bughouse import web_server
+from bughouse.cluster import (
+    SHARD_COUNT_ENV, SHARD_INDEX_ENV, BadRequest, ShardRouter, _read_body, extract_token, merge_metrics,
+    merge_stats, shard_for,
+)
+
+
+def test_keyed_paths():
+    assert extract_token("/ws/abc", b"") == "abc"
+    assert extract_token("/ws/analyze/job-1", b"") == "job-1"
+    assert extract_token("/api/analyze/job-1", b"") == "job-1"
+    assert extract_token("/api/archive/session-1", b"") == "session-1"
+    assert extract_token("/api/fen?token=t1", b"") == "t1"
+    assert extract_token("/api/move", json.dumps({"token": "t2"}).encode()) == "t2"
+    assert extract_token("/api/start", b"") is None
+
+
+def test_same_analysis_position_goes_to_same_worker():
+    router = ShardRouter([f"/tmp/worker-{i}.sock" for i in range(4)])
+    body = {"boardA": "8/8/8/8/8/8/8/K6k w - - 0 1", "boardB": "8/8/8/8/8/8/8/K6k w - - 0 1", "reserves": {}}
+    shards = {router.route("/api/analyze", json.dumps(dict(body, extra=i)).encode()) for i in range(10)}
+    assert len(shards) == 1
+
+
+def test_analysis_job_id_lands_on_own_shard(monkeypatch):
+    position = web_server.Game().to_fen_dict()
+    monkeypatch.setenv(SHARD_COUNT_ENV, "4")
+    ids = set()
+    for index in range(4):
+        monkeypatch.setenv(SHARD_INDEX_ENV, str(index))
+        job_id = web_server.analysis_key(position)
+        assert shard_for(job_id, 4) == index
+        assert web_server.analysis_key(position) == job_id
+        ids.add(job_id)
+    assert len(ids) == 4
+
+
+def _read(data: bytes, headers):
+    async def read():
+        reader = asyncio.StreamReader()
+        reader.feed_data(data)
+        reader.feed_eof()
+        return await _read_body(reader, headers)
+    return asyncio.run(read())
+
+
+def test_chunked_body_is_forwarded_with_content_length():
+    body, headers = _read(b'7\r\n{"token\r\n8;ext=1\r\n": "t3"}\r\n0\r\nX-Trailer: 1\r\n\r\n',
+                          [("Host", "x"), ("Transfer-Encoding", "chunked")])
+    assert body == b'{"token": "t3"}'
+    assert headers == [("Host", "x"), ("Content-Length", str(len(body)))]
+    assert extract_token("/api/move", body) == "t3"
+
+
+def test_unsupported_transfer_encoding_is_rejected():
+    with pytest.raises(BadRequest) as e:
+        _read(b"", [("Transfer-Encoding", "gzip, chunked")])
+    assert e.value.args[0] == 501
+    with pytest.raises(BadRequest) as e:
+        _read(b"zz\r\n", [("Transfer-Encoding", "chunked")])
+    assert e.value.args[0] == 400
+
+
+def test_metrics_from_workers_are_labelled_by_shard():
+    text = (
+        "# HELP requests_total Requests\n# TYPE requests_total counter\n"
+        'requests_total{path="/api/move"} 3\n'
+        "# HELP sessions Sessions\n# TYPE sessions gauge\nsessions 2\n"
+    )
+    merged = merge_metrics({1: text.replace("3", "5"), 0: text})
+    assert merged.count("# TYPE requests_total counter") == 1
+    assert merged.splitlines() == [
+        "# HELP requests_total Requests", "# TYPE requests_total counter",
+        'requests_total{shard="0",path="/api/move"} 3', 'requests_total{shard="1",path="/api/move"} 5',
+        "# HELP sessions Sessions", "# TYPE sessions gauge",
+        'sessions{shard="0"} 2', 'sessions{shard="1"} 2',
+    ]
+
+
+def test_stats_from_workers_are_summed():
+    merged = merge_stats({
+        0: {"residentSessions": 2, "rehydrations": 1, "rehydrationAvgMs": 4.0, "rehydrationMaxMs": 4.0},
+        1: {"residentSessions": 3, "rehydrations": 3, "rehydrationAvgMs": 8.0, "rehydrationMaxMs": 10.0},
+    })
+    assert merged["residentSessions"] == 5
+    assert merged["rehydrations"] == 4
+    assert merged["rehydrationAvgMs"] == 7.0
+    assert merged["rehydrationMaxMs"] == 10.0
+    assert merged["shards"]["1"]["residentSessions"] == 3
@@ -0,0 +1,50 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from bughouse.engine import ParallelSearch, analyze_position, candidate_actions, choose_action
+from bughouse.game import Game
+
+# Ферзь g3 при поддержке слона e4: g3-g2 — мат белому королю h1, закрыться дропом нельзя
+MATE_IN_ONE = "k7/8/8/8/4b3/6q1/8/7K b - - 0 1"
+
+
+def _position():
+    position = Game().to_fen_dict()
+    position["boardA"] = MATE_IN_ONE
+    # Пустые запасы: иначе матует и дроп на g2
+    position["reserves"] = {pid: {piece: 0 for piece in "PNBRQ"} for pid in position["reserves"]}
+    return position
+
+
+def test_engine_finds_mate_in_one():
+    result = choose_action(_position(), 4, move_time=1.0)
+    assert result["action"] == {"type": "move", "from": "g3", "to": "g2"}
+    assert result["score"] > 0
+
+
+def test_analysis_reports_side_to_move():
+    report = analyze_position(_position(), move_time=1.0)
+    assert report["gameOver"] is None
+    assert report["boards"]["A"]["playerId"] == 4
+    assert report["boards"]["B"]["playerId"] == 2
+    assert report["boards"]["A"]["action"] == {"type": "move", "from": "g3", "to": "g2"}
+
+
+def test_parallel_root_marks_cut_moves_as_bounds():
+    # Пул потоков вместо процессов: проверяется только разбор оценок корня
+    search = ParallelSearch.__new__(ParallelSearch)
+    search.workers = 1
+    search.pool = ThreadPoolExecutor(1)
+    try:
+        game = Game()
+        game.from_fen_dict(_position())
+        mate = {"type": "move", "from": "g3", "to": "g2"}
+        actions = [mate] + [action for action in candidate_actions(game, 4) if action != mate]
+        scored, timed_out, _ = search._search_root(_position(), 4, actions, 1, time.time() + 30)
+        assert not timed_out
+        assert scored[0][0] == mate and scored[0][2]
+        # Остальные ходы считались с окном от оценки мата: это только верхние границы
+        assert len(scored) > 1 and not any(exact for _, _, exact in scored[1:])
+        assert search.choose_action(_position(), 4, move_time=1.0, max_depth=2)["action"] == mate
+    finally:
+        search.pool.shutdown()
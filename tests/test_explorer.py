@@ -0,0 +1,87 @@
+import os
+
+import numpy as np
+
+from bughouse.explorer import (
+    PositionIndex, decode_move, encode_move, game_positions, position_hash, result_code, run_writer,
+)
+from bughouse.game import Game
+
+# Сыгранные партии: (ходы доски A по очереди игроков 1 и 4, результат)
+GAMES = [
+    (["e2e4", "e7e5", "g1f3"], {"winner": "team1"}),
+    (["e2e4", "c7c5"], {"winner": "team2"}),
+    (["d2d4", "d7d5"], None),
+]
+
+
+def _history(moves):
+    game = Game()
+    for number, move in enumerate(moves):
+        game.make_move(1 if number % 2 == 0 else 4, move[:2], move[2:])
+    return game.history
+
+
+def _fill(index: PositionIndex):
+    for number, (moves, game_over) in enumerate(GAMES):
+        keys, records = game_positions(f"game-{number}", None, _history(moves), result_code(game_over))
+        index.add(keys, records)
+
+
+def test_explore_start_position(tmp_path):
+    index = PositionIndex(str(tmp_path), flush_records=3)
+    _fill(index)
+    start = Game().to_fen_dict()
+    report = index.explore(start)
+    assert report["positionHash"] == f"{position_hash(start):016x}"
+    assert report["games"] == 3
+    assert [(move["move"], move["games"], move["wins"], move["losses"]) for move in report["moves"]] == [
+        ("e2e4", 2, 1, 1), ("d2d4", 1, 0, 0)]
+    assert report["moves"][1]["score"] is None
+
+    index.flush()
+    assert index.pending == 0
+    reader = PositionIndex(str(tmp_path))
+    assert reader.explore(start) == report
+
+    assert reader.compact() is not None
+    assert len(reader.runs) == 1
+    assert PositionIndex(str(tmp_path)).explore(start) == report
+
+
+def test_writer_merges_only_own_runs(tmp_path):
+    other = PositionIndex(str(tmp_path), flush_records=1, writer="w1")
+    _fill(other)
+    other_runs = set(other.runs)
+    index = PositionIndex(str(tmp_path), flush_records=1, writer="w0", max_runs=2)
+    _fill(index)
+    start = Game().to_fen_dict()
+    report = PositionIndex(str(tmp_path)).explore(start)
+    assert len(index.own_runs(refresh_interval=0)) > 2 and index.compaction_due()
+
+    runs = index.own_runs()
+    name = PositionIndex.merge_runs(index.directory, runs, index.writer)
+    index.replace_runs(runs, name)
+    assert [run_writer(name) for name in index.runs].count("w0") == 1
+    assert not index.compaction_due()
+    assert {os.path.basename(run.base) for run in other.own_runs(refresh_interval=0)} == other_runs
+    assert PositionIndex(str(tmp_path)).explore(start)["moves"] == report["moves"]
+
+
+def test_unknown_position_is_empty(tmp_path):
+    index = PositionIndex(str(tmp_path))
+    position = Game().to_fen_dict()
+    position["boardA"] = "k7/8/8/8/8/8/8/7K w - - 0 1"
+    report = index.explore(position)
+    assert report["games"] == 0 and report["moves"] == []
+    assert len(index.lookup(position_hash(position))) == 0
+
+
+def test_move_codes():
+    entries = [
+        {"type": "move", "from": "e2", "to": "e4"},
+        {"type": "drop", "piece": "N", "square": "f3"},
+        {"type": "move", "from": "e7", "to": "e8", "piece": "Q", "victimSquare": "d8"},
+    ]
+    assert [decode_move(encode_move(entry)) for entry in entries] == ["e2e4", "N@f3", "e7e8=Q(d8)"]
+    assert np.uint32(encode_move(entries[2])) == encode_move(entries[2])
@@ -0,0 +1,97 @@
+import asyncio
+
+from bughouse.fanout import FanoutBroker, InProcessFanout, UnixSocketFanout
+
+
+async def _settle(condition, timeout: float = 2.0):
+    deadline = asyncio.get_running_loop().time() + timeout
+    while not condition():
+        assert asyncio.get_running_loop().time() < deadline
+        await asyncio.sleep(0.01)
+
+
+def test_in_process_delivers_in_version_order():
+    async def scenario():
+        fanout = InProcessFanout()
+        received = []
+
+        async def subscriber(session_id, version, payload):
+            received.append(version)
+
+        assert not fanout.has_subscribers("s")
+        fanout.subscribe("s", subscriber)
+        assert fanout.has_subscribers("s")
+        for version in (1, 3, 2, 4):
+            await fanout.publish("s", version, "{}")
+        assert received == [1, 3, 4]
+
+    asyncio.run(scenario())
+
+
+def test_broker_tracks_subscribers_of_other_processes(tmp_path):
+    async def scenario():
+        broker = FanoutBroker(str(tmp_path / "fanout.sock"))
+        await broker.start()
+        publisher = UnixSocketFanout(broker.socket_path)
+        listener = UnixSocketFanout(broker.socket_path)
+        await publisher.start()
+        await listener.start()
+        received = []
+
+        async def subscriber(session_id, version, payload):
+            received.append((session_id, version, payload))
+
+        try:
+            assert not publisher.has_subscribers("s")
+            listener.subscribe("s", subscriber)
+            await _settle(lambda: publisher.has_subscribers("s"))
+            await publisher.publish("s", 1, '{"a": 1}')
+            await _settle(lambda: received)
+            assert received == [("s", 1, '{"a": 1}')]
+
+            late = UnixSocketFanout(broker.socket_path)
+            await late.start()
+            await _settle(lambda: late.has_subscribers("s"))
+            await late.stop()
+
+            listener.unsubscribe("s", subscriber)
+            await _settle(lambda: not publisher.has_subscribers("s"))
+        finally:
+            await publisher.stop()
+            await listener.stop()
+            await broker.stop()
+
+    asyncio.run(scenario())
+
+
+def test_slow_session_does_not_block_others(tmp_path):
+    async def scenario():
+        broker = FanoutBroker(str(tmp_path / "fanout.sock"))
+        await broker.start()
+        fanout = UnixSocketFanout(broker.socket_path)
+        await fanout.start()
+        release = asyncio.Event()
+        slow, fast = [], []
+
+        async def slow_subscriber(session_id, version, payload):
+            await release.wait()
+            slow.append(version)
+
+        async def fast_subscriber(session_id, version, payload):
+            fast.append(version)
+
+        try:
+            fanout.subscribe("slow", slow_subscriber)
+            fanout.subscribe("fast", fast_subscriber)
+            for version in (1, 2, 3):
+                await fanout.publish("slow", version, "{}")
+            await fanout.publish("fast", 1, "{}")
+            await _settle(lambda: fast == [1])
+            assert slow == []
+            release.set()
+            await _settle(lambda: slow == [1, 2, 3])
+        finally:
+            await fanout.stop()
+            await broker.stop()
+
+    asyncio.run(scenario())
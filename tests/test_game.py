@@ -0,0 +1,57 @@
+import pytest
+
+from bughouse.game import Game, PromotionRequired
+from bughouse.random_games import random_games
+
+
+def _apply(game: Game, entry):
+    if entry["type"] == "drop":
+        game.make_drop(entry["player"], entry["piece"], entry["square"])
+        return
+    victim_id = None
+    if entry.get("victimSquare"):
+        opponent = game.get_player(int(game.get_player(entry["player"]).get_opponent_player_id()))
+        victim_id = opponent.get_partner_id()
+    game.make_move(entry["player"], entry["from"], entry["to"],
+                   victim_player_id=victim_id, victim_square=entry.get("victimSquare"))
+
+
+def _accepts_move(game: Game, player_id: int, source: str, target: str) -> bool:
+    try:
+        game.copy().make_move(player_id, source, target)
+    except PromotionRequired:
+        # Превращение возможно — остаётся выбрать фигуру жертвы
+        return True
+    except ValueError:
+        return False
+    return True
+
+
+@pytest.mark.parametrize("index", range(3))
+def test_legal_moves_match_make_move(index):
+    played = next(random_games(seed=41, count=1, plies=40, start=index))
+    game = Game()
+    for entry in played.history:
+        player_id = entry["player"]
+        hints = game.legal_moves(player_id)
+        if entry["type"] == "drop":
+            assert entry["square"] in hints["drops"][entry["piece"]]
+        else:
+            assert entry["to"] in hints["moves"][entry["from"]]
+        player = game.get_player(player_id)
+        for column in player.board.squares:
+            for piece in column:
+                if piece is None or piece.color != player.color:
+                    continue
+                source = str(piece.coordinate)
+                listed = set(hints["moves"].get(source, ()))
+                for target in map(str, piece.get_possible_moves(player.board)):
+                    assert _accepts_move(game, player_id, source, target) == (target in listed), (source, target)
+        _apply(game, entry)
+    assert game.to_fen_dict() == played.to_fen_dict()
+
+
+def test_no_hints_for_waiting_player():
+    game = Game()
+    assert game.legal_moves(4) == {"moves": {}, "drops": {}}
+    assert len(game.legal_moves(1)["moves"]) == 10
@@ -0,0 +1,88 @@
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+
+from bughouse import web_server
+
+
+@pytest.fixture
+def client():
+    with TestClient(web_server.app) as client:
+        yield client
+
+
+def test_flagged_game_survives_eviction(client, monkeypatch):
+    start = client.post("/api/start?time=0.3").json()
+    tokens = {p["playerId"]: p["token"] for p in start["players"]}
+    assert client.post("/api/move", json={"token": tokens[1], "from": "e2", "to": "e4"}).status_code == 200
+    time.sleep(0.5)
+    session = web_server.SESSIONS[start["sessionId"]]
+    game_over = session.game.check_game_over()
+    assert game_over is not None and game_over["winner"] == "team1"
+
+    monkeypatch.setattr(web_server, "SESSION_IDLE_TTL", 0)
+    assert client.portal.call(web_server.evict_idle_sessions) >= 1
+    assert start["sessionId"] not in web_server.SESSIONS
+
+    response = client.post("/api/move", json={"token": tokens[4], "from": "e7", "to": "e5"})
+    assert response.status_code == 400
+    restored = web_server.SESSIONS[start["sessionId"]]
+    assert restored.game.check_game_over() == game_over
+    # После возврата в память копия на диске больше не нужна
+    assert web_server.SESSION_STORAGE.load(start["sessionId"]) is None
+    assert web_server.SESSION_STORAGE.find_session_id(tokens[1]) is None
+
+
+def test_session_changed_during_save_stays_resident(client, monkeypatch):
+    start = client.post("/api/start").json()
+    session = web_server.SESSIONS[start["sessionId"]]
+    save = web_server.SESSION_STORAGE.save
+
+    def save_and_move(session_id, data, tokens):
+        save(session_id, data, tokens)
+        session.version += 1  # ход, пришедший, пока файл писался
+
+    monkeypatch.setattr(web_server.SESSION_STORAGE, "save", save_and_move)
+    monkeypatch.setattr(web_server, "SESSION_IDLE_TTL", 0)
+    client.portal.call(web_server.evict_idle_sessions)
+    assert web_server.SESSIONS.get(start["sessionId"]) is session
+
+
+def test_sessions_with_pending_bot_moves_are_not_evicted(monkeypatch):
+    monkeypatch.setattr(web_server, "SESSION_IDLE_TTL", 0)
+    session = web_server.Session("thinking-bot", web_server.Game(), {1: "a", 2: "b", 3: "c", 4: "d"})
+    session.bot_tasks[2] = object()
+    monkeypatch.setitem(web_server.SESSIONS, session.session_id, session)
+    assert session.session_id not in web_server._eviction_candidates(time.monotonic() + 10)
+
+
+def test_session_round_trip_keeps_flag_result():
+    game = web_server.Game()
+    game.set_clocks(100)
+    game.make_move(1, "e2", "e4")
+    time.sleep(0.2)
+    game_over = game.check_game_over()
+    assert game_over is not None
+    session = web_server.Session("s", game, {1: "a", 2: "b", 3: "c", 4: "d"})
+    restored = web_server.Session.from_dict(session.to_dict())
+    assert restored.game.check_game_over() == game_over
+
+
+def test_short_ttl_only_for_finished_archived_games(monkeypatch):
+    monkeypatch.setattr(web_server, "SESSION_IDLE_TTL", 1800)
+    monkeypatch.setattr(web_server, "FINISHED_SESSION_TTL", 60)
+    game = web_server.Game()
+    session = web_server.Session("archived-game", game, {1: "a", 2: "b", 3: "c", 4: "d"})
+    assert web_server._idle_ttl(session) == 1800
+    session.archived = True
+    # Партия в архиве, но не закончена: обычный TTL
+    assert web_server._idle_ttl(session) == 1800
+
+    game.set_clocks(100)
+    game.make_move(1, "e2", "e4")
+    time.sleep(0.2)
+    assert game.check_game_over() is not None
+    assert web_server._idle_ttl(session) == 60
+    restored = web_server.Session.from_dict(session.to_dict())
+    assert web_server._idle_ttl(restored) == 60
@@ -0,0 +1,54 @@
+import asyncio
+import time
+
+from bughouse import web_server
+from bughouse.fanout import InProcessFanout
+
+
+class FakeSocket:
+    def __init__(self, behaviour: str):
+        self.behaviour = behaviour
+        self.sent = []
+
+    async def send_text(self, payload: str):
+        if self.behaviour == "hang":
+            await asyncio.Event().wait()
+        if self.behaviour == "fail":
+            raise RuntimeError("closed")
+        self.sent.append(payload)
+
+
+def test_send_to_all_does_not_wait_for_stuck_socket(monkeypatch):
+    monkeypatch.setattr(web_server, "WS_SEND_TIMEOUT", 0.05)
+    sockets = {name: FakeSocket(name) for name in ("ok", "hang", "fail")}
+    started = time.monotonic()
+    sent, failed = asyncio.run(web_server.send_to_all(set(sockets.values()), "frame"))
+    assert time.monotonic() - started < 1
+    assert sent == 1
+    assert failed == {sockets["hang"], sockets["fail"]}
+    assert sockets["ok"].sent == ["frame"]
+
+
+def test_delayed_spectator_frames_are_cancelled(monkeypatch):
+    monkeypatch.setattr(web_server, "SPECTATOR_DELAY", 0.05)
+    monkeypatch.setattr(web_server, "FANOUT", InProcessFanout())
+    received = []
+
+    async def subscriber(channel, version, payload):
+        received.append(version)
+
+    async def scenario():
+        session = web_server.Session("spectated", web_server.Game(), {1: "a", 2: "b", 3: "c", 4: "d"})
+        web_server.FANOUT.subscribe(web_server.spectator_channel(session.session_id), subscriber)
+        await web_server.publish_spectator_frame(session)
+        await asyncio.sleep(0.1)
+        assert received == [1] and not session.spectator_publishes
+
+        session.version = 2
+        await web_server.publish_spectator_frame(session)
+        assert len(session.spectator_publishes) == 1
+        web_server.cancel_delayed_publishes(session)
+        await asyncio.sleep(0.1)
+        assert received == [1] and not session.spectator_publishes
+
+    asyncio.run(scenario())
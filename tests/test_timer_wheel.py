@@ -0,0 +1,38 @@
+from bughouse.timer_wheel import TimerWheel
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def test_timers_fire_at_deadline_not_before():
+    clock = FakeClock()
+    wheel = TimerWheel(tick=0.01, slots=16, levels=3, now=clock)
+    fired = []
+    # Сроки на разных уровнях колеса и дальше последнего уровня
+    for delay in (0.005, 0.05, 0.3, 2.0, 50.0):
+        wheel.schedule(clock.now + delay, lambda delay=delay: fired.append((delay, clock.now)))
+    assert wheel.pending == 5
+    for step in range(6000):
+        clock.now = 100.0 + (step + 1) * 0.01
+        wheel.advance()
+    assert [delay for delay, _ in fired] == [0.005, 0.05, 0.3, 2.0, 50.0]
+    for delay, when in fired:
+        assert 100.0 + delay <= when + 1e-9 < 100.0 + delay + 0.02
+    assert wheel.pending == 0
+
+
+def test_cancelled_timer_does_not_fire():
+    clock = FakeClock()
+    wheel = TimerWheel(tick=0.01, slots=16, levels=2, now=clock)
+    fired = []
+    handle = wheel.schedule(clock.now + 0.5, lambda: fired.append("cancelled"))
+    wheel.schedule(clock.now + 0.5, lambda: fired.append("kept"))
+    handle.cancel()
+    assert wheel.advance(clock.now + 1.0) == 1
+    assert fired == ["kept"]
+    assert wheel.pending == 0
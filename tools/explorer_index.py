@@ -0,0 +1,126 @@
+"""Индекс позиций обозревателя (bughouse.explorer) из архивов BPGN и его слияние.
+
+Партии проигрываются в пуле процессов (как в tools.replay_archive),
+записи копятся и сбрасываются прогонами по --flush записей. Каталог
+тот же, что у сервера (EXPLORER_DIR), — сервер подхватывает новые
+прогоны без перезапуска.
+
+Запуск:
+    python -m tools.explorer_index build archive/*.bpgn.gz --dir explorer_index --workers 8
+    python -m tools.explorer_index compact --dir explorer_index
+
+compact сливает все прогоны в один: каждый прогон — лишний бинарный
+поиск на запрос. Слияние читает индекс в память целиком, его запускают
+офлайн (например, по расписанию), а не в сервере.
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from typing import Any, Dict, List, Tuple
+
+import numpy as np
+
+from bughouse.bpgn import BpgnGame
+from bughouse.explorer import RECORD_DTYPE, RESULT_TEAM1, RESULT_TEAM2, RESULT_UNKNOWN, PositionIndex, game_positions
+from tools.replay_archive import chunks
+
+
+RESULT_CODES = {"1-0": RESULT_TEAM1, "0-1": RESULT_TEAM2}
+
+
+def index_chunk(chunk: List[Tuple[str, int, BpgnGame]]) -> Tuple[np.ndarray, np.ndarray, int]:
+    """Задача пула: записи индекса пачки партий и число пропущенных (непроигрываемых) партий"""
+    keys, records, skipped = [], [], 0
+    for source, index, record in chunk:
+        try:
+            game_keys, game_records = game_positions(
+                f"{source}#{index}", record.start_position(), record.moves,
+                RESULT_CODES.get(record.result, RESULT_UNKNOWN))
+        except Exception:
+            # Непринятый ход или битые теги: такие партии ищет tools.replay_archive
+            skipped += 1
+            continue
+        keys.append(game_keys)
+        records.append(game_records)
+    if not keys:
+        return np.zeros(0, dtype=np.uint64), np.zeros(0, dtype=RECORD_DTYPE), skipped
+    return np.concatenate(keys), np.concatenate(records), skipped
+
+
+def build(paths: List[str], directory: str, workers: int, chunk_size: int, flush_records: int) -> Dict[str, Any]:
+    index = PositionIndex(directory, flush_records)
+    index.refresh()
+    runs_before = len(index.runs)
+    games = skipped = 0
+    started = time.perf_counter()
+
+    def collect(result: Tuple[np.ndarray, np.ndarray, int], size: int):
+        nonlocal games, skipped
+        keys, records, chunk_skipped = result
+        index.add(keys, records)
+        games += size - chunk_skipped
+        skipped += chunk_skipped
+
+    if workers <= 1:
+        for chunk in chunks(paths, chunk_size):
+            collect(index_chunk(chunk), len(chunk))
+    else:
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+            running = {}
+            for chunk in chunks(paths, chunk_size):
+                if len(running) >= workers * 2:
+                    done, _ = wait(running, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        collect(future.result(), running.pop(future))
+                running[pool.submit(index_chunk, chunk)] = len(chunk)
+            for future in wait(running).done:
+                collect(future.result(), running[future])
+    index.flush()
+    elapsed = time.perf_counter() - started
+    return {
+        "games": games,
+        "skipped": skipped,
+        "records": len(index),
+        "newRuns": len(index.runs) - runs_before,
+        "seconds": elapsed,
+        "gamesPerSecond": games / elapsed if elapsed else 0.0,
+    }
+
+
+def compact(directory: str) -> Dict[str, Any]:
+    index = PositionIndex(directory)
+    index.refresh()
+    runs_before = len(index.runs)
+    started = time.perf_counter()
+    index.compact()
+    return {"runsBefore": runs_before, "runs": len(index.runs), "records": len(index),
+            "seconds": time.perf_counter() - started}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("command", choices=("build", "compact"))
+    parser.add_argument("files", nargs="*", help="файлы BPGN (.bpgn или .bpgn.gz) для build")
+    parser.add_argument("--dir", default=os.getenv("EXPLORER_DIR", "explorer_index"), help="каталог индекса")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="процессов (1 — без пула)")
+    parser.add_argument("--chunk", type=int, default=64, help="партий в пачке на процесс")
+    parser.add_argument("--flush", type=int, default=1_000_000, help="записей в одном прогоне")
+    args = parser.parse_args()
+
+    if args.command == "build":
+        if not args.files:
+            parser.error("build: нужны файлы BPGN")
+        report = build(args.files, args.dir, args.workers, args.chunk, args.flush)
+    else:
+        report = compact(args.dir)
+    print(json.dumps(report, indent=2, ensure_ascii=False))
+    if report.get("skipped"):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
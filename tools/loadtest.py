@@ -0,0 +1,311 @@
+"""Нагрузочный HTTP-тест: сколько одновременных партий держит один сервер.
+
+Каждая сессия создаётся через /api/start, после чего на каждой доске свой
+"игрок" делает случайные легальные ходы и дропы от лица того, чья очередь.
+Легальность проверяется на локальной копии Game, затем действие уходит на
+сервер. Превращения идут через полный цикл: ход без жертвы -> 409
+promotion_required -> повтор с выбранной фигурой. Часть запросов
+намеренно нелегальна (400), часть сессий стартует из позиции с пешками
+на предпоследней горизонтали, чтобы превращения случались регулярно.
+
+Запуск:
+    python -m tools.loadtest --sessions 50 --duration 60 --output run.json
+    python -m tools.loadtest --url http://127.0.0.1:8000 --processes 4
+
+Результат (JSON): пропускная способность и p50/p95/p99 по каждому эндпоинту.
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import random
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+import httpx
+
+from bughouse.color import Color
+from bughouse.coordinate import Coordinate
+from bughouse.file import File
+from bughouse.figures import Pawn, Knight, Bishop, Rook, Queen
+from bughouse.game import Game, PromotionRequired
+from tools.local_server import LocalServer
+
+
+# Пешки в шаге от превращения на обеих досках, у всех есть фигуры для обмена
+PROMOTION_POSITION = {
+    "boardA": "r3k2r/PPP5/8/8/8/8/ppp5/R3K2R w - - 0 1",
+    "boardB": "r3k2r/PPP5/8/8/8/8/ppp5/R3K2R w - - 0 1",
+    "reserves": {pid: {"P": 2, "N": 2, "B": 2, "R": 1, "Q": 1} for pid in ["1", "2", "3", "4"]},
+}
+
+RESERVE_SYMBOLS = {"P": Pawn, "N": Knight, "B": Bishop, "R": Rook, "Q": Queen}
+BOARD_PLAYERS = {"A": {Color.WHITE: 1, Color.BLACK: 4}, "B": {Color.WHITE: 2, Color.BLACK: 3}}
+
+
+def percentile(values: List[float], q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(q / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def random_action(game: Game, player_id: int, rng: random.Random, drop_rate: float) -> Optional[Dict[str, Any]]:
+    """Выбирает случайное легальное действие и сразу применяет его к game.
+
+    Возвращает описание действия; для превращения — с полем promotion
+    (список вариантов), сам ход в этом случае к game ещё не применён.
+    """
+    player = game.get_player(player_id)
+    board = player.board
+    moves: List[Tuple[Coordinate, Coordinate]] = []
+    for file in range(8):
+        for rank in range(8):
+            piece = board.squares[file][rank]
+            if piece is not None and piece.color == player.color:
+                targets = sorted(piece.get_possible_moves(board), key=str)
+                moves.extend((piece.coordinate, to) for to in targets)
+    drops: List[Tuple[str, Coordinate]] = []
+    empty = [Coordinate(File(f), r + 1) for f in range(8) for r in range(8) if board.squares[f][r] is None]
+    for symbol, piece_class in RESERVE_SYMBOLS.items():
+        if player.pieces_reserve.get_count(piece_class) > 0:
+            drops.extend((symbol, c) for c in empty if not (symbol == "P" and c.rank in (1, 8)))
+    rng.shuffle(moves)
+    rng.shuffle(drops)
+
+    while moves or drops:
+        use_drop = drops and (not moves or rng.random() < drop_rate)
+        if use_drop:
+            symbol, square = drops.pop()
+            try:
+                game.make_drop(player_id, symbol, str(square))
+            except ValueError:
+                continue
+            return {"type": "drop", "piece": symbol, "square": str(square)}
+        src, dst = moves.pop()
+        try:
+            game.make_move(player_id, str(src), str(dst))
+        except PromotionRequired as pr:
+            return {"type": "move", "from": str(src), "to": str(dst),
+                    "promotion": {"victimPlayerId": pr.victim_player_id, "options": pr.options}}
+        except ValueError:
+            continue
+        return {"type": "move", "from": str(src), "to": str(dst)}
+    return None
+
+
+class Stats:
+    def __init__(self):
+        self.latencies: Dict[str, List[float]] = {}
+        self.statuses: Dict[str, Dict[str, int]] = {}
+        self.games_finished = 0
+        self.desyncs = 0
+
+    def record(self, endpoint: str, status: int, seconds: float):
+        self.latencies.setdefault(endpoint, []).append(seconds * 1000)
+        by_status = self.statuses.setdefault(endpoint, {})
+        by_status[str(status)] = by_status.get(str(status), 0) + 1
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "latencies": self.latencies,
+            "statuses": self.statuses,
+            "gamesFinished": self.games_finished,
+            "desyncs": self.desyncs,
+        }
+
+
+class SessionDriver:
+    def __init__(self, client: httpx.AsyncClient, stats: Stats, rng: random.Random, args: argparse.Namespace):
+        self.client = client
+        self.stats = stats
+        self.rng = rng
+        self.args = args
+        self.game = Game()
+        self.tokens: Dict[int, str] = {}
+        self.finished = False
+
+    async def request(self, endpoint: str, method: str, **kwargs) -> httpx.Response:
+        started = time.perf_counter()
+        response = await self.client.request(method, endpoint, **kwargs)
+        self.stats.record(endpoint, response.status_code, time.perf_counter() - started)
+        return response
+
+    async def start(self):
+        response = await self.request("/api/start", "POST")
+        self.tokens = {p["playerId"]: p["token"] for p in response.json()["players"]}
+        if self.rng.random() < self.args.promotion_sessions:
+            fen = json.dumps(PROMOTION_POSITION)
+            await self.request("/api/load-fen", "POST", json={"token": self.tokens[1], "fen": fen})
+            self.game.from_fen_dict(PROMOTION_POSITION)
+
+    async def resync(self):
+        self.stats.desyncs += 1
+        response = await self.request("/api/fen", "GET", params={"token": self.tokens[1]})
+        self.game.from_fen_dict(json.loads(response.json()["fen"]))
+
+    async def play_board(self, board_name: str, deadline: float):
+        while not self.finished and time.monotonic() < deadline:
+            board = self.game.board_a if board_name == "A" else self.game.board_b
+            player_id = BOARD_PLAYERS[board_name][board.get_current_player()]
+            token = self.tokens[player_id]
+
+            if self.rng.random() < self.args.state_rate:
+                await self.request("/api/state", "GET", params={"token": token})
+
+            if self.rng.random() < self.args.illegal_rate:
+                # Типичная ошибка клиента: ход чужой/несуществующей фигурой
+                await self.request("/api/move", "POST", json={"token": token, "from": "e4", "to": "e8"})
+
+            action = random_action(self.game, player_id, self.rng, self.args.drop_rate)
+            if action is None:
+                self.finished = True
+                break
+
+            if action["type"] == "drop":
+                response = await self.request("/api/drop", "POST", json={
+                    "token": token, "piece": action["piece"], "square": action["square"]})
+            else:
+                body = {"token": token, "from": action["from"], "to": action["to"]}
+                response = await self.request("/api/move", "POST", json=body)
+                promotion = action.get("promotion")
+                if promotion is not None:
+                    if response.status_code != 409:
+                        await self.resync()
+                        continue
+                    # Вариантов с сервера достаточно: выбираем и повторяем ход
+                    options = response.json()["promotion"]["options"]
+                    victim = self.rng.choice(options)
+                    body.update(victimPlayerId=promotion["victimPlayerId"], victimSquare=victim["square"])
+                    try:
+                        self.game.make_move(player_id, action["from"], action["to"],
+                                            victim_player_id=promotion["victimPlayerId"],
+                                            victim_square=victim["square"])
+                    except ValueError:
+                        await self.resync()
+                        continue
+                    response = await self.request("/api/move", "POST", json=body)
+
+            if response.status_code != 200:
+                await self.resync()
+                continue
+            # Ответ — только подтверждение; конец партии видно по локальной копии
+            if self.game.check_game_over():
+                self.finished = True
+            if self.args.think_time:
+                await asyncio.sleep(self.rng.uniform(0, self.args.think_time))
+
+    async def run(self, deadline: float):
+        await self.start()
+        await asyncio.gather(self.play_board("A", deadline), self.play_board("B", deadline))
+        if self.finished:
+            self.stats.games_finished += 1
+
+
+async def run_generator(base_url: str, sessions: int, duration: float, seed: int, args: argparse.Namespace) -> Dict[str, Any]:
+    stats = Stats()
+    rng = random.Random(seed)
+    deadline = time.monotonic() + duration
+    limits = httpx.Limits(max_connections=sessions * 2, max_keepalive_connections=sessions * 2)
+    async with httpx.AsyncClient(base_url=base_url, timeout=60, limits=limits) as client:
+        async def slot(index: int):
+            # Закончившаяся партия сразу заменяется новой — нагрузка постоянна
+            while time.monotonic() < deadline:
+                driver = SessionDriver(client, stats, random.Random(rng.random()), args)
+                await driver.run(deadline)
+
+        await asyncio.gather(*(slot(i) for i in range(sessions)))
+    return stats.to_dict()
+
+
+def _generator_process(base_url: str, sessions: int, duration: float, seed: int, args: argparse.Namespace):
+    return asyncio.run(run_generator(base_url, sessions, duration, seed, args))
+
+
+def summarize(parts: List[Dict[str, Any]], duration: float, args: argparse.Namespace) -> Dict[str, Any]:
+    latencies: Dict[str, List[float]] = {}
+    statuses: Dict[str, Dict[str, int]] = {}
+    for part in parts:
+        for endpoint, values in part["latencies"].items():
+            latencies.setdefault(endpoint, []).extend(values)
+        for endpoint, by_status in part["statuses"].items():
+            merged = statuses.setdefault(endpoint, {})
+            for status, count in by_status.items():
+                merged[status] = merged.get(status, 0) + count
+
+    endpoints = {}
+    for endpoint, values in sorted(latencies.items()):
+        endpoints[endpoint] = {
+            "requests": len(values),
+            "rps": len(values) / duration,
+            "statuses": statuses.get(endpoint, {}),
+            "latencyMs": {
+                "p50": percentile(values, 50),
+                "p95": percentile(values, 95),
+                "p99": percentile(values, 99),
+                "max": max(values),
+            },
+        }
+    total = sum(len(v) for v in latencies.values())
+    return {
+        "config": {
+            "sessions": args.sessions,
+            "processes": args.processes,
+            "duration": duration,
+            "dropRate": args.drop_rate,
+            "illegalRate": args.illegal_rate,
+            "promotionSessions": args.promotion_sessions,
+            "seed": args.seed,
+        },
+        "totalRequests": total,
+        "totalRps": total / duration,
+        "gamesFinished": sum(p["gamesFinished"] for p in parts),
+        "desyncs": sum(p["desyncs"] for p in parts),
+        "endpoints": endpoints,
+    }
+
+
+def run(base_url: str, args: argparse.Namespace) -> Dict[str, Any]:
+    started = time.perf_counter()
+    if args.processes <= 1:
+        parts = [_generator_process(base_url, args.sessions, args.duration, args.seed, args)]
+    else:
+        per_process = max(1, args.sessions // args.processes)
+        with multiprocessing.get_context("spawn").Pool(args.processes) as pool:
+            parts = pool.starmap(_generator_process, [
+                (base_url, per_process, args.duration, args.seed + i, args) for i in range(args.processes)
+            ])
+    return summarize(parts, time.perf_counter() - started, args)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", help="адрес запущенного сервера (иначе поднимается локальный)")
+    parser.add_argument("--sessions", type=int, default=20, help="одновременных партий")
+    parser.add_argument("--duration", type=float, default=30.0, help="длительность, с")
+    parser.add_argument("--processes", type=int, default=1, help="процессов-генераторов нагрузки")
+    parser.add_argument("--drop-rate", type=float, default=0.3, help="доля дропов среди действий")
+    parser.add_argument("--illegal-rate", type=float, default=0.05, help="доля заведомо нелегальных запросов")
+    parser.add_argument("--state-rate", type=float, default=0.1, help="доля запросов /api/state перед ходом")
+    parser.add_argument("--promotion-sessions", type=float, default=0.25, help="доля партий из позиции с превращениями")
+    parser.add_argument("--think-time", type=float, default=0.0, help="максимальная пауза между ходами, с")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="файл для JSON-результата (по умолчанию stdout)")
+    args = parser.parse_args()
+
+    if args.url:
+        result = run(args.url, args)
+    else:
+        with LocalServer() as server:
+            result = run(server.base_url, args)
+
+    text = json.dumps(result, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text)
+    print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""Запуск сервера игры в отдельном процессе для нагрузочных инструментов."""
+import os
+import resource
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+from typing import Dict, List, Optional
+
+
+def raise_fd_limit(target: int = 65536) -> int:
+    """Поднимает лимит открытых файлов (нужно для тысяч сокетов); возвращает итоговый лимит"""
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    wanted = min(target, hard) if hard != resource.RLIM_INFINITY else target
+    if soft < wanted:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (wanted, hard))
+        soft = wanted
+    return soft
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+class LocalServer:
+    """uvicorn с bughouse.web_server:app на свободном порту 127.0.0.1"""
+
+    def __init__(self, port: Optional[int] = None, env: Optional[Dict[str, str]] = None,
+                 uvicorn_args: Optional[List[str]] = None):
+        self.port = port or _free_port()
+        self.uvicorn_args = list(uvicorn_args or [])
+        self.env = dict(os.environ)
+        self.env.setdefault("SESSION_STORAGE_DIR", tempfile.mkdtemp(prefix="bughouse-sessions-"))
+        self.env.update(env or {})
+        self.process: Optional[subprocess.Popen] = None
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self.port}"
+
+    @property
+    def ws_url(self) -> str:
+        return f"ws://127.0.0.1:{self.port}"
+
+    @property
+    def pid(self) -> int:
+        return self.process.pid
+
+    def start(self, timeout: float = 20.0):
+        raise_fd_limit()
+        root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        self.process = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "bughouse.web_server:app",
+             "--host", "127.0.0.1", "--port", str(self.port), "--log-level", "warning", *self.uvicorn_args],
+            cwd=root,
+            env=self.env,
+            stdout=subprocess.DEVNULL,
+        )
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            try:
+                urllib.request.urlopen(f"{self.base_url}/api/stats", timeout=1).read()
+                return self
+            except OSError:
+                if self.process.poll() is not None:
+                    raise RuntimeError("Сервер завершился при запуске")
+                time.sleep(0.1)
+        self.stop()
+        raise RuntimeError("Сервер не запустился")
+
+    def stop(self):
+        if self.process is not None and self.process.poll() is None:
+            self.process.terminate()
+            try:
+                self.process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
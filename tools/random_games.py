@@ -0,0 +1,227 @@
+"""Генерация случайных легальных партий (bughouse.random_games): архив BPGN или прогон через сервер.
+
+Партия index прогона --seed всегда одна и та же, поэтому результат не
+зависит от числа процессов: партии режутся на пачки по --chunk, пачки
+играются в пуле и пишутся в файл по порядку.
+
+Запуск:
+    python -m tools.random_games bpgn --games 100000 --plies 80 --output random.bpgn.gz --workers 8
+    python -m tools.random_games server --games 200 --sessions 20 --ws
+    python -m tools.random_games server --url http://127.0.0.1:8000 --games 50
+
+bpgn — пишет партии в --output (.gz сжимается), отчёт — партий и ходов
+в секунду всего и на процесс.
+
+server — каждая партия проигрывается на сервере: /api/start, затем её
+ходы по порядку через /api/move и /api/drop от имени ходившего (с
+превращением — сразу с victimPlayerId/victimSquare), --sessions партий
+одновременно. С --ws на каждую сессию открывается WebSocket игрока 1 и
+считаются полученные рассылки. В конце позиция сервера (/api/fen)
+сверяется с итоговой позицией партии. Без --url поднимается локальный
+сервер. Код выхода 1, если сервер отклонил ход или позиции разошлись.
+"""
+import argparse
+import asyncio
+import gzip
+import json
+import multiprocessing
+import os
+import sys
+import time
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import httpx
+import websockets
+
+from bughouse.bpgn import write_bpgn
+from bughouse.random_games import DROP_SHARE, random_games
+from tools.local_server import LocalServer
+
+
+# Жертва превращения — партнёр соперника ходившего
+VICTIM = {1: 2, 2: 1, 3: 4, 4: 3}
+
+
+def play_chunk(seed: int, start: int, count: int, plies: int, drop_share: float) -> Tuple[str, int, float]:
+    """Задача пула: BPGN пачки партий, число ходов и время работы процесса"""
+    started = time.perf_counter()
+    texts, moves = [], 0
+    for game in random_games(seed, count, plies, start, drop_share=drop_share):
+        texts.append(write_bpgn(game, {"Event": f"Random {seed}/{start + len(texts)}"}))
+        moves += len(game.history)
+    return "".join(texts), moves, time.perf_counter() - started
+
+
+def play_chunk_games(seed: int, start: int, count: int, plies: int,
+                     drop_share: float) -> List[Tuple[List[Dict[str, Any]], Dict[str, Any]]]:
+    """Задача пула для режима server: записи ходов и итоговые позиции"""
+    return [(game.history, game.to_fen_dict())
+            for game in random_games(seed, count, plies, start, drop_share=drop_share)]
+
+
+def _chunks(games: int, chunk: int) -> Iterator[Tuple[int, int]]:
+    for start in range(0, games, chunk):
+        yield start, min(chunk, games - start)
+
+
+def _imap(function, args: argparse.Namespace) -> Iterator[Any]:
+    """Пачки по порядку: в пуле из --workers процессов или в этом процессе"""
+    tasks = [(args.seed, start, count, args.plies, args.drop_share) for start, count in _chunks(args.games, args.chunk)]
+    if args.workers <= 1:
+        for task in tasks:
+            yield function(*task)
+        return
+    with multiprocessing.get_context("spawn").Pool(args.workers) as pool:
+        yield from pool.imap(_star, [(function, task) for task in tasks])
+
+
+def _star(item):
+    function, task = item
+    return function(*task)
+
+
+def run_bpgn(args: argparse.Namespace) -> Dict[str, Any]:
+    started = time.perf_counter()
+    games = moves = 0
+    busy = 0.0
+    opener = gzip.open if args.output.endswith(".gz") else open
+    with opener(args.output, "wt", encoding="utf-8") as f:
+        for (text, chunk_moves, seconds), (_, count) in zip(_imap(play_chunk, args), _chunks(args.games, args.chunk)):
+            f.write(text)
+            games += count
+            moves += chunk_moves
+            busy += seconds
+    elapsed = time.perf_counter() - started
+    return {
+        "games": games,
+        "moves": moves,
+        "output": args.output,
+        "workers": args.workers,
+        "seconds": round(elapsed, 2),
+        "gamesPerSecond": round(games / elapsed, 1),
+        "movesPerSecond": round(moves / elapsed, 1),
+        # Время самих партий в процессах, без записи и пересылки
+        "gamesPerMinutePerCore": round(games / busy * 60, 1) if busy else 0.0,
+    }
+
+
+class ServerStats:
+    def __init__(self):
+        self.games = 0
+        self.moves = 0
+        self.rejected = 0
+        self.mismatches = 0
+        self.ws_messages = 0
+        self.errors: List[str] = []
+
+    def fail(self, text: str):
+        if len(self.errors) < 20:
+            self.errors.append(text)
+
+
+async def _watch(url: str, stats: ServerStats, stop: asyncio.Event):
+    async with websockets.connect(url, ping_interval=None, open_timeout=30) as ws:
+        while not stop.is_set():
+            try:
+                await asyncio.wait_for(ws.recv(), timeout=0.5)
+            except asyncio.TimeoutError:
+                continue
+            stats.ws_messages += 1
+
+
+async def _play_on_server(client: httpx.AsyncClient, ws_url: Optional[str], index: int,
+                          history: List[Dict[str, Any]], final: Dict[str, Any], stats: ServerStats):
+    start = (await client.post("/api/start")).json()
+    tokens = {p["playerId"]: p["token"] for p in start["players"]}
+    stop = asyncio.Event()
+    watcher = asyncio.create_task(_watch(f"{ws_url}/ws/{tokens[1]}", stats, stop)) if ws_url else None
+    try:
+        for number, entry in enumerate(history, 1):
+            token = tokens[entry["player"]]
+            if entry["type"] == "drop":
+                response = await client.post("/api/drop", json={
+                    "token": token, "piece": entry["piece"], "square": entry["square"]})
+            else:
+                body = {"token": token, "from": entry["from"], "to": entry["to"]}
+                if entry.get("victimSquare"):
+                    body.update(victimPlayerId=VICTIM[entry["player"]], victimSquare=entry["victimSquare"])
+                response = await client.post("/api/move", json=body)
+            if response.status_code != 200:
+                stats.rejected += 1
+                stats.fail(f"партия {index}, ход {number}: {response.status_code} {response.text[:200]}")
+                return
+            stats.moves += 1
+        position = json.loads((await client.get("/api/fen", params={"token": tokens[1]})).json()["fen"])
+        if any(position[key] != final[key] for key in ("boardA", "boardB", "reserves")):
+            stats.mismatches += 1
+            stats.fail(f"партия {index}: позиция сервера разошлась с итоговой")
+        stats.games += 1
+    finally:
+        if watcher is not None:
+            # Последние рассылки приходят после ответа на ход
+            await asyncio.sleep(0.2)
+            stop.set()
+            await asyncio.gather(watcher, return_exceptions=True)
+
+
+async def _drive(base_url: str, ws_url: Optional[str], games: Iterator[Tuple[int, Any]],
+                 sessions: int, stats: ServerStats):
+    limits = httpx.Limits(max_connections=sessions * 2, max_keepalive_connections=sessions * 2)
+    async with httpx.AsyncClient(base_url=base_url, timeout=60, limits=limits) as client:
+        async def slot():
+            for index, (history, final) in games:
+                await _play_on_server(client, ws_url, index, history, final, stats)
+
+        # Общий итератор: каждая свободная сессия берёт следующую партию
+        await asyncio.gather(*(slot() for _ in range(sessions)))
+
+
+def run_server(args: argparse.Namespace, base_url: str, ws_url: str) -> Dict[str, Any]:
+    generated = [game for chunk in _imap(play_chunk_games, args) for game in chunk]
+    stats = ServerStats()
+    started = time.perf_counter()
+    asyncio.run(_drive(base_url, ws_url if args.ws else None, iter(enumerate(generated)), args.sessions, stats))
+    elapsed = time.perf_counter() - started
+    return {
+        "games": stats.games,
+        "moves": stats.moves,
+        "rejected": stats.rejected,
+        "mismatches": stats.mismatches,
+        "wsMessages": stats.ws_messages if args.ws else None,
+        "sessions": args.sessions,
+        "seconds": round(elapsed, 2),
+        "movesPerSecond": round(stats.moves / elapsed, 1) if elapsed else 0.0,
+        "errors": stats.errors,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("mode", choices=("bpgn", "server"))
+    parser.add_argument("--games", type=int, default=1000)
+    parser.add_argument("--plies", type=int, default=80, help="не больше полуходов в партии (обе доски)")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--drop-share", type=float, default=DROP_SHARE, help="доля действий, где сначала пробуется дроп")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="процессов генерации (1 — без пула)")
+    parser.add_argument("--chunk", type=int, default=100, help="партий в пачке на процесс")
+    parser.add_argument("--output", default="random.bpgn.gz", help="файл BPGN (режим bpgn)")
+    parser.add_argument("--url", help="адрес запущенного сервера (режим server; иначе поднимается локальный)")
+    parser.add_argument("--sessions", type=int, default=10, help="партий на сервере одновременно")
+    parser.add_argument("--ws", action="store_true", help="слушать рассылки по WebSocket игрока 1")
+    args = parser.parse_args()
+
+    if args.mode == "bpgn":
+        report = run_bpgn(args)
+    elif args.url:
+        ws_url = "ws" + args.url[len("http"):] if args.url.startswith("http") else args.url
+        report = run_server(args, args.url.rstrip("/"), ws_url.rstrip("/"))
+    else:
+        with LocalServer() as server:
+            report = run_server(args, server.base_url, server.ws_url)
+    print(json.dumps(report, indent=2, ensure_ascii=False))
+    if report.get("rejected") or report.get("mismatches"):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
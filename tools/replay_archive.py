@@ -0,0 +1,250 @@
+"""Массовая проверка архивов партий BPGN: проигрывание через Game в пуле процессов.
+
+Файлы читаются потоково (bughouse.bpgn.iter_file, .gz тоже), партии
+режутся на пачки по --chunk и раздаются процессам пула. В работе не
+больше двух пачек на процесс, поэтому память не зависит от размера
+архива, а скорость растёт с числом процессов.
+
+Каждая партия проигрывается через Game.make_move/make_drop. Проверяется:
+- все ходы приняты (illegal — первый непринятый ход попадает в failures);
+- итоговая позиция совпадает с [FinalFEN]/[FinalReserves], если они есть;
+- результат [Result] не противоречит проигрыванию: мат на доске должен
+  дать тот же победителя, а партия с * не должна кончаться матом
+  (победа по времени или сдача из записи не восстанавливается и
+  считается в reasons как "без мата").
+
+Запуск:
+    python -m tools.replay_archive archive/*.bpgn.gz --workers 8 --output report.json
+
+Отчёт (JSON): число партий и ошибок, длины партий, доля дропов и
+превращений, причины окончания, время make_move/make_drop на ход.
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+import time
+from bisect import bisect_left
+from collections import Counter
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from typing import Any, Dict, Iterable, Iterator, List, Tuple
+
+from bughouse.bpgn import BpgnError, BpgnGame, iter_file, replay, result_token
+from bughouse.metrics import DEFAULT_BUCKETS
+
+
+# Границы корзин длины партии, полуходов (обе доски вместе)
+LENGTH_BUCKETS = (10, 20, 40, 80, 160, 320, 640)
+NO_MATE = "без мата"
+
+
+class ReplayStats:
+    """Счётчики по партиям; складываются через merge, поэтому считаются в процессах по частям"""
+
+    def __init__(self, max_failures: int = 100):
+        self.max_failures = max_failures
+        self.games = 0
+        self.valid = 0
+        self.illegal = 0
+        self.position_mismatches = 0
+        self.result_mismatches = 0
+        self.moves = 0
+        self.drops = 0
+        self.promotions = 0
+        self.length_counts = [0] * (len(LENGTH_BUCKETS) + 1)
+        self.length_max = 0
+        self.move_time_counts = [0] * (len(DEFAULT_BUCKETS) + 1)
+        self.move_time_sum = 0.0
+        self.move_time_max = 0.0
+        self.results: Counter = Counter()
+        self.reasons: Counter = Counter()
+        self.failures: List[Dict[str, Any]] = []
+
+    def observe_move(self, entry: Dict[str, Any], seconds: float):
+        self.moves += 1
+        if entry["type"] == "drop":
+            self.drops += 1
+        elif entry.get("victimSquare"):
+            self.promotions += 1
+        self.move_time_counts[bisect_left(DEFAULT_BUCKETS, seconds)] += 1
+        self.move_time_sum += seconds
+        self.move_time_max = max(self.move_time_max, seconds)
+
+    def fail(self, source: str, index: int, kind: str, detail: str):
+        if len(self.failures) < self.max_failures:
+            self.failures.append({"file": source, "game": index, "kind": kind, "detail": detail})
+
+    def merge(self, other: 'ReplayStats'):
+        for name in ("games", "valid", "illegal", "position_mismatches", "result_mismatches",
+                     "moves", "drops", "promotions", "move_time_sum"):
+            setattr(self, name, getattr(self, name) + getattr(other, name))
+        self.length_counts = [a + b for a, b in zip(self.length_counts, other.length_counts)]
+        self.move_time_counts = [a + b for a, b in zip(self.move_time_counts, other.move_time_counts)]
+        self.length_max = max(self.length_max, other.length_max)
+        self.move_time_max = max(self.move_time_max, other.move_time_max)
+        self.results.update(other.results)
+        self.reasons.update(other.reasons)
+        self.failures.extend(other.failures[:self.max_failures - len(self.failures)])
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "games": self.games,
+            "valid": self.valid,
+            "illegal": self.illegal,
+            "positionMismatches": self.position_mismatches,
+            "resultMismatches": self.result_mismatches,
+            "moves": self.moves,
+            "length": {
+                "mean": self.moves / self.games if self.games else 0.0,
+                "max": self.length_max,
+                "buckets": _buckets(LENGTH_BUCKETS, self.length_counts),
+            },
+            "dropShare": self.drops / self.moves if self.moves else 0.0,
+            "promotionShare": self.promotions / self.moves if self.moves else 0.0,
+            "results": dict(self.results),
+            "reasons": dict(self.reasons),
+            "moveTime": {
+                "meanMs": self.move_time_sum / self.moves * 1000 if self.moves else 0.0,
+                "p50Ms": _quantile(DEFAULT_BUCKETS, self.move_time_counts, 0.5) * 1000,
+                "p95Ms": _quantile(DEFAULT_BUCKETS, self.move_time_counts, 0.95) * 1000,
+                "maxMs": self.move_time_max * 1000,
+                "buckets": _buckets(DEFAULT_BUCKETS, self.move_time_counts),
+            },
+            "failures": self.failures,
+        }
+
+
+def _buckets(bounds: Tuple[float, ...], counts: List[int]) -> Dict[str, int]:
+    labels = [f"<={bound:g}" for bound in bounds] + [f">{bounds[-1]:g}"]
+    return dict(zip(labels, counts))
+
+
+def _quantile(bounds: Tuple[float, ...], counts: List[int], q: float) -> float:
+    """Верхняя граница корзины, в которую попадает квантиль q"""
+    total = sum(counts)
+    if not total:
+        return 0.0
+    seen = 0
+    for bound, count in zip(bounds + (float("inf"),), counts):
+        seen += count
+        if seen >= q * total:
+            return bound if bound != float("inf") else bounds[-1]
+    return bounds[-1]
+
+
+def check_game(stats: ReplayStats, source: str, index: int, record: BpgnGame):
+    stats.games += 1
+    length = len(record.moves)
+    stats.length_counts[bisect_left(LENGTH_BUCKETS, length)] += 1
+    stats.length_max = max(stats.length_max, length)
+    stats.results[record.result] += 1
+    try:
+        game = replay(record, stats.observe_move)
+    except BpgnError as e:
+        stats.illegal += 1
+        stats.fail(source, index, "illegal", str(e))
+        return
+
+    ok = True
+    expected = record.final_position()
+    if expected is not None:
+        actual = game.to_fen_dict()
+        if any(actual[key] != expected[key] for key in expected):
+            ok = False
+            stats.position_mismatches += 1
+            stats.fail(source, index, "position", f"{actual['boardA']} | {actual['boardB']}")
+    game_over = game.check_game_over()
+    stats.reasons[game_over["reason"] if game_over else NO_MATE] += 1
+    replayed = result_token(game_over)
+    if game_over is not None and record.result != replayed:
+        ok = False
+        stats.result_mismatches += 1
+        stats.fail(source, index, "result", f"записано {record.result}, проигрывание дало {replayed}")
+    if ok:
+        stats.valid += 1
+
+
+def replay_chunk(chunk: List[Tuple[str, int, BpgnGame]], max_failures: int) -> ReplayStats:
+    """Задача пула: проверка пачки партий"""
+    stats = ReplayStats(max_failures)
+    for source, index, record in chunk:
+        check_game(stats, source, index, record)
+    return stats
+
+
+def chunks(paths: Iterable[str], size: int) -> Iterator[List[Tuple[str, int, BpgnGame]]]:
+    buffer: List[Tuple[str, int, BpgnGame]] = []
+    for path in paths:
+        for index, record in enumerate(iter_file(path)):
+            buffer.append((path, index, record))
+            if len(buffer) >= size:
+                yield buffer
+                buffer = []
+    if buffer:
+        yield buffer
+
+
+def run(paths: List[str], workers: int, chunk_size: int, max_failures: int,
+        progress_every: int = 0) -> Dict[str, Any]:
+    total = ReplayStats(max_failures)
+    started = time.perf_counter()
+    reported = 0
+
+    def collect(stats: ReplayStats):
+        nonlocal reported
+        total.merge(stats)
+        if progress_every and total.games - reported >= progress_every:
+            reported = total.games
+            rate = total.games / (time.perf_counter() - started)
+            print(f"{total.games} партий, {rate:.1f}/с", file=sys.stderr)
+
+    if workers <= 1:
+        for chunk in chunks(paths, chunk_size):
+            collect(replay_chunk(chunk, max_failures))
+    else:
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+            running = set()
+            for chunk in chunks(paths, chunk_size):
+                # Не больше двух пачек на процесс: чтение архива не убегает вперёд проверки
+                if len(running) >= workers * 2:
+                    done, running = wait(running, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        collect(future.result())
+                running.add(pool.submit(replay_chunk, chunk, max_failures))
+            for future in wait(running).done:
+                collect(future.result())
+
+    elapsed = time.perf_counter() - started
+    report = total.to_dict()
+    report.update({
+        "files": len(paths),
+        "workers": workers,
+        "seconds": elapsed,
+        "gamesPerSecond": total.games / elapsed if elapsed else 0.0,
+    })
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("files", nargs="+", help="файлы BPGN (.bpgn или .bpgn.gz)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="процессов (1 — без пула)")
+    parser.add_argument("--chunk", type=int, default=64, help="партий в пачке на процесс")
+    parser.add_argument("--max-failures", type=int, default=100, help="сколько ошибок перечислить в отчёте")
+    parser.add_argument("--progress-every", type=int, default=10000, help="печатать прогресс в stderr каждые N партий")
+    parser.add_argument("--output", help="файл для JSON-отчёта (по умолчанию stdout)")
+    args = parser.parse_args()
+
+    report = run(args.files, args.workers, args.chunk, args.max_failures, args.progress_every)
+    text = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text)
+    print(text)
+    if report["illegal"] or report["positionMismatches"] or report["resultMismatches"]:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
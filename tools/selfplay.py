@@ -0,0 +1,138 @@
+"""Генерация позиций самоигры для обучения (bughouse.selfplay) в пуле процессов.
+
+Каждая партия — отдельная задача пула с детерминированным зерном
+(--seed + номер партии), так что прогон воспроизводим. Готовые партии
+пишутся в шарды .npy с manifest.json в --output. В работе не больше
+двух партий на процесс, шард в памяти — один, поэтому генерация может
+идти часами с постоянной памятью: до --games партий или --hours часов
+(что наступит раньше; 0 — без ограничения), Ctrl+C дописывает уже
+сыгранное и закрывает шард.
+
+Запуск:
+    python -m tools.selfplay --output selfplay --workers 8 --hours 6
+    python -m tools.selfplay --output selfplay --mode engine --move-time 0.2 --games 1000
+
+Прогресс (каждые --progress-every секунд) и итоговый отчёт — позиций в
+секунду всего и по каждому процессу: позиции партий процесса, делённые
+на время, которое он их играл.
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+import time
+from collections import defaultdict
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from typing import Any, Dict
+
+from bughouse.selfplay import MODES, ShardWriter, play_game
+
+
+class WorkerStats:
+    def __init__(self):
+        self.games = 0
+        self.positions = 0
+        self.seconds = 0.0
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "games": self.games,
+            "positions": self.positions,
+            "positionsPerSecond": round(self.positions / self.seconds, 1) if self.seconds else 0.0,
+        }
+
+
+def run(output: str, workers: int, mode: str, games: int, hours: float, plies: int, move_time: float,
+        shard_positions: int, seed: int, progress_every: float) -> Dict[str, Any]:
+    writer = ShardWriter(output, shard_positions)
+    per_worker: Dict[int, WorkerStats] = defaultdict(WorkerStats)
+    started = time.perf_counter()
+    deadline = started + hours * 3600 if hours else float("inf")
+    reported = started
+    played = 0
+    interrupted = False
+
+    def collect(result: Dict[str, Any]):
+        nonlocal played, reported
+        writer.write(result["planes"], result["reserves"], result["meta"])
+        stats = per_worker[result["pid"]]
+        stats.games += 1
+        stats.positions += len(result["meta"])
+        stats.seconds += result["seconds"]
+        played += 1
+        now = time.perf_counter()
+        if progress_every and now - reported >= progress_every:
+            reported = now
+            rates = ", ".join(f"{stats.to_dict()['positionsPerSecond']}" for stats in per_worker.values())
+            print(f"{played} партий, {writer.positions} позиций, {writer.positions / (now - started):.1f}/с "
+                  f"(по процессам: {rates})", file=sys.stderr)
+
+    def more() -> bool:
+        return (not games or submitted < games) and time.perf_counter() < deadline
+
+    submitted = 0
+    try:
+        if workers <= 1:
+            while more():
+                collect(play_game(submitted, seed + submitted, mode, plies, move_time))
+                submitted += 1
+        else:
+            with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+                running = set()
+                try:
+                    while more():
+                        if len(running) >= workers * 2:
+                            done, running = wait(running, return_when=FIRST_COMPLETED)
+                            for future in done:
+                                collect(future.result())
+                            continue
+                        running.add(pool.submit(play_game, submitted, seed + submitted, mode, plies, move_time))
+                        submitted += 1
+                    for future in wait(running).done:
+                        collect(future.result())
+                except KeyboardInterrupt:
+                    for future in running:
+                        future.cancel()
+                    raise
+    except KeyboardInterrupt:
+        interrupted = True
+    finally:
+        writer.close()
+
+    elapsed = time.perf_counter() - started
+    return {
+        "output": output,
+        "mode": mode,
+        "games": played,
+        "positions": writer.positions,
+        "shards": len(writer.manifest["shards"]),
+        "seconds": round(elapsed, 2),
+        "positionsPerSecond": round(writer.positions / elapsed, 1) if elapsed else 0.0,
+        "workers": {str(pid): stats.to_dict() for pid, stats in per_worker.items()},
+        "interrupted": interrupted,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--output", default="selfplay", help="каталог шардов и manifest.json")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="процессов (1 — без пула)")
+    parser.add_argument("--mode", choices=MODES, default="random", help="случайные ходы или движок")
+    parser.add_argument("--games", type=int, default=0, help="сколько партий сыграть (0 — без ограничения)")
+    parser.add_argument("--hours", type=float, default=0, help="ограничение по времени (0 — без ограничения)")
+    parser.add_argument("--plies", type=int, default=200, help="не больше полуходов в партии")
+    parser.add_argument("--move-time", type=float, default=0.1, help="время движка на ход, секунды (--mode engine)")
+    parser.add_argument("--shard", type=int, default=100_000, help="позиций в шарде")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--progress-every", type=float, default=30, help="печатать прогресс в stderr, секунды")
+    args = parser.parse_args()
+    if not args.games and not args.hours:
+        parser.error("нужно --games или --hours")
+    report = run(args.output, args.workers, args.mode, args.games, args.hours, args.plies, args.move_time,
+                 args.shard, args.seed, args.progress_every)
+    print(json.dumps(report, indent=2, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
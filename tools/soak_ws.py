@@ -0,0 +1,330 @@
+"""Soak-тест WebSocket: утечки при массовых подключениях и отключениях.
+
+Несколько раундов подряд на сервер обрушивается смесь соединений /ws/{token}:
+    - обычные: подключиться, получить состояние, несколько ping/pong, закрыть;
+    - штормы переподключений: сотни клиентов одновременно обрывают
+      соединение без закрывающего рукопожатия и тут же подключаются снова;
+    - полуоткрытые: после рукопожатия клиент перестаёт читать и не отвечает
+      на ping сервера (сокет висит, пока сервер сам его не закроет);
+    - полузакрытые: клиент закрывает только свою сторону (FIN);
+    - с неверным токеном.
+Параллельно идут ходы, чтобы рассылка писала во все живые и мёртвые сокеты.
+
+Во время прогона снимаются RSS и число открытых дескрипторов процесса
+сервера (/proc/<pid>) и размеры словарей из /api/stats. Первые --warmup
+раундов — прогрев; после последнего раунда и затишья показатели
+сравниваются с замером после прогрева. Код выхода 1, если в словарях
+остались соединения, выросло число дескрипторов или RSS растёт сверх
+допуска без выхода на плато. Плато отличает утечку от фрагментации кучи:
+аллокатор не сразу отдаёт память системе, но его прирост от раунда к
+раунду затухает, а утечка растёт линейно.
+
+Запуск:
+    python -m tools.soak_ws --rounds 5 --connections 2000 --output soak.json
+"""
+import argparse
+import asyncio
+import base64
+import json
+import os
+import random
+import sys
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+import httpx
+import websockets
+
+from bughouse.game import Game
+from tools.local_server import LocalServer, raise_fd_limit
+from tools.spectator_load import OPENING
+
+
+# Сервер закрывает не отвечающие на ping сокеты через interval + timeout
+WS_PING_INTERVAL = 1.0
+WS_PING_TIMEOUT = 1.0
+
+# Словари /api/stats, которые должны опустеть после отключения всех клиентов
+CONNECTION_STATS = ["websocketSessions", "spectatorSessions", "spectators"]
+
+
+def process_usage(pid: int) -> Dict[str, int]:
+    """RSS (КБ) и число открытых дескрипторов/сокетов процесса"""
+    rss_kb = 0
+    with open(f"/proc/{pid}/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                rss_kb = int(line.split()[1])
+                break
+    fds = os.listdir(f"/proc/{pid}/fd")
+    sockets = 0
+    for fd in fds:
+        try:
+            if os.readlink(f"/proc/{pid}/fd/{fd}").startswith("socket:"):
+                sockets += 1
+        except OSError:
+            pass
+    return {"rssKb": rss_kb, "fds": len(fds), "sockets": sockets}
+
+
+class Soak:
+    def __init__(self, server: LocalServer, client: httpx.AsyncClient, args: argparse.Namespace):
+        self.server = server
+        self.client = client
+        self.args = args
+        self.rng = random.Random(args.seed)
+        self.tokens: List[Dict[int, str]] = []
+        self.samples: List[Dict[str, Any]] = []
+        self.round_rss: List[int] = []
+        self.errors: Dict[str, int] = {}
+        self.started = time.monotonic()
+
+    def _error(self, kind: str):
+        self.errors[kind] = self.errors.get(kind, 0) + 1
+
+    async def sample(self, label: str = "") -> Dict[str, Any]:
+        stats = (await self.client.get("/api/stats")).json()
+        sample = {"t": round(time.monotonic() - self.started, 3), "label": label}
+        sample.update(process_usage(self.server.pid))
+        sample.update(stats)
+        self.samples.append(sample)
+        return sample
+
+    async def sampler(self):
+        while True:
+            await asyncio.sleep(self.args.sample_interval)
+            try:
+                await self.sample()
+            except (httpx.HTTPError, OSError):
+                self._error("sample")
+
+    async def create_sessions(self):
+        for _ in range(self.args.sessions):
+            start = (await self.client.post("/api/start")).json()
+            self.tokens.append({p["playerId"]: p["token"] for p in start["players"]})
+
+    def random_url(self) -> str:
+        tokens = self.rng.choice(self.tokens)
+        return f"{self.server.ws_url}/ws/{tokens[self.rng.randint(1, 4)]}"
+
+    async def mover(self, stop: asyncio.Event):
+        """Ходы по всем сессиям по кругу; в конце дебюта позиция сбрасывается"""
+        initial = json.dumps(Game().to_fen_dict())
+        step = 0
+        while not stop.is_set():
+            player_id, src, dst = OPENING[step % len(OPENING)]
+            for tokens in self.tokens:
+                try:
+                    if step % len(OPENING) == 0 and step:
+                        await self.client.post("/api/load-fen", json={"token": tokens[1], "fen": initial})
+                    await self.client.post("/api/move", json={"token": tokens[player_id], "from": src, "to": dst})
+                except httpx.HTTPError:
+                    self._error("move")
+            step += 1
+            await asyncio.sleep(self.args.move_interval)
+
+    async def normal(self):
+        async with websockets.connect(self.random_url(), ping_interval=None, open_timeout=30) as ws:
+            await ws.recv()
+            for _ in range(self.args.pings):
+                await ws.send("ping")
+                # Между pong могут прийти рассылки состояния
+                while await ws.recv() != "pong":
+                    pass
+
+    async def abort(self):
+        ws = await websockets.connect(self.random_url(), ping_interval=None, open_timeout=30)
+        await ws.recv()
+        ws.transport.abort()
+
+    async def _raw_handshake(self, url: str):
+        path = url.split(str(self.server.port), 1)[1]
+        reader, writer = await asyncio.open_connection("127.0.0.1", self.server.port)
+        key = base64.b64encode(os.urandom(16)).decode()
+        writer.write((
+            f"GET {path} HTTP/1.1\r\nHost: 127.0.0.1:{self.server.port}\r\n"
+            f"Upgrade: websocket\r\nConnection: Upgrade\r\n"
+            f"Sec-WebSocket-Key: {key}\r\nSec-WebSocket-Version: 13\r\n\r\n"
+        ).encode("ascii"))
+        await writer.drain()
+        await reader.readuntil(b"\r\n\r\n")
+        return reader, writer
+
+    async def half_open(self, hold: List[asyncio.StreamWriter]):
+        # Ничего не читаем и не отвечаем: сервер должен закрыть сокет по таймауту ping
+        _, writer = await self._raw_handshake(self.random_url())
+        hold.append(writer)
+
+    async def half_closed(self, hold: List[asyncio.StreamWriter]):
+        _, writer = await self._raw_handshake(self.random_url())
+        writer.write_eof()
+        hold.append(writer)
+
+    async def bad_token(self):
+        try:
+            async with websockets.connect(f"{self.server.ws_url}/ws/no-such-token", open_timeout=30) as ws:
+                await ws.recv()
+        except websockets.ConnectionClosed:
+            pass
+
+    async def storm(self):
+        """Шторм переподключений: все обрывают соединение и сразу подключаются снова"""
+        size = self.args.storm_size
+        clients = await asyncio.gather(*(
+            websockets.connect(self.random_url(), ping_interval=None, open_timeout=30) for _ in range(size)
+        ), return_exceptions=True)
+        for ws in clients:
+            if isinstance(ws, Exception):
+                self._error("storm-connect")
+            else:
+                ws.transport.abort()
+        results = await asyncio.gather(*(self.normal() for _ in range(size)), return_exceptions=True)
+        for r in results:
+            if isinstance(r, Exception):
+                self._error("storm-reconnect")
+
+    async def run_round(self, index: int):
+        hold: List[asyncio.StreamWriter] = []
+        kinds = ["normal"] * 6 + ["abort"] * 2 + ["half_open", "half_closed", "bad_token"]
+        semaphore = asyncio.Semaphore(self.args.concurrency)
+
+        async def one():
+            kind = self.rng.choice(kinds)
+            async with semaphore:
+                try:
+                    if kind in ("half_open", "half_closed"):
+                        await getattr(self, kind)(hold)
+                    else:
+                        await getattr(self, kind)()
+                except (OSError, asyncio.TimeoutError, websockets.WebSocketException, asyncio.IncompleteReadError):
+                    self._error(kind)
+
+        await asyncio.gather(*(one() for _ in range(self.args.connections)), self.storm())
+        # Полуоткрытые держим, пока сервер не закроет их сам
+        await asyncio.sleep(WS_PING_INTERVAL + WS_PING_TIMEOUT + 1)
+        for writer in hold:
+            writer.close()
+        sample = await self.sample(f"round-{index}")
+        if index >= self.args.warmup:
+            self.round_rss.append(sample["rssKb"])
+
+    async def settle(self) -> Dict[str, Any]:
+        """Ждёт, пока сервер отпустит все соединения (или истечёт --settle)"""
+        deadline = time.monotonic() + self.args.settle
+        while True:
+            sample = await self.sample("settle")
+            if all(sample[key] == 0 for key in CONNECTION_STATS) or time.monotonic() > deadline:
+                return sample
+            await asyncio.sleep(0.5)
+
+    async def run(self) -> Dict[str, Any]:
+        await self.create_sessions()
+        initial = await self.sample("initial")
+        stop = asyncio.Event()
+        sampler = asyncio.create_task(self.sampler())
+        mover = asyncio.create_task(self.mover(stop))
+        baseline: Optional[Dict[str, Any]] = None
+        try:
+            for index in range(self.args.rounds):
+                await self.run_round(index)
+                if index == self.args.warmup - 1:
+                    baseline = await self.settle()
+                    baseline["label"] = "baseline"
+        finally:
+            stop.set()
+            await mover
+            sampler.cancel()
+        final = await self.settle()
+        final["label"] = "final"
+        return self.verdict(initial, baseline or final, final)
+
+    def rss_halves(self, baseline_kb: int) -> Tuple[int, int]:
+        """Прирост RSS за первую и вторую половину измеряемых раундов"""
+        points = [baseline_kb] + self.round_rss
+        middle = len(points) // 2
+        return points[middle] - points[0], points[-1] - points[middle]
+
+    def verdict(self, initial: Dict, baseline: Dict, final: Dict) -> Dict[str, Any]:
+        failures = []
+        for key in CONNECTION_STATS:
+            if final[key] != 0:
+                failures.append(f"{key}={final[key]} после отключения всех клиентов")
+        if final["residentSessions"] > baseline["residentSessions"]:
+            failures.append("число сессий выросло")
+        fd_growth = final["fds"] - baseline["fds"]
+        if fd_growth > self.args.fd_slack:
+            failures.append(f"дескрипторов стало больше на {fd_growth}")
+        rss_growth = final["rssKb"] - baseline["rssKb"]
+        rss_limit = baseline["rssKb"] * self.args.rss_tolerance + self.args.rss_slack_mb * 1024
+        first_half, second_half = self.rss_halves(baseline["rssKb"])
+        if rss_growth > rss_limit and second_half >= first_half * self.args.plateau_ratio:
+            failures.append(
+                f"RSS вырос на {rss_growth} КБ (допуск {int(rss_limit)} КБ) и не выходит на плато: "
+                f"{first_half} КБ за первую половину раундов, {second_half} КБ за вторую"
+            )
+        return {
+            "config": {
+                "rounds": self.args.rounds,
+                "warmup": self.args.warmup,
+                "connections": self.args.connections,
+                "stormSize": self.args.storm_size,
+                "sessions": self.args.sessions,
+                "seed": self.args.seed,
+            },
+            "passed": not failures,
+            "failures": failures,
+            "clientErrors": self.errors,
+            "initial": initial,
+            "baseline": baseline,
+            "final": final,
+            "growth": {"rssKb": rss_growth, "fds": fd_growth},
+            "roundRssKb": self.round_rss,
+            "samples": self.samples,
+        }
+
+
+async def soak(server: LocalServer, args: argparse.Namespace) -> Dict[str, Any]:
+    async with httpx.AsyncClient(base_url=server.base_url, timeout=60) as client:
+        return await Soak(server, client, args).run()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rounds", type=int, default=6, help="всего раундов, включая прогрев")
+    parser.add_argument("--warmup", type=int, default=2, help="раундов прогрева")
+    parser.add_argument("--connections", type=int, default=2000, help="подключений за раунд")
+    parser.add_argument("--storm-size", type=int, default=300, help="клиентов в шторме переподключений")
+    parser.add_argument("--concurrency", type=int, default=200, help="одновременных подключений")
+    parser.add_argument("--sessions", type=int, default=20)
+    parser.add_argument("--pings", type=int, default=3, help="ping на обычное соединение")
+    parser.add_argument("--move-interval", type=float, default=0.2, help="пауза между волнами ходов, с")
+    parser.add_argument("--sample-interval", type=float, default=1.0)
+    parser.add_argument("--settle", type=float, default=30.0, help="сколько ждать освобождения соединений, с")
+    parser.add_argument("--fd-slack", type=int, default=16, help="допустимый рост числа дескрипторов")
+    parser.add_argument("--rss-tolerance", type=float, default=0.05, help="допустимый относительный рост RSS")
+    parser.add_argument("--rss-slack-mb", type=float, default=8.0, help="допустимый абсолютный рост RSS, МБ")
+    parser.add_argument("--plateau-ratio", type=float, default=0.5,
+                        help="рост за вторую половину раундов не меньше этой доли роста за первую — утечка")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="файл для JSON-результата (по умолчанию stdout)")
+    args = parser.parse_args()
+    if not 1 <= args.warmup < args.rounds:
+        parser.error("нужен хотя бы один раунд прогрева и один измеряемый")
+    raise_fd_limit()
+
+    uvicorn_args = ["--ws-ping-interval", str(WS_PING_INTERVAL), "--ws-ping-timeout", str(WS_PING_TIMEOUT)]
+    with LocalServer(uvicorn_args=uvicorn_args) as server:
+        result = asyncio.run(soak(server, args))
+
+    text = json.dumps(result, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text)
+    else:
+        print(text)
+    print("PASSED" if result["passed"] else "FAILED: " + "; ".join(result["failures"]), file=sys.stderr)
+    sys.exit(0 if result["passed"] else 1)
+
+
+if __name__ == "__main__":
+    main()
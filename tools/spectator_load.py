@@ -0,0 +1,137 @@
+"""Нагрузочный тест режима зрителя.
+
+Подключает N зрителей к /ws/spectate/{token} одной сессии, делает серию
+ходов и измеряет, за сколько каждый кадр доходит до всех зрителей.
+
+Запуск:
+    python -m tools.spectator_load --spectators 10000 --moves 20
+    python -m tools.spectator_load --url http://127.0.0.1:8000 --spectators 2000
+
+Без --url сервер поднимается локально. Результат — JSON в stdout.
+"""
+import argparse
+import asyncio
+import json
+import time
+from typing import Dict, List, Optional
+
+import httpx
+import websockets
+
+from tools.local_server import LocalServer, raise_fd_limit
+
+
+# Партия на доске A: (игрок, откуда, куда)
+OPENING = [
+    (1, "e2", "e4"), (4, "e7", "e5"), (1, "g1", "f3"), (4, "b8", "c6"),
+    (1, "f1", "c4"), (4, "g8", "f6"), (1, "d2", "d3"), (4, "f8", "c5"),
+    (1, "c2", "c3"), (4, "d7", "d6"), (1, "b1", "d2"), (4, "a7", "a6"),
+    (1, "a2", "a4"), (4, "h7", "h6"), (1, "h2", "h3"), (4, "c8", "e6"),
+    (1, "c4", "e6"), (4, "f7", "e6"), (1, "d1", "b3"), (4, "d8", "d7"),
+]
+
+
+def percentile(values: List[float], q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(q / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+class Spectator:
+    def __init__(self):
+        self.arrivals: Dict[int, float] = {}
+        self.ws = None
+
+    async def connect(self, url: str):
+        self.ws = await websockets.connect(url, max_size=None, ping_interval=None, open_timeout=60)
+        await self.ws.recv()
+
+    async def listen(self):
+        try:
+            async for message in self.ws:
+                if message == "pong":
+                    continue
+                version = json.loads(message)["state"]["version"]
+                self.arrivals[version] = time.perf_counter()
+        except websockets.ConnectionClosed:
+            pass
+
+
+async def run(base_url: str, ws_url: str, spectators: int, moves: int, batch: int, settle: float) -> Dict:
+    async with httpx.AsyncClient(base_url=base_url, timeout=60) as client:
+        start = (await client.post("/api/start")).json()
+        tokens = {p["playerId"]: p["token"] for p in start["players"]}
+        url = f"{ws_url}/ws/spectate/{start['spectatorToken']}"
+
+        viewers = [Spectator() for _ in range(spectators)]
+        connect_started = time.perf_counter()
+        failed = 0
+        for i in range(0, spectators, batch):
+            results = await asyncio.gather(*(v.connect(url) for v in viewers[i:i + batch]), return_exceptions=True)
+            failed += sum(1 for r in results if isinstance(r, Exception))
+        connect_seconds = time.perf_counter() - connect_started
+        connected = [v for v in viewers if v.ws is not None]
+        listeners = [asyncio.create_task(v.listen()) for v in connected]
+
+        sent_at: Dict[int, float] = {}
+        for player_id, src, dst in OPENING[:moves]:
+            t0 = time.perf_counter()
+            response = await client.post("/api/move", json={"token": tokens[player_id], "from": src, "to": dst})
+            response.raise_for_status()
+            sent_at[response.json()["version"]] = t0
+            await asyncio.sleep(0.05)
+
+        await asyncio.sleep(settle)
+        for v in connected:
+            await v.ws.close()
+        await asyncio.gather(*listeners, return_exceptions=True)
+
+    latencies = []
+    missing = 0
+    for v in connected:
+        for version, t0 in sent_at.items():
+            arrived: Optional[float] = v.arrivals.get(version)
+            if arrived is None:
+                missing += 1
+            else:
+                latencies.append((arrived - t0) * 1000)
+    return {
+        "spectators": spectators,
+        "connected": len(connected),
+        "connectFailures": failed,
+        "connectSeconds": connect_seconds,
+        "moves": len(sent_at),
+        "framesExpected": len(connected) * len(sent_at),
+        "framesMissing": missing,
+        "deliveryMs": {
+            "p50": percentile(latencies, 50),
+            "p95": percentile(latencies, 95),
+            "p99": percentile(latencies, 99),
+            "max": max(latencies) if latencies else 0.0,
+        },
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", help="адрес запущенного сервера (иначе поднимается локальный)")
+    parser.add_argument("--spectators", type=int, default=10000)
+    parser.add_argument("--moves", type=int, default=len(OPENING))
+    parser.add_argument("--batch", type=int, default=500, help="одновременных подключений при разгоне")
+    parser.add_argument("--settle", type=float, default=5.0, help="сколько ждать доставки после последнего хода, с")
+    args = parser.parse_args()
+    raise_fd_limit()
+
+    if args.url:
+        ws_url = args.url.replace("http://", "ws://").replace("https://", "wss://")
+        result = asyncio.run(run(args.url, ws_url, args.spectators, args.moves, args.batch, args.settle))
+    else:
+        with LocalServer() as server:
+            result = asyncio.run(run(server.base_url, server.ws_url, args.spectators, args.moves, args.batch, args.settle))
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    main()